@@ -79,12 +79,14 @@ def _prepare_config():
     return conf
 
 
-def create_polling_service(worker_id, conf=None, queue=None):
+def create_polling_service(worker_id, conf=None, queue=None,
+                           discovery_cache=None):
     if conf is None:
         conf = _prepare_config()
         conf.log_opt_values(LOG, log.DEBUG)
     return manager.AgentManager(worker_id, conf,
-                                conf.polling_namespaces, queue)
+                                conf.polling_namespaces, queue,
+                                discovery_cache)
 
 
 def create_heartbeat_service(worker_id, conf, queue=None):
@@ -106,5 +108,15 @@ def main():
         sm.add(create_heartbeat_service, args=(conf, queue))
     else:
         queue = None
-    sm.add(create_polling_service, args=(conf, queue))
+
+    if (conf.polling.workers > 1 and
+            conf.polling.enable_prometheus_exporter):
+        LOG.warning('The Prometheus exporter cannot be shared by several '
+                    'polling workers, starting a single worker.')
+        conf.set_override('workers', 1, group='polling')
+    discovery_cache = None
+    if conf.polling.workers > 1:
+        discovery_cache = multiprocessing.Manager().dict()
+    sm.add(create_polling_service, workers=conf.polling.workers,
+           args=(conf, queue, discovery_cache))
     sm.run()
@@ -13,10 +13,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
 import hashlib
 from lxml import etree
 import operator
 import threading
+import time
 
 import cachetools
 from novaclient import exceptions
@@ -69,6 +71,20 @@ OPTS = [
                      "memory, disk.device.capacity, disk.device.usage) for "
                      "stopped (SHUTOFF) instances. Only works with the "
                      "'libvirt_metadata' instance discovery method."),
+    cfg.BoolOpt('libvirt_events',
+                default=False,
+                help="Keep the instances discovered with the "
+                     "'libvirt_metadata' method in memory and only update "
+                     "the ones whose libvirt domain was defined, undefined, "
+                     "started, stopped or migrated, as reported by the "
+                     "libvirt domain lifecycle events, instead of getting "
+                     "all the domains on every polling cycle."),
+    cfg.IntOpt('libvirt_events_resync_interval',
+               default=600,
+               min=1,
+               help="Number of seconds after which all the domains are "
+                    "got again from libvirt when 'libvirt_events' is "
+                    "enabled, in case an event was missed."),
     cfg.BoolOpt('fetch_extra_metadata',
                 default=False,
                 help="Whether or not additional instance attributes that "
@@ -100,6 +116,9 @@ class NovaLikeServer:
     def __eq__(self, other):
         return self.id == other.id
 
+    def __hash__(self):
+        return hash(self.id)
+
 
 class InstanceDiscovery(plugin_base.DiscoveryBase):
     method = None
@@ -116,6 +135,13 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
             # 4096 resources on a compute should be enough :)
             self._flavor_id_cache = cachetools.LRUCache(4096)
             self._server_cache = cachetools.LRUCache(4096)
+            self._events_connection = None
+            self._events_lock = threading.Lock()
+            self._changed = set()
+            self._inventory_lock = threading.Lock()
+            self._inventory = {}
+            self._inventory_connection = None
+            self._last_resync = None
         else:
             self.lock = threading.Lock()
             self.instances = {}
@@ -130,6 +156,8 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
         """Discover resources to monitor."""
         if self.method != "libvirt_metadata":
             return self.discover_nova_polling(manager, param=None)
+        elif self.conf.compute.libvirt_events:
+            return self.discover_libvirt_events(manager, param=None)
         else:
             return self.discover_libvirt_polling(manager, param=None)
 
@@ -140,13 +168,9 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
             return int(elem.text)
         return 0
 
-    def _get_flavor_id(self, flavor_xml, instance_id):
-        flavor_name = flavor_xml.attrib["name"]
-        # Flavor ID is available in libvirt metadata from 2025.2 onwards.
-        flavor_id = flavor_xml.attrib.get("id")
-        if flavor_id:
-            return flavor_id
-        # If not found in libvirt metadata, fallback to API queries.
+    def _get_flavor_id(self, flavor_name, instance_id):
+        # Flavor ID is available in libvirt metadata from 2025.2 onwards,
+        # if not found in libvirt metadata, fallback to API queries.
         # If we already have the server metadata get the flavor ID from there.
         if self.conf.compute.fetch_extra_metadata:
             server = self.get_server(instance_id)
@@ -170,6 +194,73 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
         # API queries just for the extra specs.
         return None
 
+    def _parse_instance_metadata(self, xml_string):
+        # Parse the Nova metadata of a domain, which does not depend on the
+        # Nova API so that it can be cached until the metadata changes.
+        metadata_xml = etree.fromstring(xml_string)
+        flavor_xml = metadata_xml.find("./flavor")
+        flavor = {
+            "name": flavor_xml.attrib["name"],
+            "vcpus": self._safe_find_int(flavor_xml, "vcpus"),
+            "ram": self._safe_find_int(flavor_xml, "memory"),
+            "disk": self._safe_find_int(flavor_xml, "disk"),
+            "ephemeral": self._safe_find_int(flavor_xml, "ephemeral"),
+            "swap": self._safe_find_int(flavor_xml, "swap"),
+        }
+        extra_specs = self._get_flavor_extra_specs(flavor_xml)
+        if extra_specs is not None:
+            flavor["extra_specs"] = extra_specs
+
+        image_xml = metadata_xml.find("./root[@type='image']")
+        image = ({'id': image_xml.attrib['uuid']}
+                 if image_xml is not None else None)
+
+        image_meta_xml = metadata_xml.find("./image")
+        if image_meta_xml is not None:
+            # If the <image> element exists at all, Nova supports
+            # image_meta in libvirt metadata. Add it to the instance
+            # attributes even if all the required values are empty.
+            image_meta = {}
+            base_image_ref = image_meta_xml.attrib.get("uuid")
+            if base_image_ref is not None:
+                image_meta["base_image_ref"] = base_image_ref
+            # The following properties get special treatment
+            # because they are set as such in SM_INHERITABLE_KEYS,
+            # as defined in nova/utils.py.
+            container_format_xml = image_meta_xml.find(
+                "./containerFormat")
+            if container_format_xml is not None:
+                image_meta["container_format"] = (
+                    container_format_xml.text)
+            disk_format_xml = image_meta_xml.find("./diskFormat")
+            if disk_format_xml is not None:
+                image_meta["disk_format"] = disk_format_xml.text
+            min_disk_xml = image_meta_xml.find("./minDisk")
+            if min_disk_xml is not None:
+                image_meta["min_disk"] = min_disk_xml.text
+            min_ram_xml = image_meta_xml.find("./minRam")
+            if min_ram_xml is not None:
+                image_meta["min_ram"] = min_ram_xml.text
+            # Get additional properties defined in image_meta.
+            properties_xml = image_meta_xml.find("./properties")
+            if properties_xml is not None:
+                for prop in properties_xml.findall("./property"):
+                    image_meta[prop.attrib["name"]] = prop.text
+        else:
+            # None for "no image_meta found".
+            image_meta = None
+
+        return {
+            "user_id": metadata_xml.find("./owner/user").attrib["uuid"],
+            "project_id": metadata_xml.find(
+                "./owner/project").attrib["uuid"],
+            "name": metadata_xml.find("./name").text,
+            "flavor": flavor,
+            "flavor_id": flavor_xml.attrib.get("id"),
+            "image": image,
+            "image_meta": image_meta,
+        }
+
     @cachetools.cachedmethod(operator.attrgetter('_flavor_id_cache'))
     def get_flavor_id(self, name):
         LOG.debug("Querying metadata for flavor %s from Nova API", name)
@@ -192,138 +283,177 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
     def discover_libvirt_polling(self, manager, param=None):
         instances = []
         for domain in self.connection.listAllDomains():
-            instance_id = domain.UUIDString()
-            xml_string = libvirt_utils.instance_metadata(domain)
-            if xml_string is None:
-                continue
+            instance = self._get_instance(domain)
+            if instance is not None:
+                instances.append(instance)
+        return instances
 
-            full_xml = etree.fromstring(domain.XMLDesc())
-            os_type_xml = full_xml.find("./os/type")
-            metadata_xml = etree.fromstring(xml_string)
+    def _lifecycle_event(self, conn, domain, event, detail, opaque):
+        # Called from the libvirt event loop thread, the domain is only
+        # looked up again by the next discovery.
+        uuid = domain.UUIDString()
+        LOG.debug("Lifecycle event %s (%s) of domain %s", event, detail, uuid)
+        with self._events_lock:
+            self._changed.add(uuid)
+
+    def _watch_events(self):
+        # Register to the lifecycle events of the domains on a connection of
+        # its own, and tell whether it was (re)connected.
+        if (self._events_connection is not None and
+                self._events_connection.isAlive()):
+            return False
+        libvirt_utils.start_event_loop()
+        connection = libvirt_utils.new_libvirt_connection(self.conf)
+        connection.domainEventRegisterAny(
+            None, libvirt_utils.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+            self._lifecycle_event, None)
+        self._events_connection = connection
+        return True
+
+    def _update_instance(self, uuid):
+        try:
+            domain = self.connection.lookupByUUIDString(uuid)
+            instance = self._get_instance(domain)
+        except libvirt_utils.libvirt.libvirtError as e:
+            if (e.get_error_code() !=
+                    libvirt_utils.libvirt.VIR_ERR_NO_DOMAIN):
+                raise
+            # The domain was undefined
+            instance = None
+        if instance is None:
+            self._inventory.pop(uuid, None)
+        else:
+            self._inventory[uuid] = instance
 
+    @libvirt_utils.retry_on_disconnect
+    def discover_libvirt_events(self, manager, param=None):
+        with self._inventory_lock:
+            now = time.monotonic()
+            # NOTE: the events may have been missed while the connections
+            # were lost, so everything is got again once reconnected.
+            connection = self.connection
+            resync = (self._watch_events() or
+                      connection is not self._inventory_connection or
+                      self._last_resync is None or
+                      now - self._last_resync >=
+                      self.conf.compute.libvirt_events_resync_interval)
+            with self._events_lock:
+                changed, self._changed = self._changed, set()
+            if resync:
+                LOG.debug("Getting all the libvirt domains")
+                self._last_resync = None
+                self._inventory = {
+                    instance.id: instance for instance in
+                    self.discover_libvirt_polling(manager)}
+                self._inventory_connection = connection
+                self._last_resync = now
+                return list(self._inventory.values())
+
+            pending = set(changed)
             try:
-                flavor_xml = metadata_xml.find(
-                    "./flavor")
-                user_id = metadata_xml.find(
-                    "./owner/user").attrib["uuid"]
-                project_id = metadata_xml.find(
-                    "./owner/project").attrib["uuid"]
-                instance_name = metadata_xml.find(
-                    "./name").text
-                instance_arch = os_type_xml.attrib["arch"]
-
-                extra_specs = self._get_flavor_extra_specs(flavor_xml)
-
-                flavor = {
-                    "id": self._get_flavor_id(flavor_xml, instance_id),
-                    "name": flavor_xml.attrib["name"],
-                    "vcpus": self._safe_find_int(flavor_xml, "vcpus"),
-                    "ram": self._safe_find_int(flavor_xml, "memory"),
-                    "disk": self._safe_find_int(flavor_xml, "disk"),
-                    "ephemeral": self._safe_find_int(flavor_xml, "ephemeral"),
-                    "swap": self._safe_find_int(flavor_xml, "swap"),
-                }
-                if extra_specs is not None:
-                    flavor["extra_specs"] = extra_specs
-
-                image_xml = metadata_xml.find("./root[@type='image']")
-                image = ({'id': image_xml.attrib['uuid']}
-                         if image_xml is not None else None)
-
-                image_meta_xml = metadata_xml.find("./image")
-                if image_meta_xml is not None:
-                    # If the <image> element exists at all, Nova supports
-                    # image_meta in libvirt metadata. Add it to the instance
-                    # attributes even if all the required values are empty.
-                    image_meta = {}
-                    base_image_ref = image_meta_xml.attrib.get("uuid")
-                    if base_image_ref is not None:
-                        image_meta["base_image_ref"] = base_image_ref
-                    # The following properties get special treatment
-                    # because they are set as such in SM_INHERITABLE_KEYS,
-                    # as defined in nova/utils.py.
-                    container_format_xml = image_meta_xml.find(
-                        "./containerFormat")
-                    if container_format_xml is not None:
-                        image_meta["container_format"] = (
-                            container_format_xml.text)
-                    disk_format_xml = image_meta_xml.find("./diskFormat")
-                    if disk_format_xml is not None:
-                        image_meta["disk_format"] = disk_format_xml.text
-                    min_disk_xml = image_meta_xml.find("./minDisk")
-                    if min_disk_xml is not None:
-                        image_meta["min_disk"] = min_disk_xml.text
-                    min_ram_xml = image_meta_xml.find("./minRam")
-                    if min_ram_xml is not None:
-                        image_meta["min_ram"] = min_ram_xml.text
-                    # Get additional properties defined in image_meta.
-                    properties_xml = image_meta_xml.find("./properties")
-                    if properties_xml is not None:
-                        for prop in properties_xml.findall("./property"):
-                            image_meta[prop.attrib["name"]] = prop.text
-                else:
-                    # None for "no image_meta found".
-                    image_meta = None
-
-                # Getting the server metadata requires expensive Nova API
-                # queries, and may potentially contain sensitive user info,
-                # so it is only fetched when configured to do so.
-                if self.conf.compute.fetch_extra_metadata:
-                    server = self.get_server(instance_id)
-                    metadata = server.metadata if server is not None else {}
-                else:
-                    metadata = {}
-            except AttributeError:
-                LOG.error(
-                    "Fail to get domain uuid %s metadata: "
-                    "metadata was missing expected attributes",
-                    instance_id)
-                continue
-
-            dom_state = domain.state()[0]
-            vm_state = libvirt_utils.LIBVIRT_POWER_STATE.get(dom_state)
-            status = libvirt_utils.LIBVIRT_STATUS.get(dom_state)
-
-            # From:
-            # https://github.com/openstack/nova/blob/852f40fd0c6e9d8878212ff3120556668023f1c4/nova/api/openstack/compute/views/servers.py#L214-L220
-            host_id = hashlib.sha224(
-                (project_id + self.conf.host).encode('utf-8')).hexdigest()
-
-            instance_data = {
-                "id": instance_id,
-                "name": instance_name,
-                "flavor": flavor,
-                "image": image,
-                "os_type": os_type_xml.text,
-                "architecture": instance_arch,
-
-                "OS-EXT-SRV-ATTR:instance_name": domain.name(),
-                "OS-EXT-SRV-ATTR:host": self.conf.host,
-                "OS-EXT-STS:vm_state": vm_state,
-
-                "tenant_id": project_id,
-                "user_id": user_id,
-
-                "hostId": host_id,
-                "status": status,
-
-                # NOTE(sileht): Other fields that Ceilometer tracks
-                # where we can't get the value here, but their are
-                # retrieved by notification
-                "metadata": metadata,
-                # "OS-EXT-STS:task_state"
-                # 'reservation_id',
-                # 'OS-EXT-AZ:availability_zone',
-                # 'kernel_id',
-                # 'ramdisk_id',
-                # some image detail
-            }
-            if image_meta is not None:
-                instance_data["image_meta"] = image_meta
-
-            LOG.debug("instance data: %s", instance_data)
-            instances.append(NovaLikeServer(**instance_data))
-        return instances
+                for uuid in changed:
+                    try:
+                        self._update_instance(uuid)
+                    except libvirt_utils.libvirt.libvirtError as e:
+                        if libvirt_utils.is_disconnection_exception(e):
+                            raise
+                        LOG.warning("Failed to update the libvirt domain "
+                                    "%(uuid)s, it is looked up again by the "
+                                    "next discovery: %(e)s",
+                                    {'uuid': uuid, 'e': e})
+                        continue
+                    pending.discard(uuid)
+            finally:
+                # Looked up again by the next discovery
+                if pending:
+                    with self._events_lock:
+                        self._changed |= pending
+            return list(self._inventory.values())
+
+    def _get_instance(self, domain):
+        instance_id = domain.UUIDString()
+        xml_string = libvirt_utils.instance_metadata(domain)
+        if xml_string is None:
+            return None
+
+        description = libvirt_utils.domain_description(
+            instance_id, domain.XMLDesc())
+
+        try:
+            parsed = libvirt_utils.PARSED_XML_CACHE.get(
+                instance_id, 'metadata', xml_string,
+                self._parse_instance_metadata)
+            if description.os_type is None:
+                raise AttributeError('os type')
+            user_id = parsed['user_id']
+            project_id = parsed['project_id']
+            instance_name = parsed['name']
+            image = copy.deepcopy(parsed['image'])
+            image_meta = copy.deepcopy(parsed['image_meta'])
+
+            flavor = copy.deepcopy(parsed['flavor'])
+            flavor["id"] = (parsed['flavor_id'] or
+                            self._get_flavor_id(flavor["name"],
+                                                instance_id))
+
+            # Getting the server metadata requires expensive Nova API
+            # queries, and may potentially contain sensitive user info,
+            # so it is only fetched when configured to do so.
+            if self.conf.compute.fetch_extra_metadata:
+                server = self.get_server(instance_id)
+                metadata = server.metadata if server is not None else {}
+            else:
+                metadata = {}
+        except AttributeError:
+            LOG.error(
+                "Fail to get domain uuid %s metadata: "
+                "metadata was missing expected attributes",
+                instance_id)
+            return None
+
+        dom_state = domain.state()[0]
+        vm_state = libvirt_utils.LIBVIRT_POWER_STATE.get(dom_state)
+        status = libvirt_utils.LIBVIRT_STATUS.get(dom_state)
+
+        # From:
+        # https://github.com/openstack/nova/blob/852f40fd0c6e9d8878212ff3120556668023f1c4/nova/api/openstack/compute/views/servers.py#L214-L220
+        host_id = hashlib.sha224(
+            (project_id + self.conf.host).encode('utf-8')).hexdigest()
+
+        instance_data = {
+            "id": instance_id,
+            "name": instance_name,
+            "flavor": flavor,
+            "image": image,
+            "os_type": description.os_type,
+            "architecture": description.arch,
+
+            "OS-EXT-SRV-ATTR:instance_name": domain.name(),
+            "OS-EXT-SRV-ATTR:host": self.conf.host,
+            "OS-EXT-STS:vm_state": vm_state,
+
+            "tenant_id": project_id,
+            "user_id": user_id,
+
+            "hostId": host_id,
+            "status": status,
+
+            # NOTE(sileht): Other fields that Ceilometer tracks
+            # where we can't get the value here, but their are
+            # retrieved by notification
+            "metadata": metadata,
+            # "OS-EXT-STS:task_state"
+            # 'reservation_id',
+            # 'OS-EXT-AZ:availability_zone',
+            # 'kernel_id',
+            # 'ramdisk_id',
+            # some image detail
+        }
+        if image_meta is not None:
+            instance_data["image_meta"] = image_meta
+
+        LOG.debug("instance data: %s", instance_data)
+        return NovaLikeServer(**instance_data)
 
     def discover_nova_polling(self, manager, param=None):
         secs_from_last_update = 0
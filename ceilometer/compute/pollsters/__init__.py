@@ -13,6 +13,7 @@
 # under the License.
 
 import collections
+from concurrent import futures
 from time import monotonic as now
 
 from oslo_log import log
@@ -68,6 +69,9 @@ class GenericComputePollster(plugin_base.PollsterBase):
     def default_discovery(self):
         return 'local_instances'
 
+    def flush(self):
+        self.inspector.flush()
+
     def _record_poll_time(self):
         """Method records current time as the poll time.
 
@@ -90,20 +94,36 @@ class GenericComputePollster(plugin_base.PollsterBase):
         return instance.id
 
     def _inspect_cached(self, cache, instance, duration):
-        cache.setdefault(self.inspector_method, {})
-        if instance.id not in cache[self.inspector_method]:
+        # NOTE: the pollsters of a polling task may run in several threads,
+        # the first one to inspect an instance stores a future the others
+        # wait for, so the inspector is called once per instance and cycle.
+        # dict.setdefault is atomic, no lock is needed.
+        method_cache = cache.setdefault(self.inspector_method, {})
+        future = futures.Future()
+        cached = method_cache.setdefault(instance.id, future)
+        if cached is not future:
+            return cached.result()
+
+        try:
+            self.inspector.prepare_cycle(cache)
             result = getattr(self.inspector, self.inspector_method)(
                 instance, duration)
-            polled_time = now()
+            polled_time = (self.inspector.get_polled_time(instance, cache) or
+                           now())
             # Ensure we don't cache an iterator
             if isinstance(result, collections.abc.Iterable):
                 result = list(result)
             else:
                 result = [result]
-            cache[self.inspector_method][instance.id] = (polled_time, result)
-        return cache[self.inspector_method][instance.id]
-
-    def _stats_to_sample(self, instance, stats, polled_time):
+        except BaseException as e:
+            # Let the next pollsters inspect the instance again
+            del method_cache[instance.id]
+            future.set_exception(e)
+            raise
+        future.set_result((polled_time, result))
+        return polled_time, result
+
+    def _stats_to_sample(self, instance, stats, polled_time, cache=None):
         volume = getattr(stats, self.sample_stats_key)
         LOG.debug(
             "%(instance_id)s/%(name)s volume: %(volume)s",
@@ -125,6 +145,7 @@ class GenericComputePollster(plugin_base.PollsterBase):
             additional_metadata=self.get_additional_metadata(
                 instance, stats),
             monotonic_time=polled_time,
+            cache=cache,
         )
 
     def get_samples(self, manager, cache, resources):
@@ -136,7 +157,8 @@ class GenericComputePollster(plugin_base.PollsterBase):
                 if not result:
                     continue
                 for stats in self.aggregate_method(result):
-                    yield self._stats_to_sample(instance, stats, polled_time)
+                    yield self._stats_to_sample(instance, stats, polled_time,
+                                                cache)
             except NoVolumeException:
                 # FIXME(sileht): This should be a removed... but I will
                 # not change the test logic for now
@@ -208,4 +230,5 @@ class InstanceMetadataPollster(plugin_base.PollsterBase):
                 volume=self.get_volume(instance),
                 additional_metadata=self.get_additional_metadata(instance),
                 monotonic_time=now(),
+                cache=cache,
             )
@@ -77,12 +77,27 @@ def _get_metadata_from_object(conf, instance):
                                              metadata)
 
 
+def _get_cached_metadata(conf, instance, cache):
+    """Return a new metadata dict for the instance.
+
+    The metadata is computed once per instance and cache, which is the cache
+    of the polling cycle, and each sample gets a shallow copy of it.
+    """
+    if cache is None:
+        return _get_metadata_from_object(conf, instance)
+    metadata_cache = cache.setdefault('resource_metadata', {})
+    metadata = metadata_cache.get(instance.id)
+    if metadata is None:
+        metadata = metadata_cache.setdefault(
+            instance.id, _get_metadata_from_object(conf, instance))
+    return dict(metadata)
+
+
 def make_sample_from_instance(conf, instance, name, type, unit, volume,
                               resource_id=None, additional_metadata=None,
-                              monotonic_time=None):
-    additional_metadata = additional_metadata or {}
-    resource_metadata = _get_metadata_from_object(conf, instance)
-    resource_metadata.update(additional_metadata)
+                              monotonic_time=None, cache=None):
+    resource_metadata = _get_cached_metadata(conf, instance, cache)
+    resource_metadata.update(additional_metadata or {})
     return sample.Sample(
         name=name,
         type=type,
@@ -167,6 +167,32 @@ class Inspector:
     def __init__(self, conf):
         self.conf = conf
 
+    def flush(self):
+        """Save the state the inspector keeps across polling cycles."""
+
+    def prepare_cycle(self, cache):
+        """Prepare the inspections of a polling cycle.
+
+        The pollsters call it with the cache of the polling cycle before
+        each inspection, from the thread running the inspection, so that
+        the inspector can share data such as bulk statistics between the
+        inspections of the cycle. The inspection methods keep their
+        signature.
+
+        :param cache: cache of the polling cycle
+        """
+
+    def get_polled_time(self, instance, cache):
+        """Return when the statistics of an instance were taken in a cycle.
+
+        :param instance: the target instance
+        :param cache: cache of the polling cycle
+        :return: the monotonic time at which the statistics of the instance
+                 inspected in the polling cycle were taken, None when they
+                 are taken by the inspection itself
+        """
+        return None
+
     def inspect_instance(self, instance, duration):
         """Inspect the CPU statistics for an instance.
 
@@ -14,7 +14,9 @@
 # under the License.
 """Implementation of Inspector abstraction for libvirt."""
 
-from lxml import etree
+import threading
+import time
+
 from oslo_log import log as logging
 from oslo_utils import units
 
@@ -30,6 +32,34 @@ from ceilometer.i18n import _
 
 LOG = logging.getLogger(__name__)
 
+# We don't use the libvirt constants in case of libvirt is not available
+VIR_DOMAIN_STATS_STATE = 1
+VIR_DOMAIN_STATS_CPU_TOTAL = 2
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_DOMAIN_STATS_INTERFACE = 16
+VIR_DOMAIN_STATS_BLOCK = 32
+VIR_DOMAIN_STATS_PERF = 64
+
+# NOTE: the groups not supported by libvirt are ignored, as the
+# VIR_CONNECT_GET_ALL_DOMAINS_STATS_ENFORCE_STATS flag is not set.
+BULK_STATS = (VIR_DOMAIN_STATS_STATE | VIR_DOMAIN_STATS_CPU_TOTAL |
+              VIR_DOMAIN_STATS_BALLOON | VIR_DOMAIN_STATS_VCPU |
+              VIR_DOMAIN_STATS_INTERFACE | VIR_DOMAIN_STATS_BLOCK |
+              VIR_DOMAIN_STATS_PERF)
+
+# Key of the bulk statistics in the cache of a polling cycle
+BULK_STATS_CACHE = 'libvirt_bulk_stats'
+
+# Fields of the net group in the order of virDomainInterfaceStats
+INTERFACE_STATS = ('rx.bytes', 'rx.pkts', 'rx.errs', 'rx.drop',
+                   'tx.bytes', 'tx.pkts', 'tx.errs', 'tx.drop')
+
+# Keys of virDomainMemoryStats and their balloon group fields
+MEMORY_STATS = {'actual': 'current', 'available': 'available',
+                'usable': 'usable', 'unused': 'unused', 'rss': 'rss',
+                'swap_in': 'swap_in', 'swap_out': 'swap_out'}
+
 
 class LibvirtInspector(virt_inspector.Inspector):
 
@@ -37,12 +67,23 @@ class LibvirtInspector(virt_inspector.Inspector):
         super().__init__(conf)
         # NOTE(sileht): create a connection on startup
         self.connection
-        self.cache = {}
+        self.counters = libvirt_utils.CounterStore(
+            16384, conf.libvirt_counters_max_age,
+            conf.libvirt_counters_file)
+        self._bulk_lock = threading.Lock()
+        # Cache of the polling cycle of the inspections of each thread
+        self._cycle = threading.local()
 
     @property
     def connection(self):
         return libvirt_utils.refresh_libvirt_connection(self.conf, self)
 
+    def flush(self):
+        self.counters.save()
+
+    def prepare_cycle(self, cache):
+        self._cycle.cache = cache
+
     def _lookup_by_uuid(self, instance):
         instance_name = util.instance_name(instance)
         try:
@@ -61,81 +102,131 @@ class LibvirtInspector(virt_inspector.Inspector):
         except Exception as ex:
             raise virt_inspector.InspectorException(str(ex))
 
+    @staticmethod
+    def _check_shutoff(instance, state):
+        if state == libvirt.VIR_DOMAIN_SHUTOFF:
+            msg = _('Failed to inspect data of instance '
+                    '<name=%(name)s, id=%(id)s>, '
+                    'domain state is SHUTOFF.') % {
+                'name': util.instance_name(instance), 'id': instance.id}
+            raise virt_inspector.InstanceShutOffException(msg)
+
     def _get_domain(self, instance, raise_if_shutoff):
-        instance_name = util.instance_name(instance)
         domain = self._lookup_by_uuid(instance)
 
         if raise_if_shutoff:
-            state = domain.info()[0]
-            if state == libvirt.VIR_DOMAIN_SHUTOFF:
-                msg = _('Failed to inspect data of instance '
-                        '<name=%(name)s, id=%(id)s>, '
-                        'domain state is SHUTOFF.') % {
-                    'name': instance_name, 'id': instance.id}
-                raise virt_inspector.InstanceShutOffException(msg)
+            self._check_shutoff(instance, domain.info()[0])
 
         return domain
 
-    @libvirt_utils.retry_on_disconnect
-    def inspect_vnics(self, instance, duration):
-        domain = self._get_domain(instance, True)
-
-        tree = etree.fromstring(domain.XMLDesc(0))
-        for iface in tree.findall('devices/interface'):
-            target = iface.find('target')
-            if target is not None:
-                name = target.get('dev')
-            else:
-                continue
-            mac = iface.find('mac')
-            if mac is not None:
-                mac_address = mac.get('address')
-            else:
-                continue
-            fref = iface.find('filterref')
-            if fref is not None:
-                fref = fref.get('filter')
-
-            params = {p.get('name').lower(): p.get('value')
-                      for p in iface.findall('filterref/parameter')}
-
-            # Extract interface ID
-            try:
-                interfaceid = iface.find('virtualport').find(
-                    'parameters').get('interfaceid')
-            except AttributeError:
-                interfaceid = None
-
-            # Extract source bridge
+    def _get_snapshot(self):
+        """Return the time and the bulk statistics of a polling cycle.
+
+        The statistics of all the domains are requested at once by the first
+        inspection of the polling cycle and kept in its cache, or requested
+        for each inspection when there is no cache.
+        """
+        cache = getattr(self._cycle, 'cache', None)
+        if cache is not None:
+            snapshot = cache.get(BULK_STATS_CACHE)
+            if snapshot is not None:
+                return snapshot
+        with self._bulk_lock:
+            if cache is not None and BULK_STATS_CACHE in cache:
+                return cache[BULK_STATS_CACHE]
+            polled_time = time.monotonic()
             try:
-                bridge = iface.find('source').get('bridge')
-            except AttributeError:
-                bridge = None
-
-            params['interfaceid'] = interfaceid
-            params['bridge'] = bridge
-
-            try:
-                dom_stats = domain.interfaceStats(name)
-            except libvirt.libvirtError as ex:
-                LOG.warning("Error from libvirt when running instanceStats, "
-                            "This may not be harmful, but please check : "
-                            "%(ex)s",
-                            {'ex': ex})
-                continue
+                records = self.connection.getAllDomainStats(BULK_STATS, 0)
+            except (AttributeError, libvirt.libvirtError) as ex:
+                if libvirt_utils.is_disconnection_exception(ex):
+                    raise
+                LOG.warning("Failed to get the statistics of all the "
+                            "domains, falling back to requests per domain: "
+                            "%(ex)s", {'ex': ex})
+                records = []
+            snapshot = (polled_time,
+                        {domain.UUIDString(): (domain, stats)
+                         for domain, stats in records})
+            if cache is not None:
+                cache[BULK_STATS_CACHE] = snapshot
+            return snapshot
+
+    def _get_bulk_stats(self, instance):
+        """Return the domain of the instance and its bulk statistics.
+
+        None is returned when not in bulk mode or when the domain is not in
+        the statistics, for example when it has been created since they were
+        requested.
+        """
+        if self.conf.libvirt_stats_mode != 'bulk':
+            return None
+        return self._get_snapshot()[1].get(instance.id)
+
+    def get_polled_time(self, instance, cache):
+        if (cache is not None and BULK_STATS_CACHE in cache and
+                instance.id in cache[BULK_STATS_CACHE][1]):
+            return cache[BULK_STATS_CACHE][0]
+        return None
 
-            # Retrieve previous values
-            prev = self.cache.get(name)
+    @staticmethod
+    def _bulk_devices(stats, group):
+        """Return the bulk statistics of the devices of a group by name."""
+        devices = {}
+        for i in range(stats.get(f'{group}.count', 0)):
+            prefix = f'{group}.{i}.'
+            name = stats.get(prefix + 'name')
+            if name is not None:
+                devices[name] = {key[len(prefix):]: value
+                                 for key, value in stats.items()
+                                 if key.startswith(prefix)}
+        return devices
+
+    def _vnic_stats(self, instance):
+        # Yield the name, mac, filter, parameters and statistics of the vNICs
+        bulk = self._get_bulk_stats(instance)
+        if bulk is None:
+            domain = self._get_domain(instance, True)
+            interfaces = None
+        else:
+            domain, stats = bulk
+            self._check_shutoff(instance, stats.get('state.state'))
+            interfaces = self._bulk_devices(stats, 'net')
+
+        description = libvirt_utils.domain_description(
+            instance.id, domain.XMLDesc(0))
+        for name, mac_address, fref, params in description.interfaces:
+            if interfaces is not None:
+                if name not in interfaces:
+                    LOG.debug('No statistics of interface %s / %s',
+                              instance.id, name)
+                    continue
+                dom_stats = tuple(interfaces[name].get(field, 0)
+                                  for field in INTERFACE_STATS)
+            else:
+                try:
+                    dom_stats = domain.interfaceStats(name)
+                except libvirt.libvirtError as ex:
+                    LOG.warning("Error from libvirt when running "
+                                "instanceStats, This may not be harmful, "
+                                "but please check : %(ex)s", {'ex': ex})
+                    continue
+            yield name, mac_address, fref, dict(params), dom_stats
 
-            # Store values for next call
-            self.cache[name] = dom_stats
+    @libvirt_utils.retry_on_disconnect
+    def inspect_vnics(self, instance, duration):
+        for name, mac_address, fref, params, dom_stats in self._vnic_stats(
+                instance):
+            # Retrieve previous values and store values for next call
+            prev = self.counters.swap(('delta', instance.id, name),
+                                      mac_address, dom_stats)
 
             if prev:
                 # Compute stats
+                prev = prev[0]
                 rx_delta = dom_stats[0] - prev[0]
                 tx_delta = dom_stats[4] - prev[4]
 
-                # Avoid negative values
+                # Avoid negative values, the counters were reset
                 if rx_delta < 0:
                     rx_delta = dom_stats[0]
                 if tx_delta < 0:
@@ -161,15 +252,60 @@ class LibvirtInspector(virt_inspector.Inspector):
                                                 tx_drop=dom_stats[7],
                                                 tx_bytes_delta=tx_delta)
 
+    @libvirt_utils.retry_on_disconnect
+    def inspect_vnic_rates(self, instance, duration):
+        for name, mac_address, fref, params, dom_stats in self._vnic_stats(
+                instance):
+            prev = self.counters.swap(('rate', instance.id, name),
+                                      mac_address, dom_stats)
+            if not prev or not prev[1]:
+                LOG.debug('No rate meter predecessor for %s / %s',
+                          instance.id, name)
+                continue
+            prev, elapsed = prev
+            rx_delta = dom_stats[0] - prev[0]
+            tx_delta = dom_stats[4] - prev[4]
+            if rx_delta < 0 or tx_delta < 0:
+                LOG.debug('Counters of %s / %s were reset',
+                          instance.id, name)
+                continue
+            yield virt_inspector.InterfaceRateStats(
+                name=name,
+                mac=mac_address,
+                fref=fref,
+                parameters=params,
+                rx_bytes_rate=rx_delta / elapsed,
+                tx_bytes_rate=tx_delta / elapsed)
+
     @staticmethod
     def _get_disk_devices(domain):
-        tree = etree.fromstring(domain.XMLDesc(0))
-        return filter(bool, [target.get("dev") for target in
-                             tree.findall('devices/disk/target')
-                             if target.getparent().find('source') is not None])
+        return libvirt_utils.domain_description(
+            domain.UUIDString(), domain.XMLDesc(0)).disks
 
     @libvirt_utils.retry_on_disconnect
     def inspect_disks(self, instance, duration):
+        bulk = self._get_bulk_stats(instance)
+        if bulk is not None:
+            domain, stats = bulk
+            self._check_shutoff(instance, stats.get('state.state'))
+            for device, block in self._bulk_devices(stats, 'block').items():
+                # NOTE: like _get_disk_devices, skip the disks without
+                # source, such as empty cdrom drives.
+                if 'path' not in block:
+                    continue
+                # NOTE: like virDomainBlockStats, the error count is -1 when
+                # the hypervisor does not report it, as qemu does.
+                yield virt_inspector.DiskStats(
+                    device=device,
+                    read_requests=block.get('rd.reqs', 0),
+                    read_bytes=block.get('rd.bytes', 0),
+                    write_requests=block.get('wr.reqs', 0),
+                    write_bytes=block.get('wr.bytes', 0),
+                    errors=block.get('errors', -1),
+                    wr_total_times=block.get('wr.times', 0),
+                    rd_total_times=block.get('rd.times', 0))
+            return
+
         domain = self._get_domain(instance, True)
         for device in self._get_disk_devices(domain):
             try:
@@ -192,6 +328,22 @@ class LibvirtInspector(virt_inspector.Inspector):
 
     @libvirt_utils.retry_on_disconnect
     def inspect_disk_info(self, instance, duration):
+        bulk = self._get_bulk_stats(instance)
+        if bulk is not None:
+            domain, stats = bulk
+            if not self.conf.compute.report_stopped_instance_metrics:
+                self._check_shutoff(instance, stats.get('state.state'))
+            for device, block in self._bulk_devices(stats, 'block').items():
+                if 'path' not in block:
+                    continue
+                physical = block.get('physical', 0)
+                yield virt_inspector.DiskInfo(
+                    device=device,
+                    capacity=max(block.get('capacity', 0), physical),
+                    allocation=block.get('allocation', 0),
+                    physical=physical)
+            return
+
         domain = self._get_domain(
             instance, not self.conf.compute.report_stopped_instance_metrics)
         for device in self._get_disk_devices(domain):
@@ -208,6 +360,10 @@ class LibvirtInspector(virt_inspector.Inspector):
     @libvirt_utils.raise_nodata_if_unsupported
     @libvirt_utils.retry_on_disconnect
     def inspect_instance(self, instance, duration=None):
+        bulk = self._get_bulk_stats(instance)
+        if bulk is not None:
+            return self._bulk_instance_stats(instance, bulk[1])
+
         domain = self._get_domain(
             instance, not self.conf.compute.report_stopped_instance_metrics)
 
@@ -221,11 +377,37 @@ class LibvirtInspector(virt_inspector.Inspector):
                     memory_actual=dom_info[1] / units.Ki,
                 )
 
+        # TODO(sileht): stats also have the disk/vnic info
+        # we could use that instead of the old method for Queen
+        stats = self.connection.domainListGetStats([domain], 0)[0][1]
+        return self._instance_stats(domain.info()[0], domain.memoryStats(),
+                                    stats)
+
+    def _bulk_instance_stats(self, instance, stats):
+        state = stats.get('state.state')
+        if self.conf.compute.report_stopped_instance_metrics:
+            if state == libvirt.VIR_DOMAIN_SHUTOFF:
+                maximum = stats.get('balloon.maximum')
+                return virt_inspector.InstanceStats(
+                    power_state=state,
+                    cpu_number=stats.get('vcpu.current'),
+                    memory_actual=(maximum / units.Ki
+                                   if maximum is not None else None),
+                )
+        else:
+            self._check_shutoff(instance, state)
+
+        memory_stats = {key: stats['balloon.' + field]
+                        for key, field in MEMORY_STATS.items()
+                        if 'balloon.' + field in stats}
+        return self._instance_stats(state, memory_stats, stats)
+
+    @staticmethod
+    def _instance_stats(state, memory_stats, stats):
         memory_actual = None
         memory_available = None
         memory_used = memory_resident = None
         memory_swap_in = memory_swap_out = None
-        memory_stats = domain.memoryStats()
         # Stat provided from libvirt is in KiB, converting it to MiB.
         if 'actual' in memory_stats:
             memory_actual = memory_stats['actual'] / units.Ki
@@ -243,9 +425,6 @@ class LibvirtInspector(virt_inspector.Inspector):
             memory_swap_in = memory_stats['swap_in'] / units.Ki
             memory_swap_out = memory_stats['swap_out'] / units.Ki
 
-        # TODO(sileht): stats also have the disk/vnic info
-        # we could use that instead of the old method for Queen
-        stats = self.connection.domainListGetStats([domain], 0)[0][1]
         cpu_time = 0
         current_cpus = stats.get('vcpu.current')
         # Iterate over the maximum number of CPUs here, and count the
@@ -268,7 +447,7 @@ class LibvirtInspector(virt_inspector.Inspector):
             cpu_time = stats.get('cpu.time')
 
         return virt_inspector.InstanceStats(
-            power_state=domain.info()[0],
+            power_state=state,
             cpu_number=stats.get('vcpu.current'),
             cpu_time=cpu_time,
             memory_actual=memory_actual,
@@ -14,8 +14,16 @@
 # under the License.
 
 import errno
+import hashlib
+import os
+import threading
+import time
+
+import cachetools
+from lxml import etree
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 import tenacity
 
 try:
@@ -37,6 +45,33 @@ OPTS = [
                default='',
                help='Override the default libvirt URI '
                     '(which is dependent on libvirt_type).'),
+    cfg.StrOpt('libvirt_stats_mode',
+               default='domain',
+               choices=[('domain', 'Request the statistics of each domain '
+                                   'and device on its own.'),
+                        ('bulk', 'Request the statistics of all the '
+                                 'domains at once with getAllDomainStats, '
+                                 'once per polling cycle, '
+                                 'falling back to the requests per domain '
+                                 'for the domains it does not report.')],
+               help='How the statistics of the domains are requested from '
+                    'libvirt.'),
+    cfg.StrOpt('libvirt_counters_file',
+               help='File the last values of the counters of the vNICs of '
+                    'the domains are saved to after each polling cycle and '
+                    'when the agent stops, so that their delta and rate '
+                    'samples go on from them when the agent restarts. They '
+                    'are only kept in memory when not set.'),
+    cfg.IntOpt('libvirt_counters_max_age',
+               default=0,
+               min=0,
+               help='Number of seconds after which the last values of the '
+                    'counters of a vNIC are no longer used to compute its '
+                    'delta and rate samples, and are removed after the next '
+                    'polling cycle. It should be greater than the polling '
+                    'interval of these meters. The value zero (0) means no '
+                    'limit, the values of the vNICs being only removed once '
+                    'the values of 16384 other vNICs are kept.'),
 ]
 
 LIBVIRT_PER_TYPE_URIS = dict(
@@ -54,6 +89,8 @@ VIR_DOMAIN_SHUTOFF = 5
 VIR_DOMAIN_CRASHED = 6
 VIR_DOMAIN_PMSUSPENDED = 7
 
+VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
+
 # Stolen from nova
 LIBVIRT_POWER_STATE = {
     VIR_DOMAIN_NOSTATE: 'pending',
@@ -88,6 +125,178 @@ NOVA_METADATA_VERSIONS = (
 )
 
 
+class DomainDescription:
+    """Devices and operating system of a domain, from its XML."""
+
+    def __init__(self, xml_string):
+        tree = etree.fromstring(xml_string)
+        os_type = tree.find('./os/type')
+        self.os_type = os_type.text if os_type is not None else None
+        self.arch = os_type.get('arch') if os_type is not None else None
+
+        # (name, mac, filter, parameters) of the interfaces
+        self.interfaces = []
+        for iface in tree.findall('devices/interface'):
+            target = iface.find('target')
+            mac = iface.find('mac')
+            if target is None or mac is None:
+                continue
+            fref = iface.find('filterref')
+            if fref is not None:
+                fref = fref.get('filter')
+
+            params = {p.get('name').lower(): p.get('value')
+                      for p in iface.findall('filterref/parameter')}
+
+            # Extract interface ID
+            try:
+                interfaceid = iface.find('virtualport').find(
+                    'parameters').get('interfaceid')
+            except AttributeError:
+                interfaceid = None
+
+            # Extract source bridge
+            try:
+                bridge = iface.find('source').get('bridge')
+            except AttributeError:
+                bridge = None
+
+            params['interfaceid'] = interfaceid
+            params['bridge'] = bridge
+            self.interfaces.append((target.get('dev'), mac.get('address'),
+                                    fref, params))
+
+        # Target devices of the disks with a source
+        self.disks = [target.get('dev') for target in
+                      tree.findall('devices/disk/target')
+                      if target.get('dev') and
+                      target.getparent().find('source') is not None]
+
+
+class ParsedXMLCache:
+    """Cache of the parsed XML documents of the domains.
+
+    The documents are cached by domain UUID and kind of document along with
+    a digest of their string, so an unchanged document is parsed once for
+    the lifetime of its domain, while a changed one is parsed again.
+    """
+
+    def __init__(self, size=4096):
+        self._lock = threading.Lock()
+        self._cache = cachetools.LRUCache(size)
+
+    def get(self, uuid, kind, xml_string, parse):
+        """Return the parsed document, calling parse when needed."""
+        digest = hashlib.sha256(xml_string.encode()).digest()
+        with self._lock:
+            entry = self._cache.get((uuid, kind))
+        if entry is not None and entry[0] == digest:
+            return entry[1]
+        parsed = parse(xml_string)
+        with self._lock:
+            self._cache[(uuid, kind)] = (digest, parsed)
+        return parsed
+
+
+# NOTE: shared by the instance discovery and the inspector of the agent.
+PARSED_XML_CACHE = ParsedXMLCache()
+
+
+def domain_description(uuid, xml_string):
+    """Return the DomainDescription of the XML of a domain."""
+    return PARSED_XML_CACHE.get(uuid, 'domain', xml_string,
+                                DomainDescription)
+
+
+class CounterStore:
+    """Last values of the counters of the devices of the domains.
+
+    The values are kept by kind of consumer, domain UUID and device, along
+    with a tag identifying the device, such as its MAC address, so that
+    the values of a device replaced by another one of the same name are not
+    used. The least recently used values are evicted once the store is full
+    and the values older than max_age are not returned, and removed by save.
+
+    :param size: number of devices whose values are kept.
+    :param max_age: number of seconds the values are returned for, 0 meaning
+                    no limit.
+    :param path: file the values are loaded from and saved to by save.
+    """
+
+    def __init__(self, size, max_age, path=None):
+        self.max_age = max_age
+        self.path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._values = cachetools.LRUCache(size)
+        self._changed = False
+        if path:
+            self._load()
+
+    def swap(self, key, tag, values):
+        """Store the values of a device and return its previous ones.
+
+        :param key: (kind, domain UUID, device) of the values.
+        :return: the previous values and the number of seconds elapsed
+                 since they were stored, or None when unknown.
+        """
+        now = time.time()
+        with self._lock:
+            previous = self._values.get(key)
+            self._values[key] = (now, tag, tuple(values))
+            self._changed = True
+        if previous is None:
+            return None
+        timestamp, previous_tag, previous_values = previous
+        elapsed = now - timestamp
+        if (previous_tag != tag or elapsed < 0 or self._expired(elapsed) or
+                len(previous_values) != len(values)):
+            return None
+        return previous_values, elapsed
+
+    def _expired(self, age):
+        return bool(self.max_age) and age > self.max_age
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                entries = jsonutils.load(f)
+            for key, timestamp, tag, values in entries:
+                self._values[tuple(key)] = (timestamp, tag, tuple(values))
+        except FileNotFoundError:
+            pass
+        except (OSError, TypeError, ValueError) as e:
+            LOG.warning('Failed to load the counters from %s: %s',
+                        self.path, e)
+
+    def save(self):
+        """Remove the values which are too old and save the others.
+
+        Nothing is saved when there is no file or the values did not change
+        since the last save.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (timestamp, tag, values)
+                        in self._values.items()
+                        if self._expired(now - timestamp)]:
+                del self._values[key]
+            if not self.path or not self._changed:
+                return
+            self._changed = False
+            entries = [(key, timestamp, tag, values) for key, (
+                timestamp, tag, values) in self._values.items()]
+        tmp_path = self.path + '.tmp'
+        with self._save_lock:
+            try:
+                with open(tmp_path, 'w') as f:
+                    jsonutils.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                LOG.warning('Failed to save the counters to %s: %s',
+                            self.path, e)
+
+
 def new_libvirt_connection(conf):
     if not libvirt:
         raise ImportError("python-libvirt module is missing")
@@ -97,6 +306,37 @@ def new_libvirt_connection(conf):
     return libvirt.openReadOnly(uri)
 
 
+_event_loop_lock = threading.Lock()
+_event_loop = None
+
+
+def _run_event_loop():
+    while True:
+        try:
+            libvirt.virEventRunDefaultImpl()
+        except Exception:
+            LOG.exception("Failed to run the libvirt event loop")
+            time.sleep(1)
+
+
+def start_event_loop():
+    """Run the default libvirt event loop in a thread of the process.
+
+    The connections to receive events from must be opened after it is
+    started.
+    """
+    global _event_loop
+    if not libvirt:
+        raise ImportError("python-libvirt module is missing")
+    with _event_loop_lock:
+        if _event_loop is None:
+            libvirt.virEventRegisterDefaultImpl()
+            _event_loop = threading.Thread(target=_run_event_loop,
+                                           name='Libvirt-events',
+                                           daemon=True)
+            _event_loop.start()
+
+
 def refresh_libvirt_connection(conf, klass):
     connection = getattr(klass, '_libvirt_connection', None)
     if not connection or not connection.isAlive():
@@ -13,6 +13,8 @@
 
 import os
 
+from jsonpath_rw import jsonpath
+from jsonpath_rw_ext import _string as jsonpath_string
 from jsonpath_rw_ext import parser
 from oslo_log import log
 import yaml
@@ -59,6 +61,111 @@ class NonOpenStackApisDynamicPollsterException\
     pass
 
 
+class ValuesGetter:
+    """Direct accessor of the values matched by a simple JSONPath.
+
+    Simple expressions are made of field names, integer indexes, string
+    splits and unions of those. They are compiled into alternatives, lists
+    of steps applied directly to the dicts and lists of the object, which
+    return the values in the same order as jsonpath would, without
+    building the match objects.
+    """
+
+    ROOT, KEY, INDEX, SPLIT = range(4)
+
+    # NOTE: unions nested in children multiply the alternatives, beyond
+    # this limit jsonpath itself is used.
+    MAX_ALTERNATIVES = 64
+
+    MISSING = object()
+
+    def __init__(self, alternatives):
+        self.alternatives = alternatives
+
+    @classmethod
+    def compile(cls, path):
+        """Return a ValuesGetter for the path, None if it is not simple."""
+        if jsonpath.auto_id_field is not None:
+            return None
+        alternatives = cls._compile(path)
+        if alternatives is None:
+            return None
+        # NOTE: the root is the object the getter is applied to, it is only
+        # supported at the beginning of the path.
+        compiled = []
+        for steps in alternatives:
+            if steps and steps[0][0] == cls.ROOT:
+                steps = steps[1:]
+            if any(kind == cls.ROOT for kind, arg in steps):
+                return None
+            compiled.append(steps)
+        return cls(compiled)
+
+    @classmethod
+    def _compile(cls, path):
+        # NOTE: jsonpath_rw_ext subclasses these nodes for its extensions,
+        # so only the exact types are simple.
+        path_type = type(path)
+        if path_type is jsonpath.Root:
+            return [((cls.ROOT, None),)]
+        if path_type is jsonpath.This:
+            return [()]
+        if path_type is jsonpath.Fields:
+            if len(path.fields) != 1 or path.fields[0] == '*':
+                return None
+            return [((cls.KEY, path.fields[0]),)]
+        if path_type is jsonpath.Index:
+            return [((cls.INDEX, path.index),)]
+        if path_type is jsonpath_string.Split:
+            return [((cls.SPLIT, (path.char, path.max_split,
+                                  path.segment)),)]
+        if path_type in (jsonpath.Child, jsonpath.Union):
+            left = cls._compile(path.left)
+            right = cls._compile(path.right)
+            if left is None or right is None:
+                return None
+            if path_type is jsonpath.Union:
+                alternatives = left + right
+            else:
+                alternatives = [lsteps + rsteps
+                                for lsteps in left for rsteps in right]
+            if len(alternatives) > cls.MAX_ALTERNATIVES:
+                return None
+            return alternatives
+        return None
+
+    @classmethod
+    def step(cls, kind, arg, value):
+        """Apply a step to the value, return MISSING if nothing matches."""
+        if kind == cls.KEY:
+            try:
+                return value[arg]
+            except (TypeError, KeyError, AttributeError):
+                return cls.MISSING
+        if kind == cls.INDEX:
+            # NOTE: like jsonpath, fail on values without length.
+            return value[arg] if len(value) > arg else cls.MISSING
+        char, max_split, segment = arg
+        try:
+            return value.split(char, max_split)[segment]
+        except Exception:
+            return cls.MISSING
+
+    def __call__(self, obj):
+        """Return the values matched in obj, including None values."""
+        values = []
+        missing = self.MISSING
+        for steps in self.alternatives:
+            value = obj
+            for kind, arg in steps:
+                value = self.step(kind, arg, value)
+                if value is missing:
+                    break
+            else:
+                values.append(value)
+        return values
+
+
 class Definition:
     JSONPATH_RW_PARSER = parser.ExtentedJsonPathParser()
     GETTERS_CACHE = {}
@@ -111,11 +218,12 @@ class Definition:
             else:
                 fields = '|'.join('(%s)' % path for path in fields)
 
+        self.values_getter = None
         if isinstance(fields, int):
             self.getter = fields
         else:
             try:
-                self.getter = self.make_getter(fields)
+                self.getter, self.values_getter = self.make_getter(fields)
             except Exception as e:
                 raise DefinitionException(
                     _("Parse error in JSONPath specification "
@@ -128,11 +236,18 @@ class Definition:
             yield str(match.path)
 
     def parse(self, obj, return_all_values=False):
-        if callable(self.getter):
-            values = self.getter(obj)
-        else:
+        if not callable(self.getter):
             return self.getter
 
+        if self.plugin is None and self.values_getter is not None:
+            values = self.values_getter(obj)
+            if not return_all_values:
+                values = [v for v in values if v is not None]
+                return values[0] if values else None
+            return values
+
+        values = self.getter(obj)
+
         values = [match for match in values
                   if return_all_values or match.value is not None]
 
@@ -152,13 +267,33 @@ class Definition:
         else:
             return values[0] if values else None
 
+    def parse_cached(self, obj, cache, return_all_values=False):
+        """Parse obj, sharing the result with definitions of same fields.
+
+        :param cache: dict memoizing the results for obj only.
+        """
+        if self.plugin is not None or not callable(self.getter):
+            return self.parse(obj, return_all_values)
+        key = (self.getter, return_all_values)
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = self.parse(obj, return_all_values)
+            return value
+
     def make_getter(self, fields):
+        """Return the jsonpath getter and the values getter of the fields.
+
+        The values getter is None when the expression is not simple enough
+        to be compiled into direct accessors.
+        """
         if fields in self.GETTERS_CACHE:
             return self.GETTERS_CACHE[fields]
         else:
-            getter = self.JSONPATH_RW_PARSER.parse(fields).find
-            self.GETTERS_CACHE[fields] = getter
-            return getter
+            path = self.JSONPATH_RW_PARSER.parse(fields)
+            getters = (path.find, ValuesGetter.compile(path))
+            self.GETTERS_CACHE[fields] = getters
+            return getters
 
 
 def load_definitions(conf, defaults, config_file, fallback_file=None):
@@ -14,7 +14,9 @@
 # under the License.
 
 import fnmatch
+import functools
 import os
+import re
 
 from oslo_config import cfg
 from oslo_log import log
@@ -23,6 +25,7 @@ from oslo_utils import timeutils
 from ceilometer import declarative
 from ceilometer.event import models
 from ceilometer.i18n import _
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('definitions_cfg_file',
@@ -43,6 +46,26 @@ OPTS = [
 LOG = log.getLogger(__name__)
 
 
+def _convert_text(value):
+    # Cropping the text value to match the TraitText value size
+    if isinstance(value, bytes):
+        return value.decode('utf-8')[:255]
+    return str(value)[:255]
+
+
+def _convert_datetime(value):
+    return timeutils.normalize_time(timeutils.parse_isotime(value))
+
+
+# Specialized versions of models.Trait.convert_value
+CONVERTERS = {
+    models.Trait.TEXT_TYPE: _convert_text,
+    models.Trait.INT_TYPE: int,
+    models.Trait.FLOAT_TYPE: float,
+    models.Trait.DATETIME_TYPE: _convert_datetime,
+}
+
+
 class TraitDefinition(declarative.Definition):
     def __init__(self, name, trait_cfg, plugin_manager):
         super().__init__(name, trait_cfg, plugin_manager)
@@ -53,9 +76,21 @@ class TraitDefinition(declarative.Definition):
             raise declarative.EventDefinitionException(
                 _("Invalid trait type '%(type)s' for trait %(trait)s")
                 % dict(type=type_name, trait=name), self.cfg)
+        self._convert = CONVERTERS.get(
+            self.trait_type,
+            functools.partial(models.Trait.convert_value, self.trait_type))
+
+    @property
+    def alternatives(self):
+        """Steps of the fields, None if they can't be extracted directly."""
+        if self.plugin is not None or self.values_getter is None:
+            return None
+        return self.values_getter.alternatives
 
     def to_trait(self, notification_body):
-        value = self.parse(notification_body)
+        return self.make_trait(self.parse(notification_body))
+
+    def make_trait(self, value):
         if value is None:
             return None
 
@@ -64,8 +99,88 @@ class TraitDefinition(declarative.Definition):
         if self.trait_type != models.Trait.TEXT_TYPE and value == '':
             return None
 
-        value = models.Trait.convert_value(self.trait_type, value)
-        return models.Trait(self.name, self.trait_type, value)
+        return models.Trait(self.name, self.trait_type, self._convert(value))
+
+
+class TraitExtractionPlan:
+    """Extraction plan of the traits of an event definition.
+
+    The steps of the fields of all the traits are merged into a tree, so
+    the notification is walked once, each shared prefix like 'payload' or
+    'ctxt' being looked up once, and every value lands in its slot. The
+    traits which can't be planned, because they use a plugin or a complex
+    jsonpath expression, are extracted on their own.
+    """
+
+    def __init__(self, traits):
+        self._traits = []
+        tree = ([], {})
+        nb_slots = 0
+        for trait in traits:
+            alternatives = trait.alternatives
+            if alternatives is None:
+                self._traits.append((trait, None))
+                continue
+            slots = []
+            for steps in alternatives:
+                node = tree
+                for step in steps:
+                    node = node[1].setdefault(step, ([], {}))
+                node[0].append(nb_slots)
+                slots.append(nb_slots)
+                nb_slots += 1
+            self._traits.append((trait, tuple(slots)))
+        self._root_slots, self._children = self._freeze(tree)
+        self._nb_slots = nb_slots
+
+    @classmethod
+    def _freeze(cls, node):
+        slots, children = node
+        return (tuple(slots),
+                tuple((kind, arg) + cls._freeze(child)
+                      for (kind, arg), child in children.items()))
+
+    @classmethod
+    def _walk(cls, value, children, values):
+        key = declarative.ValuesGetter.KEY
+        step = declarative.ValuesGetter.step
+        missing = declarative.ValuesGetter.MISSING
+        for kind, arg, slots, grandchildren in children:
+            # NOTE: inline the field lookups, by far the most common step.
+            if kind == key:
+                try:
+                    child_value = value[arg]
+                except (TypeError, KeyError, AttributeError):
+                    continue
+            else:
+                child_value = step(kind, arg, value)
+                if child_value is missing:
+                    continue
+            for slot in slots:
+                values[slot] = child_value
+            if grandchildren:
+                cls._walk(child_value, grandchildren, values)
+
+    def extract(self, notification_body):
+        """Return the non-None traits of the notification."""
+        values = [None] * self._nb_slots
+        for slot in self._root_slots:
+            values[slot] = notification_body
+        self._walk(notification_body, self._children, values)
+        traits = []
+        for trait, slots in self._traits:
+            if slots is None:
+                trait = trait.to_trait(notification_body)
+            else:
+                value = None
+                for slot in slots:
+                    value = values[slot]
+                    if value is not None:
+                        break
+                trait = trait.make_trait(value)
+            if trait is not None:
+                traits.append(trait)
+        return traits
 
 
 class EventDefinition:
@@ -109,6 +224,9 @@ class EventDefinition:
         if self._excluded_types and not self._included_types:
             self._included_types.append('*')
 
+        self._included_re = self._compile_types(self._included_types)
+        self._excluded_re = self._compile_types(self._excluded_types)
+
         for trait_name in self.DEFAULT_TRAITS:
             self.traits[trait_name] = TraitDefinition(
                 trait_name,
@@ -119,18 +237,22 @@ class EventDefinition:
                 trait_name,
                 traits[trait_name],
                 trait_plugin_mgr)
+        self._plan = TraitExtractionPlan(self.traits.values())
+
+    @staticmethod
+    def _compile_types(types):
+        if not types:
+            return None
+        return re.compile('|'.join(fnmatch.translate(os.path.normcase(t))
+                                   for t in types))
 
     def included_type(self, event_type):
-        for t in self._included_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return bool(self._included_re and
+                    self._included_re.match(os.path.normcase(event_type)))
 
     def excluded_type(self, event_type):
-        for t in self._excluded_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return bool(self._excluded_re and
+                    self._excluded_re.match(os.path.normcase(event_type)))
 
     def match_type(self, event_type):
         return (self.included_type(event_type)
@@ -146,10 +268,7 @@ class EventDefinition:
         when = timeutils.normalize_time(timeutils.parse_isotime(
             notification_body['metadata']['timestamp']))
 
-        traits = (self.traits[t].to_trait(notification_body)
-                  for t in self.traits)
-        # Only accept non-None value traits ...
-        traits = [trait for trait in traits if trait is not None]
+        traits = self._plan.extract(notification_body)
         raw = notification_body if priority in self.raw_levels else {}
         event = models.Event(message_id, event_type, when, traits, raw)
         return event
@@ -240,6 +359,7 @@ class NotificationEventsConverter:
 
     def __init__(self, conf, events_config, trait_plugin_mgr):
         self.conf = conf
+        self._get_definition = utils.BoundedMemo(self._find_definition)
 
         raw_levels = [level.lower() for level in self.conf.event.store_raw]
         self.definitions = [
@@ -256,11 +376,7 @@ class NotificationEventsConverter:
     def to_event(self, priority, notification_body):
         event_type = notification_body['event_type']
         message_id = notification_body['metadata']['message_id']
-        edef = None
-        for d in self.definitions:
-            if d.match_type(event_type):
-                edef = d
-                break
+        edef = self._get_definition(event_type)
 
         if edef is None:
             if self.conf.event.drop_unmatched_notifications:
@@ -276,6 +392,18 @@ class NotificationEventsConverter:
 
         return edef.to_event(priority, notification_body)
 
+    def _find_definition(self, event_type):
+        """Return the last definition matching the event type, if any.
+
+        The definitions are stored in reverse order, so the last matching
+        one is the first found. The result, including the absence of a
+        definition, is memoized per event type by _get_definition.
+        """
+        for d in self.definitions:
+            if d.match_type(event_type):
+                return d
+        return None
+
 
 def setup_events(conf, trait_plugin_mgr):
     """Setup the event definitions from yaml config file."""
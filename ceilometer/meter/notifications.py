@@ -24,6 +24,7 @@ from ceilometer import declarative
 from ceilometer.i18n import _
 from ceilometer.pipeline import sample as endpoint
 from ceilometer import sample as sample_util
+from ceilometer import utils
 
 OPTS = [
     cfg.MultiStrOpt('meter_definitions_dirs',
@@ -40,6 +41,11 @@ OPTS = [
 
 LOG = log.getLogger(__name__)
 
+# Event type patterns made only of words separated by dots are treated as
+# literal event types by the dispatch index.
+LITERAL_EVENT_TYPE = re.compile(r'^[\w-]+(\.[\w-]+)*$')
+BACKREFERENCE = re.compile(r'\\\d')
+
 
 class MeterDefinition:
 
@@ -49,6 +55,8 @@ class MeterDefinition:
     REQUIRED_FIELDS = ['name', 'type', 'event_type', 'unit', 'volume',
                        'resource_id']
 
+    LOOKUP_ATTRIBUTES = tuple(SAMPLE_ATTRIBUTES + ["message", "metadata"])
+
     def __init__(self, definition_cfg, conf, plugin_manager):
         self.conf = conf
         self.cfg = definition_cfg
@@ -97,94 +105,202 @@ class MeterDefinition:
         self.lookup = self.cfg.get('lookup')
         if isinstance(self.lookup, str):
             self.lookup = [self.lookup]
+        if self.lookup:
+            self._lookup_names = frozenset(self.lookup + ["name"])
 
     def match_type(self, meter_name):
         for t in self._event_type:
             if t.match(meter_name):
                 return True
 
-    def to_samples(self, message, all_values=False):
-        # Sample defaults
-        sample = {
-            'name': self.cfg["name"], 'type': self.cfg["type"],
-            'unit': self.cfg["unit"], 'volume': None, 'timestamp': None,
-            'user_id': self._fallback_user_id.parse(message),
-            'project_id': self._fallback_project_id.parse(message),
-            'resource_id': None, 'message': message, 'metadata': {},
-        }
+    def _parse(self, parser, message, return_all_values, cache):
+        if cache is None:
+            return parser.parse(message, return_all_values)
+        return parser.parse_cached(message, cache, return_all_values)
+
+    def _parse_user_id(self, message, cache):
+        return self._parse(self._fallback_user_id, message, False, cache)
+
+    def _parse_project_id(self, message, cache):
+        return self._parse(self._fallback_project_id, message, False, cache)
+
+    def _parse_metadata(self, message, cache):
+        metadata = {}
         for name, parser in self._metadata_attributes.items():
-            value = parser.parse(message)
+            value = self._parse(parser, message, False, cache)
             if value:
-                sample['metadata'][name] = value
+                metadata[name] = value
 
         if self._user_meta:
-            meta = self._user_meta.parse(message)
+            meta = self._parse(self._user_meta, message, False, cache)
             if meta:
                 sample_util.add_reserved_user_metadata(
-                    self.conf, meta, sample['metadata'])
+                    self.conf, meta, metadata)
+        return metadata
+
+    def to_samples(self, message, all_values=False, cache=None):
+        """Convert the notification to sample dicts.
+
+        :param message: notification to convert.
+        :param cache: optional dict memoizing the parsed fields, it can be
+                      shared by all the definitions matching the message.
+        """
+        if self.lookup:
+            return self._to_lookup_samples(message, cache)
+        return self._to_single_sample(message, cache)
 
+    def _to_single_sample(self, message, cache):
+        sample = {
+            'name': self.cfg["name"], 'type': self.cfg["type"],
+            'unit': self.cfg["unit"], 'volume': None, 'timestamp': None,
+            'user_id': None, 'project_id': None, 'resource_id': None,
+            'message': message, 'metadata': None,
+        }
+        sample['metadata'] = self._parse_metadata(message, cache)
+        for name, parser in self._attributes.items():
+            value = self._parse(parser, message, False, cache)
+            if value is not None:
+                sample[name] = value
+
+        # NOTE: the fallbacks are only parsed when the meter's own
+        # attributes did not provide a value.
+        if sample['user_id'] is None:
+            sample['user_id'] = self._parse_user_id(message, cache)
+        if sample['project_id'] is None:
+            sample['project_id'] = self._parse_project_id(message, cache)
+        yield sample
+
+    def _to_lookup_samples(self, message, cache):
         # NOTE(sileht): We expect multiple samples in the payload
         # so put each attribute into a list
-        if self.lookup:
-            for name in sample:
-                sample[name] = [sample[name]]
+        columns = {}
+        for name, parser in self._attributes.items():
+            value = self._parse(parser, message, True, cache)
+            # NOTE(sileht): If we expect multiple samples
+            # some attributes are overridden even we don't get any
+            # result. Also note in this case value is always a list
+            if name in self._lookup_names or value:
+                columns[name] = value
+
+        nb_samples = len(columns['name'])
+        # skip if no meters in payload
+        if nb_samples <= 0:
+            return
+
+        defaults = {
+            'type': self.cfg["type"], 'unit': self.cfg["unit"],
+            'volume': None, 'timestamp': None, 'resource_id': None,
+            'message': message,
+        }
+        for name in self.LOOKUP_ATTRIBUTES:
+            values = columns.get(name)
+            if values is None:
+                # NOTE: the defaults are only computed for the attributes
+                # the payload did not provide.
+                if name == 'user_id':
+                    values = [self._parse_user_id(message, cache)]
+                elif name == 'project_id':
+                    values = [self._parse_project_id(message, cache)]
+                elif name == 'metadata':
+                    values = [self._parse_metadata(message, cache)]
+                else:
+                    values = [defaults[name]]
+            nb_values = len(values)
+            if nb_values == nb_samples:
+                columns[name] = values
+                continue
+            if nb_values == 1 and name not in self.lookup:
+                columns[name] = itertools.repeat(values[0], nb_samples)
+                continue
+            nb = (0 if nb_values == 1 and values[0] is None
+                  else nb_values)
+            LOG.warning('Only %(nb)d fetched meters contain '
+                        '"%(name)s" field instead of %(total)d.',
+                        dict(name=name, nb=nb, total=nb_samples))
+            return
+
+        # NOTE(sileht): Transform the sample with multiple values per
+        # attribute into multiple samples with one value per attribute.
+        attributes = self.LOOKUP_ATTRIBUTES
+        for values in zip(*(columns[name] for name in attributes)):
+            sample = dict(zip(attributes, values))
+
+            if self._name_discovery and self._cache:
+                # populate user_name and project_name fields in the sample
+                # created from notifications
+                if sample['user_id']:
+                    sample['user_name'] = \
+                        self._cache.resolve_uuid_from_cache(
+                            'users', sample['user_id'])
+                if sample['project_id']:
+                    sample['project_name'] = \
+                        self._cache.resolve_uuid_from_cache(
+                            'projects', sample['project_id'])
+            yield sample
 
-        for name in self.SAMPLE_ATTRIBUTES:
-            parser = self._attributes.get(name)
-            if parser is not None:
-                value = parser.parse(message, bool(self.lookup))
-                # NOTE(sileht): If we expect multiple samples
-                # some attributes are overridden even we don't get any
-                # result. Also note in this case value is always a list
-                if ((not self.lookup and value is not None) or
-                        (self.lookup and ((name in self.lookup + ["name"])
-                                          or value))):
-                    sample[name] = value
 
-        if self.lookup:
-            nb_samples = len(sample['name'])
-            # skip if no meters in payload
-            if nb_samples <= 0:
-                return
-
-            attributes = self.SAMPLE_ATTRIBUTES + ["message", "metadata"]
-
-            samples_values = []
-            for name in attributes:
-                values = sample.get(name)
-                nb_values = len(values)
-                if nb_values == nb_samples:
-                    samples_values.append(values)
-                elif nb_values == 1 and name not in self.lookup:
-                    samples_values.append(itertools.cycle(values))
+class MeterDefinitionIndex:
+    """Dispatch index of meter definitions by event type.
+
+    Definitions whose event type is a literal are reachable through a
+    dictionary lookup, while all other patterns are folded into a single
+    combined regular expression which is used to reject the event types
+    that no definition can match. The definitions resolved for an event
+    type are memoized, so the per-notification cost no longer depends on
+    the number of loaded definitions.
+    """
+
+    def __init__(self, definitions):
+        self._definitions = list(definitions)
+        self._literals = {}
+        self._patterns = []
+        alternatives = []
+        for position, definition in enumerate(self._definitions):
+            for pattern in definition._event_type:
+                self._patterns.append((position, pattern))
+                if LITERAL_EVENT_TYPE.match(pattern.pattern):
+                    self._literals.setdefault(pattern.pattern,
+                                              set()).add(position)
+                    # NOTE: literal patterns are still regular expressions
+                    # and re.match() also accepts longer event types, keep
+                    # that behaviour for everything but the exact match.
+                    alternatives.append('(?!%s\\Z)(?:%s)' % (
+                        re.escape(pattern.pattern), pattern.pattern))
                 else:
-                    nb = (0 if nb_values == 1 and values[0] is None
-                          else nb_values)
-                    LOG.warning('Only %(nb)d fetched meters contain '
-                                '"%(name)s" field instead of %(total)d.',
-                                dict(name=name, nb=nb, total=nb_samples))
-                    return
-
-            # NOTE(sileht): Transform the sample with multiple values per
-            # attribute into multiple samples with one value per attribute.
-            for values in zip(*samples_values):
-                sample = {attributes[idx]: value
-                          for idx, value in enumerate(values)}
-
-                if self._name_discovery and self._cache:
-                    # populate user_name and project_name fields in the sample
-                    # created from notifications
-                    if sample['user_id']:
-                        sample['user_name'] = \
-                            self._cache.resolve_uuid_from_cache(
-                                'users', sample['user_id'])
-                    if sample['project_id']:
-                        sample['project_name'] = \
-                            self._cache.resolve_uuid_from_cache(
-                                'projects', sample['project_id'])
-                yield sample
-        else:
-            yield sample
+                    alternatives.append('(?:%s)' % pattern.pattern)
+        self._matcher = self._combine(alternatives)
+        # lookup(event_type) returns the definitions matching the event
+        # type, in load order.
+        self.lookup = utils.BoundedMemo(self._lookup)
+
+    def _combine(self, alternatives):
+        if not alternatives:
+            return None
+        # NOTE: numbered back references would point to the wrong group
+        # once patterns are combined, always scan in that case.
+        if any(BACKREFERENCE.search(p) for p in alternatives):
+            return None
+        try:
+            return re.compile('|'.join(alternatives))
+        except re.error:
+            return None
+
+    def __iter__(self):
+        return iter(self._definitions)
+
+    def __len__(self):
+        return len(self._definitions)
+
+    def _lookup(self, event_type):
+        # Return the definitions matching the event type, in load order,
+        # called through the memo of lookup().
+        matches = set(self._literals.get(event_type, ()))
+        if self._matcher is None or self._matcher.match(event_type):
+            for position, pattern in self._patterns:
+                if position not in matches and pattern.match(event_type):
+                    matches.add(position)
+        return tuple(self._definitions[position]
+                     for position in sorted(matches))
 
 
 class ProcessMeterNotifications(endpoint.SampleEndpoint):
@@ -220,10 +336,12 @@ class ProcessMeterNotifications(endpoint.SampleEndpoint):
                     LOG.error("Error loading meter definition: %s", e)
                 else:
                     definitions[meter_cfg['name']] = md
-        return definitions.values()
+        return MeterDefinitionIndex(definitions.values())
 
     def build_sample(self, notification):
-        for d in self.definitions:
-            if d.match_type(notification['event_type']):
-                for s in d.to_samples(notification):
-                    yield sample_util.Sample.from_notification(**s)
+        # NOTE: definitions matching the same notification often share
+        # fields, like the user, project or metadata, parse them once.
+        cache = {}
+        for d in self.definitions.lookup(notification['event_type']):
+            for s in d.to_samples(notification, cache=cache):
+                yield sample_util.Sample.from_notification(**s)
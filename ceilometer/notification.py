@@ -46,10 +46,58 @@ OPTS = [
                default=1, min=1,
                help='Number of notification messages to wait before '
                'publishing them.'),
+    cfg.BoolOpt('batch_publishing',
+                default=False,
+                help='Convert all the notification messages of a batch '
+                     'before publishing the resulting samples or events in '
+                     'a single call per pipeline, instead of publishing '
+                     'them message by message. A sample notification which '
+                     'fails to be converted is dropped without affecting '
+                     'the rest of the batch. An event notification which '
+                     'fails to be converted is dropped or, if '
+                     'ack_on_event_error is disabled, requeued with its '
+                     'batch, whose other events are published once.'),
     cfg.IntOpt('batch_timeout',
                help='Number of seconds to wait before dispatching samples '
                     'when batch_size is not reached (None means indefinitely).'
                ),
+    cfg.IntOpt('publisher_queue_size',
+               default=0, min=0,
+               help='Number of publications each publisher of the '
+                    'pipelines can queue, to be processed by its own '
+                    'threads so a slow publisher does not stall the '
+                    'others. Notification messages are then acknowledged '
+                    'once their data is queued, and a publisher error is '
+                    'only logged. The events are still published '
+                    'synchronously when ack_on_event_error is disabled, '
+                    'so that a publisher error requeues them. 0 publishes '
+                    'synchronously from the listener threads.'),
+    cfg.IntOpt('publisher_queue_workers',
+               default=1, min=1,
+               help='Number of threads processing the queue of each '
+                    'publisher.'),
+    cfg.StrOpt('publisher_queue_policy',
+               default='block',
+               choices=[('block', 'Wait for room in the queue, slowing '
+                                  'down the consumption of the '
+                                  'notifications.'),
+                        ('drop_oldest', 'Drop the oldest queued data, '
+                                        'which is then lost.')],
+               help='Behaviour when the queue of a publisher is full.'),
+    cfg.IntOpt('publisher_fanout_workers',
+               default=0, min=0,
+               help='Number of threads shared by the pipelines to call the '
+                    'publishers of a sink concurrently, when the sink has '
+                    'several publishers and publisher queues are disabled. '
+                    '0 calls the publishers one after the other.'),
+    cfg.IntOpt('publisher_fanout_timeout',
+               default=60, min=1,
+               help='Number of seconds to wait for the publishers of a sink '
+                    'called concurrently. A publisher which does not '
+                    'finish in time is logged and the sink moves on, while '
+                    'its thread keeps running until it returns. The data '
+                    'is not handed to that publisher until then, so that '
+                    'it does not hold the threads of the other ones.'),
     cfg.IntOpt('workers',
                default=1,
                min=1,
@@ -162,5 +210,7 @@ class NotificationService(cotyledon.Service):
 
     def terminate(self):
         self.kill_listeners(self.listeners)
+        for manager in getattr(self, 'managers', []):
+            manager.stop()
 
         super().terminate()
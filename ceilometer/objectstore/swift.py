@@ -15,6 +15,9 @@
 """Common code for working with object stores
 """
 
+import asyncio
+import functools
+
 from keystoneauth1 import exceptions
 from oslo_config import cfg
 from oslo_log import log
@@ -70,37 +73,53 @@ class _Base(plugin_base.PollsterBase):
                 LOG.info("Swift endpoint not found: %s", e)
         return _Base._ENDPOINT
 
-    def _iter_accounts(self, ksclient, cache, tenants):
-        if self.CACHE_KEY_METHOD not in cache:
-            cache[self.CACHE_KEY_METHOD] = list(self._get_account_info(
-                ksclient, tenants))
-        return iter(cache[self.CACHE_KEY_METHOD])
-
-    def _get_account_info(self, ksclient, tenants):
-        endpoint = self._get_endpoint(self.conf, ksclient)
+    async def _get_accounts(self, manager, cache, tenants):
+        # NOTE: the cache is only used from the event loop of the engine,
+        # the pollsters of a same method wait for the first one's requests.
+        accounts = cache.get(self.CACHE_KEY_METHOD)
+        if accounts is None:
+            accounts = cache[self.CACHE_KEY_METHOD] = asyncio.ensure_future(
+                self._get_account_info(manager, tenants))
+        try:
+            return await accounts
+        except BaseException:
+            # Let the next pollsters request the accounts again
+            if cache.get(self.CACHE_KEY_METHOD) is accounts:
+                del cache[self.CACHE_KEY_METHOD]
+            raise
+
+    async def _get_account_info(self, manager, tenants):
+        ksclient = manager.keystone
+        endpoint = await manager.async_engine.call(
+            'keystone', self._get_endpoint, self.conf, ksclient)
         if not endpoint:
-            return
+            return []
 
+        accounts = await manager.async_engine.map(
+            endpoint, functools.partial(self._get_account, ksclient,
+                                        endpoint), tenants)
+        return [account for account in accounts if account is not None]
+
+    def _get_account(self, ksclient, endpoint, tenant):
         swift_api_method = getattr(swift, '%s_account' % self.METHOD)
-        for t in tenants:
-            try:
-                http_conn = swift.http_connection(
-                    self._neaten_url(endpoint, t.id,
-                                     self.conf.reseller_prefix),
-                    cacert=self.conf.service_credentials.cafile)
-                yield (t.id, swift_api_method(
-                    None,
-                    keystone_client.get_auth_token(ksclient),
-                    http_conn=http_conn))
-            except ClientException as e:
-                if e.http_status == 404:
-                    LOG.warning("Swift tenant id %s not found.", t.id)
-                elif e.http_status == 403:
-                    LOG.error("The credentials configured does not have "
-                              "correct roles to access Swift tenant id %s.",
-                              t.id)
-                else:
-                    raise e
+        try:
+            http_conn = swift.http_connection(
+                self._neaten_url(endpoint, tenant.id,
+                                 self.conf.reseller_prefix),
+                cacert=self.conf.service_credentials.cafile)
+            return (tenant.id, swift_api_method(
+                None,
+                keystone_client.get_auth_token(ksclient),
+                http_conn=http_conn))
+        except ClientException as e:
+            if e.http_status == 404:
+                LOG.warning("Swift tenant id %s not found.", tenant.id)
+            elif e.http_status == 403:
+                LOG.error("The credentials configured does not have "
+                          "correct roles to access Swift tenant id %s.",
+                          tenant.id)
+            else:
+                raise e
 
     @staticmethod
     def _neaten_url(endpoint, tenant_id, reseller_prefix):
@@ -120,10 +139,10 @@ class _ContainersBase(_Base):
 class ObjectsPollster(_Base):
     """Collect the total objects count for each project"""
 
-    def get_samples(self, manager, cache, resources):
+    async def get_samples(self, manager, cache, resources):
         tenants = resources
-        for tenant, account in self._iter_accounts(manager.keystone,
-                                                   cache, tenants):
+        for tenant, account in await self._get_accounts(manager, cache,
+                                                        tenants):
             yield sample.Sample(
                 name='storage.objects',
                 type=sample.TYPE_GAUGE,
@@ -139,10 +158,10 @@ class ObjectsPollster(_Base):
 class ObjectsSizePollster(_Base):
     """Collect the total objects size of each project"""
 
-    def get_samples(self, manager, cache, resources):
+    async def get_samples(self, manager, cache, resources):
         tenants = resources
-        for tenant, account in self._iter_accounts(manager.keystone,
-                                                   cache, tenants):
+        for tenant, account in await self._get_accounts(manager, cache,
+                                                        tenants):
             yield sample.Sample(
                 name='storage.objects.size',
                 type=sample.TYPE_GAUGE,
@@ -158,10 +177,10 @@ class ObjectsSizePollster(_Base):
 class ObjectsContainersPollster(_Base):
     """Collect the container count for each project"""
 
-    def get_samples(self, manager, cache, resources):
+    async def get_samples(self, manager, cache, resources):
         tenants = resources
-        for tenant, account in self._iter_accounts(manager.keystone,
-                                                   cache, tenants):
+        for tenant, account in await self._get_accounts(manager, cache,
+                                                        tenants):
             yield sample.Sample(
                 name='storage.objects.containers',
                 type=sample.TYPE_GAUGE,
@@ -179,10 +198,10 @@ class ContainersObjectsPollster(_ContainersBase):
 
     METHOD = 'get'
 
-    def get_samples(self, manager, cache, resources):
+    async def get_samples(self, manager, cache, resources):
         tenants = resources
-        for tenant, account in self._iter_accounts(manager.keystone,
-                                                   cache, tenants):
+        for tenant, account in await self._get_accounts(manager, cache,
+                                                        tenants):
             containers_info = account[1]
             for container in containers_info:
                 yield sample.Sample(
@@ -202,10 +221,10 @@ class ContainersSizePollster(_ContainersBase):
 
     METHOD = 'get'
 
-    def get_samples(self, manager, cache, resources):
+    async def get_samples(self, manager, cache, resources):
         tenants = resources
-        for tenant, account in self._iter_accounts(manager.keystone,
-                                                   cache, tenants):
+        for tenant, account in await self._get_accounts(manager, cache,
+                                                        tenants):
             containers_info = account[1]
             for container in containers_info:
                 yield sample.Sample(
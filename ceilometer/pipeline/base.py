@@ -15,13 +15,19 @@
 # under the License.
 
 import abc
+import collections
+from concurrent import futures
+import threading
+import time
 
+import futurist
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
 
 from ceilometer import agent
 from ceilometer import publisher
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('pipeline_cfg_file',
@@ -43,14 +49,146 @@ class PipelineException(agent.ConfigException):
         super().__init__('Pipeline', message, cfg)
 
 
+class PipelineRouter:
+    """Routing table of data names to the pipelines accepting them.
+
+    The table maps a meter name or an event type to the pipelines whose
+    source accepts it. It is filled lazily on first sight of a name and
+    bounded in size, so the source filtering only runs once per name.
+    """
+
+    def __init__(self, pipelines, key):
+        self.pipelines = pipelines
+        self._key = key
+        self._routes = utils.BoundedMemo(self._pipelines)
+
+    def _pipelines(self, name):
+        return tuple(p for p in self.pipelines if p.supports(name))
+
+    def route(self, data):
+        """Return the pipelines accepting the data."""
+        return self._routes(self._key(data))
+
+    def dispatch(self, data):
+        """Validate and split data among the pipelines accepting it.
+
+        :param data: list of samples or events.
+        :return: list of (pipeline, data) pairs in pipeline order.
+        """
+        routed = {}
+        for d in data:
+            pipelines = self.route(d)
+            if pipelines and pipelines[0].validate(d):
+                for p in pipelines:
+                    routed.setdefault(p, []).append(d)
+        return [(p, routed[p]) for p in self.pipelines if p in routed]
+
+
+class PublisherQueue:
+    """Bounded queue of the data waiting for a publisher.
+
+    Worker threads call the publisher with the queued data, so a slow
+    publisher does not hold the listener threads nor the other publishers.
+    The data is handed over once queued, the notification messages it comes
+    from are then acknowledged and a publisher error is only logged, so the
+    queues are not used when these messages have to be requeued on error.
+
+    When the queue is full, the 'block' policy makes the caller wait for a
+    free slot, while the 'drop_oldest' policy discards the oldest queued
+    data, which is lost.
+    """
+
+    POLICIES = ('block', 'drop_oldest')
+
+    def __init__(self, publisher, size, workers=1, policy='block'):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown publisher queue policy: %s' % policy)
+        self.publisher = publisher
+        self.size = size
+        self.policy = policy
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run, daemon=True,
+                                      name='publisher-queue-%d' % i)
+            worker.start()
+            self._workers.append(worker)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def submit(self, func, *args):
+        """Queue a call to the publisher."""
+        with self._cond:
+            if self.policy == 'block':
+                while len(self._queue) >= self.size and not self._stopped:
+                    self._cond.wait()
+            if self._stopped:
+                LOG.error('Publisher %s queue is stopped, dropping the '
+                          'data', self.publisher)
+                return
+            if len(self._queue) >= self.size:
+                self._queue.popleft()
+                self.dropped += 1
+                LOG.error('Publisher %s queue is full, dropping the oldest '
+                          'data (%d dropped so far)',
+                          self.publisher, self.dropped)
+            self._queue.append((func, args))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                func, args = self._queue.popleft()
+                self._cond.notify_all()
+            try:
+                func(*args)
+            except Exception:
+                LOG.exception('Publisher %s failed to publish the queued '
+                              'data', self.publisher)
+
+    def stop(self, timeout=60):
+        """Publish the queued data and stop the worker threads.
+
+        :param timeout: number of seconds to wait for the worker threads.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        alive = [w.name for w in self._workers if w.is_alive()]
+        if alive:
+            LOG.warning('Publisher %(pub)s did not publish its %(count)d '
+                        'queued data within %(timeout)d seconds, leaving '
+                        'threads %(threads)s behind',
+                        {'pub': self.publisher, 'count': len(self._queue),
+                         'timeout': timeout, 'threads': ', '.join(alive)})
+
+
 class PublishContext:
-    def __init__(self, pipelines):
+    def __init__(self, pipelines, router=None):
         self.pipelines = pipelines or []
+        self.router = router
 
     def __enter__(self):
         def p(data):
-            for p in self.pipelines:
-                p.publish_data(data)
+            if self.router is None:
+                for p in self.pipelines:
+                    p.publish_data(data)
+                return
+            if not isinstance(data, list):
+                data = [data]
+            for p, routed in self.router.dispatch(data):
+                p.publish_supported(routed)
         return p
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -100,9 +238,10 @@ class Sink:
 
     """
 
-    def __init__(self, conf, cfg, publisher_manager):
+    def __init__(self, conf, cfg, publisher_manager, executor=None):
         self.conf = conf
         self.cfg = cfg
+        self.executor = executor
 
         try:
             self.name = cfg['name']
@@ -114,6 +253,7 @@ class Sink:
             raise PipelineException("No publisher specified", cfg)
 
         self.publishers = []
+        self.publisher_queues = []
         for p in cfg['publishers']:
             if '://' not in p:
                 # Support old format without URL
@@ -121,14 +261,52 @@ class Sink:
 
             try:
                 self.publishers.append(publisher_manager.get(p))
+                self.publisher_queues.append(publisher_manager.get_queue(p))
             except Exception:
                 LOG.exception("Unable to load publisher %s", p)
 
         self.multi_publish = True if len(self.publishers) > 1 else False
+        # Futures of the publishers which did not publish in time
+        self._hung = {}
 
     def __str__(self):
         return self.name
 
+    def _publish(self, publish, data):
+        """Publish data through all the publishers.
+
+        :param publish: function publishing data through one publisher.
+        """
+        fanout = []
+        for p, queue in zip(self.publishers, self.publisher_queues):
+            if queue is not None:
+                queue.submit(publish, p, data)
+            elif self.executor is not None and self.multi_publish:
+                hung = self._hung.get(p)
+                if hung is not None:
+                    if not hung.done():
+                        LOG.error("Pipeline %(pipeline)s: Skipping "
+                                  "publisher %(pub)s which is still "
+                                  "publishing", {'pipeline': self,
+                                                 'pub': p})
+                        continue
+                    self._hung.pop(p, None)
+                fanout.append((p, self.executor.submit(publish, p, data)))
+            else:
+                publish(p, data)
+
+        timeout = self.conf.notification.publisher_fanout_timeout
+        deadline = time.monotonic() + timeout
+        for p, future in fanout:
+            try:
+                future.result(max(0, deadline - time.monotonic()))
+            except futures.TimeoutError:
+                self._hung[p] = future
+                LOG.error("Pipeline %(pipeline)s: Continue after publisher "
+                          "%(pub)s did not publish within %(timeout)d "
+                          "seconds", {'pipeline': self, 'pub': p,
+                                      'timeout': timeout})
+
     @staticmethod
     def flush():
         """Flush data after all events have been injected to pipeline."""
@@ -158,14 +336,32 @@ class Pipeline(metaclass=abc.ABCMeta):
     def publish_data(self, data):
         """Publish data from pipeline."""
 
+    @abc.abstractmethod
+    def publish_supported(self, data):
+        """Publish data already filtered and validated for this pipeline."""
+
     @abc.abstractmethod
     def supported(self, data):
         """Attribute to filter on. Pass if no partitioning."""
 
+    @abc.abstractmethod
+    def supports(self, name):
+        """Whether the source accepts the meter name or event type."""
+
+    @staticmethod
+    @abc.abstractmethod
+    def routing_key(data):
+        """Name used to route the data to the pipelines."""
+
+    def validate(self, data):
+        """Whether the data is well formed, independently of the pipeline."""
+        return True
+
 
 class PublisherManager:
     def __init__(self, conf, purpose):
         self._loaded_publishers = {}
+        self._publisher_queues = {}
         self._conf = conf
         self._purpose = purpose
 
@@ -177,6 +373,28 @@ class PublisherManager:
             self._loaded_publishers[url] = p
         return self._loaded_publishers[url]
 
+    def get_queue(self, url):
+        """Return the queue of the publisher, None if disabled."""
+        size = self._conf.notification.publisher_queue_size
+        if not size:
+            return None
+        if (self._purpose == 'event' and
+                not self._conf.notification.ack_on_event_error):
+            # NOTE: the events have to be published before their messages
+            # are acknowledged, for a publisher error to requeue them.
+            return None
+        if url not in self._publisher_queues:
+            self._publisher_queues[url] = PublisherQueue(
+                self.get(url), size,
+                self._conf.notification.publisher_queue_workers,
+                self._conf.notification.publisher_queue_policy)
+        return self._publisher_queues[url]
+
+    def stop(self):
+        """Stop the publisher queues once their data is published."""
+        for queue in self._publisher_queues.values():
+            queue.stop()
+
 
 class PipelineManager(agent.ConfigManagerBase):
     """Pipeline Manager
@@ -231,10 +449,17 @@ class PipelineManager(agent.ConfigManagerBase):
         super().__init__(conf)
         cfg = self.load_config(cfg_file)
         self.pipelines = []
+        self.router = PipelineRouter(self.pipelines,
+                                     self.pm_pipeline.routing_key)
         if not ('sources' in cfg and 'sinks' in cfg):
             raise PipelineException("Both sources & sinks are required",
                                     cfg)
-        publisher_manager = PublisherManager(self.conf, self.pm_type)
+        self.publisher_manager = publisher_manager = PublisherManager(
+            self.conf, self.pm_type)
+        self.executor = None
+        if self.conf.notification.publisher_fanout_workers:
+            self.executor = futurist.ThreadPoolExecutor(
+                max_workers=self.conf.notification.publisher_fanout_workers)
 
         unique_names = set()
         sources = []
@@ -257,7 +482,8 @@ class PipelineManager(agent.ConfigManagerBase):
             else:
                 unique_names.add(name)
                 sinks[s['name']] = self.pm_sink(self.conf, s,
-                                                publisher_manager)
+                                                publisher_manager,
+                                                self.executor)
         unique_names.clear()
 
         for source in sources:
@@ -294,9 +520,16 @@ class PipelineManager(agent.ConfigManagerBase):
     def pm_sink(self):
         """Pipeline sink class"""
 
+    def stop(self):
+        """Stop the threads publishing the data of the pipelines."""
+        self.publisher_manager.stop()
+        if self.executor is not None:
+            # NOTE: do not wait for the publishers which did not return
+            self.executor.shutdown(wait=False)
+
     def publisher(self):
         """Build publisher for pipeline publishing."""
-        return PublishContext(self.pipelines)
+        return PublishContext(self.pipelines, self.router)
 
     def get_main_endpoints(self):
         """Return endpoints for main queue."""
@@ -11,6 +11,9 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import threading
+
+import cachetools
 from oslo_log import log
 import oslo_messaging
 from stevedore import extension
@@ -33,6 +36,10 @@ class EventEndpoint(base.NotificationEndpoint):
             conf,
             extension.ExtensionManager(
                 namespace='ceilometer.event.trait_plugin'))
+        # Ids of the messages of requeued batches whose events were
+        # published, see _process_notifications_batch.
+        self._published = cachetools.LRUCache(4096)
+        self._published_lock = threading.Lock()
 
     def info(self, notifications):
         """Convert message at info level to Ceilometer Event.
@@ -49,6 +56,8 @@ class EventEndpoint(base.NotificationEndpoint):
         return self.process_notifications('error', notifications)
 
     def process_notifications(self, priority, notifications):
+        if self.conf.notification.batch_publishing:
+            return self._process_notifications_batch(priority, notifications)
         for message in notifications:
             try:
                 event = self.event_converter.to_event(priority, message)
@@ -61,6 +70,45 @@ class EventEndpoint(base.NotificationEndpoint):
                 LOG.exception('Fail to process a notification')
         return oslo_messaging.NotificationResult.HANDLED
 
+    def _process_notifications_batch(self, priority, notifications):
+        # NOTE: the batch listener can only requeue the whole batch. When a
+        # message fails to convert, the events of the other messages are
+        # still published and their message ids remembered, so that only
+        # the failed messages are processed again when the batch comes back.
+        requeue = False
+        message_ids = []
+        events = []
+        for message in notifications:
+            message_id = message['metadata']['message_id']
+            with self._published_lock:
+                if message_id in self._published:
+                    continue
+            try:
+                event = self.event_converter.to_event(priority, message)
+            except Exception:
+                if not self.conf.notification.ack_on_event_error:
+                    requeue = True
+                    continue
+                LOG.exception('Fail to process a notification')
+            else:
+                message_ids.append(message_id)
+                if event is not None:
+                    events.append(event)
+        if events:
+            try:
+                with self.publisher as p:
+                    p(events)
+            except Exception:
+                if not self.conf.notification.ack_on_event_error:
+                    return oslo_messaging.NotificationResult.REQUEUE
+                LOG.exception('Fail to publish %d events', len(events))
+        if requeue:
+            with self._published_lock:
+                for message_id in message_ids:
+                    self._published[message_id] = True
+            return oslo_messaging.NotificationResult.REQUEUE
+        return oslo_messaging.NotificationResult.HANDLED
+
 
 class EventSource(base.PipelineSource):
     """Represents a source of events.
@@ -85,17 +133,19 @@ class EventSink(base.Sink):
 
     def publish_events(self, events):
         if events:
-            for p in self.publishers:
-                try:
-                    p.publish_events(events)
-                except Exception:
-                    LOG.exception("Pipeline %(pipeline)s: %(status)s "
-                                  "after error from publisher %(pub)s",
-                                  {'pipeline': self,
-                                   'status': 'Continue' if
-                                   self.multi_publish else 'Exit', 'pub': p})
-                    if not self.multi_publish:
-                        raise
+            self._publish(self._publish_events, events)
+
+    def _publish_events(self, p, events):
+        try:
+            p.publish_events(events)
+        except Exception:
+            LOG.exception("Pipeline %(pipeline)s: %(status)s "
+                          "after error from publisher %(pub)s",
+                          {'pipeline': self,
+                           'status': 'Continue' if
+                           self.multi_publish else 'Exit', 'pub': p})
+            if not self.multi_publish:
+                raise
 
 
 class EventPipeline(base.Pipeline):
@@ -106,14 +156,24 @@ class EventPipeline(base.Pipeline):
         #              pipelines do not have the same name.
         return 'event:%s' % super().__str__()
 
+    @staticmethod
+    def routing_key(event):
+        return event.event_type
+
     def publish_data(self, events):
         if not isinstance(events, list):
             events = [events]
         supported = [e for e in events if self.supported(e)]
         self.sink.publish_events(supported)
 
+    def publish_supported(self, events):
+        self.sink.publish_events(events)
+
     def supported(self, event):
-        return self.source.support_event(event.event_type)
+        return self.supports(event.event_type)
+
+    def supports(self, name):
+        return self.source.support_event(name)
 
 
 class EventPipelineManager(base.PipelineManager):
@@ -36,6 +36,8 @@ class SampleEndpoint(base.NotificationEndpoint):
         return self.process_notifications('sample', notifications)
 
     def process_notifications(self, priority, notifications):
+        if self.conf.notification.batch_publishing:
+            return self._process_notifications_batch(priority, notifications)
         for message in notifications:
             try:
                 LOG.debug("Processing sample notification [%s] for publisher "
@@ -48,6 +50,26 @@ class SampleEndpoint(base.NotificationEndpoint):
                               message)
                 raise
 
+    def _process_notifications_batch(self, priority, notifications):
+        samples = []
+        for message in notifications:
+            try:
+                LOG.debug("Processing sample notification [%s] with "
+                          "priority [%s] using the agent [%s].",
+                          message, priority, self)
+                # NOTE: build the samples of a message before adding them
+                # to the batch, so a failing message contributes nothing.
+                samples.extend(list(self.build_sample(message)))
+            except Exception:
+                LOG.exception('Fail to process notification message [%s], '
+                              'dropping it', message)
+        if samples:
+            LOG.debug("Publishing %d samples from %d notifications for "
+                      "publisher [%s].", len(samples), len(notifications),
+                      self.publisher)
+            with self.publisher as p:
+                p(samples)
+
     def build_sample(notification):
         """Build sample from provided notification."""
         pass
@@ -85,13 +107,15 @@ class SampleSink(base.Sink):
         """
 
         if samples:
-            for p in self.publishers:
-                try:
-                    p.publish_samples(samples)
-                except Exception:
-                    LOG.exception("Pipeline %(pipeline)s: Continue after "
-                                  "error from publisher %(pub)s",
-                                  {'pipeline': self, 'pub': p})
+            self._publish(self._publish_samples, samples)
+
+    def _publish_samples(self, p, samples):
+        try:
+            p.publish_samples(samples)
+        except Exception:
+            LOG.exception("Pipeline %(pipeline)s: Continue after "
+                          "error from publisher %(pub)s",
+                          {'pipeline': self, 'pub': p})
 
     @staticmethod
     def flush():
@@ -101,6 +125,10 @@ class SampleSink(base.Sink):
 class SamplePipeline(base.Pipeline):
     """Represents a pipeline for Samples."""
 
+    @staticmethod
+    def routing_key(sample):
+        return sample.name
+
     def _validate_volume(self, s):
         volume = s.volume
         if volume is None:
@@ -130,6 +158,8 @@ class SamplePipeline(base.Pipeline):
                 return False
         return True
 
+    validate = _validate_volume
+
     def publish_data(self, samples):
         if not isinstance(samples, list):
             samples = [samples]
@@ -137,8 +167,14 @@ class SamplePipeline(base.Pipeline):
                      and self._validate_volume(s)]
         self.sink.publish_samples(supported)
 
+    def publish_supported(self, samples):
+        self.sink.publish_samples(samples)
+
     def supported(self, sample):
-        return self.source.support_meter(sample.name)
+        return self.supports(sample.name)
+
+    def supports(self, name):
+        return self.source.support_meter(name)
 
 
 class SamplePipelineManager(base.PipelineManager):
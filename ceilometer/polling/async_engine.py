@@ -0,0 +1,106 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Asyncio engine running the asynchronous pollsters.
+
+A pollster is asynchronous when its get_samples method is a coroutine
+function or an asynchronous generator function. The engine runs them in an
+event loop of its own thread, where they can issue their requests
+concurrently through AsyncEngine.call and AsyncEngine.map, which limit the
+number of requests in flight per endpoint.
+"""
+
+import asyncio
+from concurrent import futures
+import functools
+import inspect
+import threading
+
+
+def is_async(func):
+    """Return True if func is run by the asynchronous engine."""
+    return (inspect.iscoroutinefunction(func) or
+            inspect.isasyncgenfunction(func))
+
+
+class AsyncEngine:
+    """Event loop running the asynchronous pollsters.
+
+    :param endpoint_concurrency: number of requests in flight per endpoint.
+    :param threads: number of threads running the blocking calls.
+    """
+
+    def __init__(self, endpoint_concurrency, threads):
+        self.endpoint_concurrency = endpoint_concurrency
+        self._limits = {}
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='Async-pollster')
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='Async-pollster-loop',
+                                        daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        """Run the coroutine in the event loop and return its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def get_samples(self, pollster, manager, cache, resources):
+        """Run an asynchronous pollster and return its samples."""
+        return self.run(self._collect(pollster.get_samples(
+            manager=manager, cache=cache, resources=resources)))
+
+    @staticmethod
+    async def _collect(samples):
+        if inspect.isasyncgen(samples):
+            return [s async for s in samples]
+        return list(await samples or [])
+
+    def _limit(self, endpoint):
+        # NOTE: only called from the event loop thread.
+        limit = self._limits.get(endpoint)
+        if limit is None:
+            limit = self._limits[endpoint] = asyncio.Semaphore(
+                self.endpoint_concurrency)
+        return limit
+
+    async def call(self, endpoint, func, *args, **kwargs):
+        """Call func, waiting for a free slot of the endpoint.
+
+        Blocking functions are run in the threads of the engine, while
+        coroutine functions are awaited.
+
+        :param endpoint: hashable identifying the server receiving the
+                         request, for example its URL.
+        """
+        async with self._limit(endpoint):
+            if inspect.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            return await self._loop.run_in_executor(
+                None, functools.partial(func, *args, **kwargs))
+
+    async def map(self, endpoint, func, items, return_exceptions=False):
+        """Call func on each item concurrently.
+
+        :return: the results in the order of the items, or the exceptions
+                 raised for them if return_exceptions is True.
+        """
+        return await asyncio.gather(
+            *(self.call(endpoint, func, item) for item in items),
+            return_exceptions=return_exceptions)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+        self._loop.close()
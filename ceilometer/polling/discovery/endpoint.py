@@ -28,6 +28,9 @@ class EndpointDiscovery(plugin.DiscoveryBase):
     at once.
     """
 
+    # The service catalog rarely changes, it is not requested every cycle.
+    CACHE_TTL = 300
+
     def discover(self, manager, param=None):
         endpoints = keystone_client.get_urls(
             manager.keystone, service_type=param,
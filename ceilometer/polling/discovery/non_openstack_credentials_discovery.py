@@ -33,6 +33,9 @@ class NonOpenStackCredentialsDiscovery(EndpointDiscovery):
 
     BARBICAN_URL_GET_PAYLOAD_PATTERN = "/v1/secrets/%s/payload"
 
+    # The secrets are read again every cycle, to follow their rotation.
+    CACHE_TTL = 0
+
     def discover(self, manager, param=None):
         barbican_secret = "No secrets found"
         if not param:
@@ -16,13 +16,17 @@
 
 import collections
 import glob
+import hashlib
 import itertools
+import json
 import logging
+import math
 import os
 import queue
 import random
 import socket
 import threading
+import time
 import uuid
 
 from concurrent import futures
@@ -43,9 +47,11 @@ from ceilometer import cache_utils
 from ceilometer import declarative
 from ceilometer import keystone_client
 from ceilometer import messaging
+from ceilometer.polling import async_engine
 from ceilometer.polling import dynamic_pollster
 from ceilometer.polling import plugin_base
 from ceilometer.polling import prom_exporter
+from ceilometer.polling import sender
 from ceilometer.publisher import utils as publisher_utils
 from ceilometer import utils
 
@@ -60,6 +66,20 @@ POLLING_OPTS = [
                default=None,
                help="Path to directory where socket file for polling "
                     "heartbeat will be created."),
+    cfg.StrOpt('heartbeat_report_format',
+               default='text',
+               choices=[('text', 'One line per pollster with the time of '
+                                 'its last run.'),
+                        ('json', 'JSON document with the statistics of '
+                                 'the runs of the pollsters and of the '
+                                 'polling cycles.')],
+               help='Format of the status report served by the heartbeat '
+                    'socket.'),
+    cfg.IntOpt('heartbeat_stats_window',
+               default=100,
+               min=1,
+               help='Number of runs of each pollster the percentiles of '
+                    'the JSON heartbeat report are computed from.'),
     cfg.StrOpt('partitioning_group_prefix',
                deprecated_group='central',
                help='Work-load partitioning group prefix. Use only if you '
@@ -73,6 +93,27 @@ POLLING_OPTS = [
                     'Set to 0 to disable. When prometheus exporter feature '
                     'is used, this should be largered than maximum number of '
                     'samples per metric.'),
+    cfg.IntOpt('sender_queue_size',
+               default=0,
+               min=0,
+               help='Number of samples waiting to be sent to the '
+                    'notification agent by a background sender, which '
+                    'drops the oldest samples when its queue is full. Set '
+                    'to 0 to send the samples from the polling threads. '
+                    'When the background sender is used, batch_size is '
+                    'the maximum number of samples per message, 0 meaning '
+                    'no limit.'),
+    cfg.IntOpt('batch_max_bytes',
+               default=1048576,
+               min=0,
+               help='Maximum encoded size of the samples of a message sent '
+                    'by the background sender, in bytes. Set to 0 for no '
+                    'limit.'),
+    cfg.FloatOpt('batch_max_delay',
+                 default=1.0,
+                 min=0,
+                 help='Maximum number of seconds a sample waits in the '
+                      'background sender before being sent.'),
     cfg.MultiStrOpt('pollsters_definitions_dirs',
                     default=["/etc/ceilometer/pollsters.d"],
                     help="List of directories with YAML files used "
@@ -131,7 +172,82 @@ POLLING_OPTS = [
                     'thread might not take full advantage of the discovery '
                     'cache and pollsters cache processes; it is possible '
                     'though to improve/use pollsters that synchronize '
-                    'themselves in the cache objects.'),
+                    'themselves in the cache objects, like the compute '
+                    'pollsters do.'),
+    cfg.IntOpt('pollster_threads',
+               default=0,
+               min=0,
+               help='Number of threads of a pool shared by the polling '
+                    'tasks of the agent and kept across polling cycles to '
+                    'run the pollsters. The sources of a polling task are '
+                    'then polled concurrently, each running at most '
+                    'threads_to_process_pollsters pollsters at once, 0 '
+                    'meaning no limit. The value zero (0) means that the '
+                    'sources are polled one after the other, with threads '
+                    'created for each of them, and that the pool of the '
+                    'staggered scheduling mode has the default size of the '
+                    'Python thread pools.'),
+    cfg.IntOpt('workers',
+               default=1,
+               min=1,
+               help='Number of polling processes. The pollsters are split '
+                    'between the processes, a pollster used by several '
+                    'sources being polled by a single process, and the '
+                    'processes share the resources they discover during a '
+                    'polling cycle.'),
+    cfg.StrOpt('scheduling_mode',
+               default='immediate',
+               choices=[('immediate', 'Start all the pollsters of a '
+                                      'polling task at the beginning of '
+                                      'its cycle.'),
+                        ('staggered', 'Start each pollster at an offset '
+                                      'of the cycle derived from the host '
+                                      'and pollster names, so the agents '
+                                      'of the cloud do not poll at the '
+                                      'same time. The compute pollsters '
+                                      'calling the same inspector method '
+                                      'share the same offset.')],
+               help='How the pollsters are started within a polling '
+                    'cycle.'),
+    cfg.FloatOpt('stagger_window',
+                 default=0.8,
+                 min=0,
+                 max=1,
+                 help='Fraction of the polling interval over which the '
+                      'pollsters are spread in staggered scheduling mode, '
+                      'leaving the rest of the interval for the last '
+                      'pollsters to complete.'),
+    cfg.StrOpt('overrun_policy',
+               default='coalesce',
+               choices=[('coalesce', 'Run the cycles which were due while '
+                                     'the previous cycle of the polling '
+                                     'task was still running once, as soon '
+                                     'as it completes.'),
+                        ('skip', 'Do not run the cycles which were due '
+                                 'while the previous cycle of the polling '
+                                 'task was still running.'),
+                        ('run', 'Run the cycles of a polling task when '
+                                'they are due, even if the previous cycle '
+                                'is still running.')],
+               help='What to do when a polling cycle is due while the '
+                    'previous cycle of the same polling task is still '
+                    'running.'),
+    cfg.IntOpt('async_endpoint_concurrency',
+               default=10,
+               min=1,
+               help='Number of concurrent requests the asynchronous '
+                    'pollsters can send to a same endpoint.'),
+    cfg.IntOpt('async_threads',
+               default=64,
+               min=1,
+               help='Number of threads running the blocking calls of the '
+                    'asynchronous pollsters.'),
+    cfg.IntOpt('blacklist_ttl',
+               default=0,
+               min=0,
+               help='Number of seconds after which the resources a '
+                    'pollster stopped polling after a permanent error are '
+                    'polled again. 0 means they are never polled again.'),
 ]
 
 
@@ -149,12 +265,180 @@ class HeartBeatException(agent.ConfigException):
         super().__init__('Polling', message, cfg)
 
 
+class ResourceIndex:
+    """Set of resources indexed by their identity key.
+
+    Resources which cannot be keyed are kept in a list and compared with
+    each other.
+
+    :param ttl: number of seconds after which the resources are forgotten,
+                0 or None to keep them forever.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._keys = {}
+        self._unkeyed = []
+
+    def __len__(self):
+        return len(self._keys) + len(self._unkeyed)
+
+    def __contains__(self, resource):
+        now = time.monotonic() if self.ttl else None
+        try:
+            key = plugin_base.resource_key(resource)
+        except TypeError:
+            pass
+        else:
+            if key in self._keys:
+                expiry = self._keys[key]
+                if expiry is None or expiry > now:
+                    return True
+                del self._keys[key]
+        for i, (r, expiry) in enumerate(self._unkeyed):
+            if resource == r:
+                if expiry is None or expiry > now:
+                    return True
+                del self._unkeyed[i]
+                return False
+        return False
+
+    def add(self, resource):
+        expiry = time.monotonic() + self.ttl if self.ttl else None
+        try:
+            self._keys[plugin_base.resource_key(resource)] = expiry
+        except TypeError:
+            self._unkeyed.append((resource, expiry))
+
+    def extend(self, resources):
+        for resource in resources:
+            self.add(resource)
+
+
+class DiscoveryCache:
+    """Resources discovered by the agent, reused across polling cycles.
+
+    The lookups of a discovery in progress wait for its result instead of
+    discovering the resources again.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pending = {}
+
+    def get(self, url, ttl, discover):
+        """Return the resources of the discovery.
+
+        :param url: the discovery URL.
+        :param ttl: number of seconds to reuse the discovered resources for.
+        :param discover: function discovering the resources.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            future = self._pending.get(url)
+            if future is None:
+                self.misses += 1
+                future = self._pending[url] = futures.Future()
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        if not owner:
+            return future.result()
+
+        try:
+            resources = discover()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[url]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[url]
+            if ttl:
+                self._entries[url] = (time.monotonic() + ttl, resources)
+        future.set_result(resources)
+        return resources
+
+
+class BoundedExecutor:
+    """Submit functions to an executor, running at most limit at once.
+
+    The functions over the limit wait in a queue of their own, so the
+    functions of several bounded executors sharing an executor are run in
+    turn.
+
+    :param executor: executor running the functions.
+    :param limit: number of functions running at once, 0 for no limit.
+    """
+
+    def __init__(self, executor, limit):
+        self._executor = executor
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._waiting = collections.deque()
+        self._running = 0
+
+    def submit(self, fn, *args, **kwargs):
+        future = futures.Future()
+        with self._lock:
+            if self._limit and self._running >= self._limit:
+                self._waiting.append((future, fn, args, kwargs))
+                return future
+            self._running += 1
+        self._start(future, fn, args, kwargs)
+        return future
+
+    def _start(self, future, fn, args, kwargs):
+        try:
+            inner = self._executor.submit(fn, *args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            self._done()
+            return
+        inner.add_done_callback(
+            lambda inner: self._finish(future, inner))
+
+    def _finish(self, future, inner):
+        if inner.cancelled():
+            # NOTE: the pool is shutting down and runs this callback while
+            # holding its lock, so the waiting calls are cancelled as well
+            # instead of being submitted to it.
+            with self._lock:
+                waiting, self._waiting = self._waiting, collections.deque()
+                self._running -= 1
+            future.cancel()
+            for call in waiting:
+                call[0].cancel()
+            return
+        if inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        self._done()
+
+    def _done(self):
+        with self._lock:
+            if not self._waiting:
+                self._running -= 1
+                return
+            next_call = self._waiting.popleft()
+        self._start(*next_call)
+
+
 class Resources:
     def __init__(self, agent_manager):
         self.agent_manager = agent_manager
         self._resources = []
         self._discovery = []
-        self.blacklist = []
+        self.blacklist = ResourceIndex(
+            agent_manager.conf.polling.blacklist_ttl)
 
     def setup(self, source):
         self._resources = source.resources
@@ -181,6 +465,48 @@ class Resources:
         return f'{source_name}-{pollster.name}'
 
 
+def flush_pollsters(pollsters):
+    """Let the pollsters save the state they keep across polling cycles."""
+    for pollster in pollsters:
+        try:
+            pollster.obj.flush()
+        except Exception:
+            LOG.exception("Failed to flush the pollster %s", pollster.name)
+
+
+def stagger_offset(host, name, interval, window):
+    """Return the offset of a pollster within its polling cycle.
+
+    The offset is derived from a hash of the host and pollster names, so it
+    is stable across restarts and spread across the agents of the cloud.
+    """
+    digest = hashlib.sha256(f'{host}:{name}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * interval * window
+
+
+def percentiles(values):
+    """Return the median, 90th and 99th percentiles and maximum of values.
+
+    The percentiles are computed with the nearest-rank method, they are
+    None when there is no value.
+    """
+    values = sorted(values)
+    report = {}
+    for name, rank in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+        report[name] = (values[math.ceil(len(values) * rank / 100) - 1]
+                        if values else None)
+    return report
+
+
+def pollster_group(pollster):
+    """Return the name of the group of a pollster.
+
+    The compute pollsters calling the same inspector method share its
+    results, they are grouped so they run close together in time.
+    """
+    return getattr(pollster.obj, 'inspector_method', None) or pollster.name
+
+
 def iter_random(iterable):
     """Iter over iterable in a random fashion."""
     lst = list(iterable)
@@ -216,19 +542,110 @@ class PollingTask:
 
         # element that provides a map between source names and source object
         self.sources_map = dict()
+        self.interval = None
+        # spread of the start times of the pollsters in the last staggered
+        # cycle, in seconds
+        self.spread = None
+
+        # statistics of the polling cycles
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.duration = None
+        self._cycle_lock = threading.Lock()
+        self._cycle_threads = set()
+        self._pending = False
+        self._history_lock = threading.Lock()
 
     def add(self, pollster, source):
         self.sources_map[source.name] = source
+        self.interval = source.get_interval()
 
         self.pollster_matches[source.name].add(pollster)
         key = Resources.key(source.name, pollster)
         self.resources[key].setup(source)
 
+    def trigger(self, run_cycle):
+        """Start a polling cycle, applying the overrun policy.
+
+        The cycle is run in a thread of its own. When the previous cycle is
+        still running, the new one is run concurrently, skipped, or run
+        once the previous one completes, depending on the overrun policy.
+
+        :param run_cycle: function running a polling cycle of the task.
+        """
+        policy = self.manager.conf.polling.overrun_policy
+        with self._cycle_lock:
+            if self._cycle_threads and policy != 'run':
+                self.overruns += 1
+                if policy == 'skip' or self._pending:
+                    self.skipped += 1
+                self._pending = policy == 'coalesce'
+                LOG.warning("The previous cycle of the %(interval)d seconds "
+                            "polling task is still running, %(action)s the "
+                            "new cycle.",
+                            {'interval': self.interval,
+                             'action': ('postponing' if self._pending
+                                        else 'skipping')})
+                return
+            if self._cycle_threads:
+                self.overruns += 1
+                LOG.warning("The previous cycle of the %d seconds polling "
+                            "task is still running, starting the new cycle "
+                            "concurrently.", self.interval)
+            thread = threading.Thread(target=self._run_cycles,
+                                      args=(run_cycle,), daemon=True)
+            self._cycle_threads.add(thread)
+        thread.start()
+
+    def _run_cycles(self, run_cycle):
+        while True:
+            start = time.monotonic()
+            try:
+                run_cycle(self)
+            except Exception:
+                LOG.exception("Polling cycle of the %d seconds polling task "
+                              "failed.", self.interval)
+            duration = time.monotonic() - start
+            self.flush()
+            with self._cycle_lock:
+                self.cycles += 1
+                self.duration = duration
+                pending, self._pending = self._pending, False
+                if not pending:
+                    self._cycle_threads.discard(threading.current_thread())
+            LOG.debug("Cycle of the %(interval)d seconds polling task took "
+                      "%(duration).3f seconds.",
+                      {'interval': self.interval, 'duration': duration})
+            self.manager.report_cycle(self)
+            if not pending:
+                return
+
+    def flush(self):
+        """Let the pollsters of the task save their state."""
+        flush_pollsters({pollster.name: pollster
+                         for pollsters in self.pollster_matches.values()
+                         for pollster in pollsters}.values())
+
+    def join(self):
+        """Wait for the running polling cycles to complete."""
+        with self._cycle_lock:
+            threads = list(self._cycle_threads)
+        for thread in threads:
+            thread.join()
+
     def poll_and_notify(self):
         """Polling sample and notify."""
         cache = {}
         discovery_cache = {}
         poll_history = {}
+        if self.manager.conf.polling.scheduling_mode == 'staggered':
+            self.execute_staggered_polling(cache, discovery_cache,
+                                           poll_history)
+            return
+        if self.manager.conf.polling.pollster_threads:
+            self.execute_shared_polling(cache, discovery_cache, poll_history)
+            return
         for source_name, pollsters in iter_random(
                 self.pollster_matches.items()):
             self.execute_polling_task_processing(cache, discovery_cache,
@@ -237,7 +654,8 @@ class PollingTask:
 
     def execute_polling_task_processing(self, cache, discovery_cache,
                                         poll_history, pollsters, source_name):
-        all_pollsters = list(pollsters)
+        all_pollsters = sorted(pollsters,
+                               key=lambda p: (pollster_group(p), p.name))
         number_workers_for_pollsters =\
             self.manager.conf.polling.threads_to_process_pollsters
 
@@ -272,14 +690,72 @@ class PollingTask:
         for s in all_pollster_scheduled:
             LOG.debug(s.result())
 
+    def execute_shared_polling(self, cache, discovery_cache, poll_history):
+        limit = self.manager.conf.polling.threads_to_process_pollsters
+        all_pollster_scheduled = []
+        for source_name, pollsters in iter_random(
+                self.pollster_matches.items()):
+            executor = BoundedExecutor(self.manager.pollster_executor, limit)
+            for pollster in sorted(pollsters, key=lambda p: (
+                    pollster_group(p), p.name)):
+                all_pollster_scheduled.append(
+                    self.register_pollster_execution(
+                        cache, discovery_cache, executor, poll_history,
+                        pollster, source_name))
+
+        for s in all_pollster_scheduled:
+            LOG.debug(s.result())
+
+    def execute_staggered_polling(self, cache, discovery_cache,
+                                  poll_history):
+        conf = self.manager.conf
+        schedule = sorted(
+            ((stagger_offset(conf.host, pollster_group(pollster),
+                             self.interval, conf.polling.stagger_window),
+              source_name, pollster)
+             for source_name, pollsters in self.pollster_matches.items()
+             for pollster in pollsters),
+            key=lambda item: (item[0], item[1], item[2].name))
+        executor = BoundedExecutor(self.manager.pollster_executor,
+                                   conf.polling.threads_to_process_pollsters)
+
+        start = time.monotonic()
+        # NOTE: the pollsters record when they actually start, as they may
+        # wait for a thread of the pool.
+        delays = []
+        all_pollster_scheduled = []
+        for offset, source_name, pollster in schedule:
+            if self.manager.wait_stopping(start + offset - time.monotonic()):
+                LOG.debug("Stopping staggered polling of the %d seconds "
+                          "polling task.", self.interval)
+                break
+            all_pollster_scheduled.append(
+                self.register_pollster_execution(
+                    cache, discovery_cache, executor, poll_history,
+                    pollster, source_name,
+                    on_start=lambda: delays.append(time.monotonic() - start)))
+
+        for s in all_pollster_scheduled:
+            LOG.debug(s.result())
+
+        if delays:
+            self.spread = max(delays) - min(delays)
+            LOG.info("Started %(count)d pollsters of the %(interval)d "
+                     "seconds polling task over %(spread).1f seconds.",
+                     {'count': len(delays), 'interval': self.interval,
+                      'spread': self.spread})
+
     def register_pollster_execution(self, cache, discovery_cache, executor,
-                                    poll_history, pollster, source_name):
+                                    poll_history, pollster, source_name,
+                                    on_start=None):
         LOG.debug("Registering pollster [%s] from source [%s] to be executed "
                   "via executor [%s] with cache [%s], pollster history [%s], "
                   "and discovery cache [%s].", pollster, source_name, executor,
                   cache, poll_history, discovery_cache)
 
         def _internal_function():
+            if on_start is not None:
+                on_start()
             self._internal_pollster_run(cache, discovery_cache, poll_history,
                                         pollster, source_name)
             return "Finished processing pollster [%s]." % pollster.name
@@ -288,6 +764,7 @@ class PollingTask:
 
     def _internal_pollster_run(self, cache, discovery_cache, poll_history,
                                pollster, source_name):
+        start = time.monotonic()
         key = Resources.key(source_name, pollster)
         candidate_res = list(
             self.resources[key].get(discovery_cache))
@@ -300,18 +777,21 @@ class PollingTask:
             candidate_res = self.manager.discover(
                 [pollster.obj.default_discovery], discovery_cache)
 
-        # Remove duplicated resources and black resources. Using
-        # set() requires well defined __hash__ for each resource.
-        # Since __eq__ is defined, 'not in' is safe here.
+        # Remove duplicated resources and black resources.
         polling_resources = []
         black_res = self.resources[key].blacklist
-        history = poll_history.get(pollster.name, [])
-        for x in candidate_res:
-            if x not in history:
-                history.append(x)
-                if x not in black_res:
-                    polling_resources.append(x)
-        poll_history[pollster.name] = history
+        # NOTE: sources polled concurrently may share pollsters.
+        with self._history_lock:
+            history = poll_history.get(pollster.name)
+            if history is None:
+                history = poll_history[pollster.name] = ResourceIndex()
+            for x in candidate_res:
+                if x not in history:
+                    history.add(x)
+                    if x not in black_res:
+                        polling_resources.append(x)
+
+        discovery_time = time.monotonic() - start
 
         if self.manager.conf.polling.enable_prometheus_exporter:
             prom_exporter.purge_stale_metrics(pollster.name)
@@ -327,6 +807,7 @@ class PollingTask:
         LOG.info("Polling pollster %(poll)s in the context of "
                  "%(src)s",
                  dict(poll=pollster.name, src=source_name))
+        stats = None
         try:
             source_obj = self.sources_map[source_name]
             coordination_group_name = source_obj.group_for_coordination
@@ -359,17 +840,44 @@ class PollingTask:
                           "the following [%s].", pollster,
                           self.manager.hashrings)
 
+            stats = {'discovery_time': discovery_time,
+                     'inspection_time': 0,
+                     'send_time': 0,
+                     'resources': len(polling_resources),
+                     'samples': 0,
+                     'batches': 0,
+                     'errors': 0}
+            inspection_start = time.monotonic()
+
+            def send(batch):
+                send_start = time.monotonic()
+                self._send_notification(batch)
+                stats['send_time'] += time.monotonic() - send_start
+                # NOTE: the background sender batches the samples of all
+                # the pollsters again, it counts the messages it sends.
+                if self.manager.sample_sender is None:
+                    stats['batches'] += 1
+
             polling_timestamp = timeutils.utcnow().isoformat()
-            samples = pollster.obj.get_samples(
-                manager=self.manager,
-                cache=cache,
-                resources=polling_resources
-            )
+            if async_engine.is_async(pollster.obj.get_samples):
+                samples = self.manager.async_engine.get_samples(
+                    pollster.obj,
+                    manager=self.manager,
+                    cache=cache,
+                    resources=polling_resources
+                )
+            else:
+                samples = pollster.obj.get_samples(
+                    manager=self.manager,
+                    cache=cache,
+                    resources=polling_resources
+                )
             sample_batch = []
 
             self.manager.heartbeat(pollster.name, polling_timestamp)
 
             for sample in samples:
+                stats['samples'] += 1
                 # Note(yuywz): Unify the timestamp of polled samples
                 sample.set_timestamp(polling_timestamp)
 
@@ -414,14 +922,14 @@ class PollingTask:
                     ))
                 if self._batch_size:
                     if len(sample_batch) >= self._batch_size:
-                        self._send_notification(sample_batch)
+                        send(sample_batch)
                         sample_batch = []
                     sample_batch.append(sample_dict)
                 else:
-                    self._send_notification([sample_dict])
+                    send([sample_dict])
 
             if sample_batch:
-                self._send_notification(sample_batch)
+                send(sample_batch)
 
             LOG.info("Finished polling pollster %(poll)s in the "
                      "context of %(src)s", dict(poll=pollster.name,
@@ -434,18 +942,25 @@ class PollingTask:
                      res_list=str(err.fail_res_list),
                      source=source_name))
             self.resources[key].blacklist.extend(err.fail_res_list)
+            if stats is not None:
+                stats['errors'] += 1
         except Exception as err:
             LOG.exception(
                 'Continue after error from %(name)s: %(error)s',
                 {'name': pollster.name, 'error': err})
+            if stats is not None:
+                stats['errors'] += 1
+        if stats is not None:
+            stats['inspection_time'] = (time.monotonic() - inspection_start -
+                                        stats['send_time'])
+            self.manager.report_pollster(pollster.name, stats)
 
     def _send_notification(self, samples):
         if self.manager.conf.polling.enable_notifications:
-            self.manager.notifier.sample(
-                {},
-                'telemetry.polling',
-                {'samples': samples}
-            )
+            if self.manager.sample_sender is not None:
+                self.manager.sample_sender.put(samples)
+            else:
+                self.manager.send_samples(samples)
         if self.manager.conf.polling.enable_prometheus_exporter:
             prom_exporter.collect_metrics(samples)
 
@@ -467,6 +982,8 @@ class AgentHeartBeatManager(cotyledon.Service):
         self._lock = threading.Lock()
         self._queue = queue
         self._status = dict()
+        self._cycles = dict()
+        self._executions = dict()
         self._sock_pth = os.path.join(
             conf.polling.heartbeat_socket_dir,
             f"ceilometer-{'-'.join(sorted(namespaces))}.socket"
@@ -497,6 +1014,23 @@ class AgentHeartBeatManager(cotyledon.Service):
 
     def _update_status(self):
         hb = self._queue.get()
+        if 'task' in hb:
+            with self._lock:
+                self._cycles[hb['task']] = hb['stats']
+            LOG.debug("Updated polling cycle statistics for %s %s",
+                      hb['task'], hb['stats'])
+            return
+        if 'execution' in hb:
+            with self._lock:
+                executions = self._executions.get(hb['execution'])
+                if executions is None:
+                    executions = self._executions[hb['execution']] = (
+                        collections.deque(
+                            maxlen=self.conf.polling.heartbeat_stats_window))
+                executions.append(hb['stats'])
+            LOG.debug("Updated execution statistics for %s %s",
+                      hb['execution'], hb['stats'])
+            return
         with self._lock:
             self._status[hb['pollster']] = hb['timestamp']
         LOG.debug("Updated heartbeat for %s %s",
@@ -506,12 +1040,30 @@ class AgentHeartBeatManager(cotyledon.Service):
         s, addr = self._sock.accept()
         LOG.debug("Heartbeat status report requested at %s", self._sock_pth)
         with self._lock:
-            out = '\n'.join([f"{k} {v}"
-                             for k, v in self._status.items()])
+            if self.conf.polling.heartbeat_report_format == 'json':
+                out = json.dumps(self._report(), sort_keys=True)
+            else:
+                out = '\n'.join([f"{k} {v}"
+                                 for k, v in self._status.items()])
         s.sendall(out.encode('utf-8'))
         s.close()
         LOG.debug("Reported heartbeat status:\n%s", out)
 
+    def _report(self):
+        # NOTE: called with the lock held.
+        pollsters = {}
+        for name in set(self._status) | set(self._executions):
+            executions = self._executions.get(name, ())
+            report = pollsters[name] = {
+                'timestamp': self._status.get(name),
+                'runs': len(executions),
+                'errors': sum(e['errors'] for e in executions),
+            }
+            for stat in ('discovery_time', 'inspection_time', 'send_time',
+                         'resources', 'samples', 'batches'):
+                report[stat] = percentiles([e[stat] for e in executions])
+        return {'pollsters': pollsters, 'tasks': self._cycles}
+
     def run(self):
         super().run()
 
@@ -535,7 +1087,8 @@ class AgentHeartBeatManager(cotyledon.Service):
 
 class AgentManager(cotyledon.Service):
 
-    def __init__(self, worker_id, conf, namespaces=None, queue=None):
+    def __init__(self, worker_id, conf, namespaces=None, queue=None,
+                 shared_discovery_cache=None):
         namespaces = namespaces or ['compute', 'central']
         group_prefix = conf.polling.partitioning_group_prefix
 
@@ -543,6 +1096,18 @@ class AgentManager(cotyledon.Service):
 
         self.conf = conf
         self._queue = queue
+        self._workers = conf.polling.workers
+        # NOTE: the discovered resources are shared between the workers
+        # through a dict, for at most one cycle of the fastest polling task.
+        self._shared_discovery_cache = shared_discovery_cache
+        self._shared_discovery_ttl = 0
+        self.discovery_cache = DiscoveryCache()
+        self.polling_manager = None
+        self._async_engine = None
+        self._async_engine_lock = threading.Lock()
+        self._pollster_executor = None
+        self._pollster_executor_lock = threading.Lock()
+        self._stopping = threading.Event()
 
         if type(namespaces) is not list:
             namespaces = [namespaces]
@@ -579,6 +1144,7 @@ class AgentManager(cotyledon.Service):
                        for namespace in namespaces)
         self.discoveries = list(itertools.chain(*list(discoveries)))
         self.polling_periodics = None
+        self.polling_tasks = {}
 
         self.hashrings = None
         self.partition_coordinator = None
@@ -593,6 +1159,12 @@ class AgentManager(cotyledon.Service):
         namespace_prefix = '-'.join(sorted(namespaces))
         self.group_prefix = (f'{namespace_prefix}-{group_prefix}'
                              if group_prefix else namespace_prefix)
+        # NOTE: the workers of a same index poll the same pollsters on all
+        # the agents, so they partition the resources between them only.
+        self._shard_suffix = ''
+        if self._workers > 1:
+            self._shard_suffix = f'-worker{self.worker_id}'
+            self.group_prefix += self._shard_suffix
 
         if self.conf.polling.enable_notifications:
             self.notifier = oslo_messaging.Notifier(
@@ -600,6 +1172,16 @@ class AgentManager(cotyledon.Service):
                 driver=self.conf.publisher_notifier.telemetry_driver,
                 publisher_id="ceilometer.polling")
 
+        self.sample_sender = None
+        if (self.conf.polling.enable_notifications and
+                self.conf.polling.sender_queue_size):
+            self.sample_sender = sender.SampleSender(
+                self.send_samples,
+                self.conf.polling.sender_queue_size,
+                self.conf.polling.batch_size,
+                self.conf.polling.batch_max_bytes,
+                self.conf.polling.batch_max_delay)
+
         if self.conf.polling.enable_prometheus_exporter:
             for addr in self.conf.polling.prometheus_listen_addresses:
                 address = netutils.parse_host_port(addr)
@@ -623,6 +1205,42 @@ class AgentManager(cotyledon.Service):
         self._keystone = None
         self._keystone_last_exception = None
 
+    def send_samples(self, samples):
+        """Send the samples to the notification agent."""
+        self.notifier.sample({}, 'telemetry.polling', {'samples': samples})
+
+    def report_pollster(self, name, stats):
+        """Report the statistics of a run of a pollster."""
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait({'execution': name, 'stats': stats})
+            except queue.Full:
+                LOG.warning("Heartbeat queue full. Update failed: %s %s",
+                            name, stats)
+
+    def report_cycle(self, task):
+        """Report the statistics of the polling cycles of a task."""
+        name = f'polling-task-{task.interval}{self._shard_suffix}'
+        stats = {'duration': task.duration,
+                 'cycles': task.cycles,
+                 'overruns': task.overruns,
+                 'skipped': task.skipped,
+                 'discovery_hits': self.discovery_cache.hits,
+                 'discovery_misses': self.discovery_cache.misses,
+                 'sender_batches': 0,
+                 'sender_dropped': 0}
+        if self.sample_sender is not None:
+            stats['sender_batches'] = self.sample_sender.batches
+            stats['sender_dropped'] = self.sample_sender.dropped
+        if self.conf.polling.enable_prometheus_exporter:
+            prom_exporter.collect_cycle_metrics(name, stats)
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait({'task': name, 'stats': stats})
+            except queue.Full:
+                LOG.warning("Heartbeat queue full. Update failed: %s %s",
+                            name, stats)
+
     def heartbeat(self, name, timestamp):
         """Send heartbeat data if the agent is configured to do so."""
         if self._queue is not None:
@@ -806,8 +1424,8 @@ class AgentManager(cotyledon.Service):
                 group_prefix = p.name
                 generated_group_id = eval(p.group_id_coordination_expression)
 
-                group_for_coordination = "{}-{}".format(
-                    group_prefix, generated_group_id)
+                group_for_coordination = "{}-{}{}".format(
+                    group_prefix, generated_group_id, self._shard_suffix)
                 dynamic_pollster_groups_for_coordination.add(
                     group_for_coordination)
 
@@ -829,16 +1447,32 @@ class AgentManager(cotyledon.Service):
         LOG.debug("Hashrings [%s] created for pollsters definition.",
                   self.hashrings)
 
+    def _shard(self, matches):
+        """Return the pairs of sources and pollsters of this worker.
+
+        The pollster names are sorted and dealt between the workers, so every
+        worker computes the same disjoint shards from the same config, and a
+        pollster used by several sources is polled by a single worker.
+        """
+        if self._workers <= 1:
+            return matches
+        names = sorted({pollster.name for source, pollster in matches})
+        names = set(names[self.worker_id % self._workers::self._workers])
+        return [(source, pollster) for source, pollster in matches
+                if pollster.name in names]
+
     def setup_polling_tasks(self):
         polling_tasks = {}
-        for source in self.polling_manager.sources:
-            for pollster in self.extensions:
-                if source.support_meter(pollster.name):
-                    polling_task = polling_tasks.get(source.get_interval())
-                    if not polling_task:
-                        polling_task = PollingTask(self)
-                        polling_tasks[source.get_interval()] = polling_task
-                    polling_task.add(pollster, source)
+        matches = [(source, pollster)
+                   for source in self.polling_manager.sources
+                   for pollster in self.extensions
+                   if source.support_meter(pollster.name)]
+        for source, pollster in self._shard(matches):
+            polling_task = polling_tasks.get(source.get_interval())
+            if not polling_task:
+                polling_task = PollingTask(self)
+                polling_tasks[source.get_interval()] = polling_task
+            polling_task.add(pollster, source)
         return polling_tasks
 
     def construct_group_id(self, discovery_group_id):
@@ -851,6 +1485,10 @@ class AgentManager(cotyledon.Service):
         if not data or len(data) == 0:
             return
 
+        self._shared_discovery_ttl = min(data)
+        self._stopping.clear()
+        self.polling_tasks = data
+
         # One thread per polling tasks is enough
         self.polling_periodics = periodics.PeriodicWorker.create(
             [], executor_factory=lambda:
@@ -859,7 +1497,7 @@ class AgentManager(cotyledon.Service):
         for interval, polling_task in data.items():
             @periodics.periodic(spacing=interval, run_immediately=True)
             def task(running_task):
-                self.interval_task(running_task)
+                running_task.trigger(self.interval_task)
 
             self.polling_periodics.add(task, polling_task)
 
@@ -875,10 +1513,37 @@ class AgentManager(cotyledon.Service):
 
     def terminate(self):
         self.stop_pollsters_tasks()
+        flush_pollsters(self.extensions)
         if self.partition_coordinator:
             self.partition_coordinator.stop()
+        if self._async_engine is not None:
+            self._async_engine.stop()
+        if self._pollster_executor is not None:
+            self._pollster_executor.shutdown(wait=False)
+        if self.sample_sender is not None:
+            self.sample_sender.stop()
         super().terminate()
 
+    @property
+    def pollster_executor(self):
+        """Pool of threads running the pollsters, started on first use."""
+        with self._pollster_executor_lock:
+            if self._pollster_executor is None:
+                self._pollster_executor = futures.ThreadPoolExecutor(
+                    max_workers=self.conf.polling.pollster_threads or None,
+                    thread_name_prefix="Pollster-executor")
+            return self._pollster_executor
+
+    @property
+    def async_engine(self):
+        """Engine of the asynchronous pollsters, started on first use."""
+        with self._async_engine_lock:
+            if self._async_engine is None:
+                self._async_engine = async_engine.AsyncEngine(
+                    self.conf.polling.async_endpoint_concurrency,
+                    self.conf.polling.async_threads)
+            return self._async_engine
+
     def interval_task(self, task):
         # NOTE(sileht): remove the previous keystone client
         # and exception to get a new one in this polling cycle.
@@ -891,6 +1556,8 @@ class AgentManager(cotyledon.Service):
             self.partition_coordinator.run_watchers()
 
         task.poll_and_notify()
+        LOG.debug("Discovery cache: %d hits, %d misses.",
+                  self.discovery_cache.hits, self.discovery_cache.misses)
 
     @property
     def keystone(self):
@@ -954,7 +1621,9 @@ class AgentManager(cotyledon.Service):
                                 {'name': name, 'service_type': service_type})
                             continue
 
-                    discovered = discoverer.discover(self, param)
+                    discovered = self.discovery_cache.get(
+                        url, self._discovery_ttl(url, name, discoverer),
+                        lambda: self._discover(url, discoverer, param))
 
                     if self.partition_coordinator:
                         discovered = [
@@ -974,11 +1643,48 @@ class AgentManager(cotyledon.Service):
                 LOG.warning('Unknown discovery extension: %s', name)
         return resources
 
+    def _discovery_ttl(self, url, name, discoverer):
+        ttls = (self.polling_manager.discovery_ttl
+                if self.polling_manager else {})
+        return ttls.get(url, ttls.get(name, discoverer.CACHE_TTL))
+
+    def _discover(self, url, discoverer, param):
+        shared = self._shared_discovery_cache
+        if shared is None:
+            return discoverer.discover(self, param)
+
+        now = time.monotonic()
+        try:
+            timestamp, discovered = shared[url]
+        except KeyError:
+            pass
+        else:
+            if now - timestamp < self._shared_discovery_ttl:
+                return discovered
+
+        discovered = list(discoverer.discover(self, param))
+        try:
+            shared[url] = (now, discovered)
+        except Exception as err:
+            LOG.debug('Unable to share resources discovered by %s: %s',
+                      url, err)
+        return discovered
+
+    def wait_stopping(self, timeout):
+        """Wait for timeout seconds, return True if the agent is stopping."""
+        if timeout > 0:
+            return self._stopping.wait(timeout)
+        return self._stopping.is_set()
+
     def stop_pollsters_tasks(self):
+        self._stopping.set()
         if self.polling_periodics:
             self.polling_periodics.stop()
             self.polling_periodics.wait()
         self.polling_periodics = None
+        for polling_task in self.polling_tasks.values():
+            polling_task.join()
+        self.polling_tasks = {}
 
 
 class PollingManager(agent.ConfigManagerBase):
@@ -1016,6 +1722,11 @@ class PollingManager(agent.ConfigManagerBase):
         the meters should be polled. It's optional and it's up to the
         specific pollster to decide how to use it.
 
+        The optional discovery_ttl mapping gives the number of seconds the
+        resources of a discovery, by name or URL, are reused for:
+
+        {"discovery_ttl": {"volumes": 600, "images": 1800}}
+
         """
         super().__init__(conf)
         cfg = self.load_config(conf.polling.cfg_file)
@@ -1025,6 +1736,13 @@ class PollingManager(agent.ConfigManagerBase):
         for s in cfg.get('sources'):
             self.sources.append(PollingSource(s))
 
+        self.discovery_ttl = cfg.get('discovery_ttl') or {}
+        if not isinstance(self.discovery_ttl, dict):
+            raise PollingException("Discovery TTL should be a mapping", cfg)
+        for ttl in self.discovery_ttl.values():
+            if not isinstance(ttl, int) or ttl < 0:
+                raise PollingException("Invalid discovery TTL value", cfg)
+
 
 class PollingSource(agent.Source):
     """Represents a source of pollsters
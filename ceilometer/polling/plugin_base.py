@@ -32,6 +32,26 @@ class ExtensionLoadError(Exception):
         self.msg = msg
 
 
+def resource_key(resource):
+    """Return the identity key of a polled resource.
+
+    Equal resources have equal keys, so resources can be indexed by key
+    instead of being compared with each other. Hashable resources are their
+    own key, while dicts, lists and sets are frozen.
+
+    :raises TypeError: if the resource is neither hashable nor freezable.
+    """
+    if isinstance(resource, dict):
+        return (dict, frozenset((k, resource_key(v))
+                                for k, v in resource.items()))
+    if isinstance(resource, list):
+        return (list, tuple(resource_key(v) for v in resource))
+    if isinstance(resource, set):
+        return frozenset(resource)
+    hash(resource)
+    return resource
+
+
 class PollsterPermanentError(Exception):
     """Permanent error when polling.
 
@@ -94,6 +114,17 @@ class PollsterBase(metaclass=abc.ABCMeta):
                           how to use it. It is usually supplied by a discovery,
                           see ``default_discovery`` for more information.
 
+        The method can also be a coroutine function or an asynchronous
+        generator function, it is then run by the asynchronous engine of
+        the manager, ``manager.async_engine``, which allows sending the
+        requests of the resources concurrently.
+        """
+
+    def flush(self):
+        """Save the state the pollster keeps across polling cycles.
+
+        It is called once all the pollsters of a polling cycle have run, and
+        when the agent terminates.
         """
 
     @classmethod
@@ -128,6 +159,13 @@ class DiscoveryBase(metaclass=abc.ABCMeta):
     KEYSTONE_REQUIRED_FOR_SERVICE = None
     """Service type required in keystone catalog to works"""
 
+    CACHE_TTL = 0
+    """Number of seconds the discovered resources are reused for
+
+    The resources are reused across polling cycles and polling tasks, unless
+    overridden by the discovery_ttl section of the polling definition.
+    """
+
     def __init__(self, conf):
         self.conf = conf
 
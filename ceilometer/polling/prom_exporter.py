@@ -18,6 +18,22 @@ import prometheus_client as prom
 
 CEILOMETER_REGISTRY = prom.CollectorRegistry()
 
+CYCLE_METRICS = {
+    'duration': 'Duration of the last polling cycle, in seconds.',
+    'cycles': 'Number of completed polling cycles.',
+    'overruns': 'Number of polling cycles due while the previous cycle '
+                'was still running.',
+    'skipped': 'Number of polling cycles skipped because the previous '
+               'cycle was still running.',
+    'discovery_hits': 'Number of discoveries whose resources were reused, '
+                      'for the whole agent.',
+    'discovery_misses': 'Number of discoveries run, for the whole agent.',
+    'sender_batches': 'Number of messages sent by the background sender, '
+                      'for the whole agent.',
+    'sender_dropped': 'Number of samples dropped by the background sender, '
+                      'for the whole agent.',
+}
+
 
 def export(prom_iface, prom_port, tls_cert=None, tls_key=None):
     prom.start_http_server(port=prom_port,
@@ -41,6 +57,18 @@ def collect_metrics(samples):
         metric.labels(*labels['values']).set(sample['counter_volume'])
 
 
+def collect_cycle_metrics(task, stats):
+    """Export the statistics of the polling cycles of a polling task."""
+    for stat, documentation in CYCLE_METRICS.items():
+        name = "ceilometer_polling_cycle_" + stat
+        metric = CEILOMETER_REGISTRY._names_to_collectors.get(name, None)
+        if metric is None:
+            metric = prom.Gauge(name=name, documentation=documentation,
+                                labelnames=['task'],
+                                registry=CEILOMETER_REGISTRY)
+        metric.labels(task).set(stats[stat])
+
+
 def purge_stale_metrics(pollster):
     metric_cleared = False
 
@@ -0,0 +1,129 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Background sender of the polled samples.
+
+The polling threads queue their samples, which a thread of the sender
+batches into messages and sends. A message is sent when it holds enough
+samples, when adding another sample would make it too large once encoded,
+or when its oldest sample has been waiting for too long.
+"""
+
+import collections
+import threading
+import time
+
+from oslo_log import log
+from oslo_serialization import jsonutils
+
+LOG = log.getLogger(__name__)
+
+
+class SampleSender:
+    """Batch and send the polled samples in a thread of its own.
+
+    :param send: function sending a list of samples in a message.
+    :param queue_size: number of samples waiting to be sent, the oldest
+                       ones are dropped when the queue is full.
+    :param batch_size: number of samples per message, 0 for no limit.
+    :param max_bytes: encoded size of the samples of a message, 0 for no
+                      limit. A sample larger than that is sent on its own.
+    :param max_delay: number of seconds a sample waits to be sent.
+    """
+
+    def __init__(self, send, queue_size, batch_size=0, max_bytes=0,
+                 max_delay=1.0):
+        self.send = send
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.dropped = 0
+        self.batches = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='Sample-sender', daemon=True)
+        self._thread.start()
+
+    def put(self, samples):
+        """Queue samples to be sent, without waiting."""
+        now = time.monotonic()
+        dropped = 0
+        with self._cond:
+            for sample in samples:
+                if len(self._queue) >= self.queue_size:
+                    self._queue.popleft()
+                    dropped += 1
+                self._queue.append((now, sample))
+            self.dropped += dropped
+            self._cond.notify()
+        if dropped:
+            LOG.warning("Sample sender queue full, dropped %d samples.",
+                        dropped)
+
+    def _get(self, deadline):
+        # Return the next queued sample, or None when the deadline of the
+        # current batch expires or the sender is stopped.
+        with self._cond:
+            while not self._queue and not self._stopped:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+            return self._queue.popleft() if self._queue else None
+
+    def _run(self):
+        batch = []
+        size = 0
+        deadline = None
+        while True:
+            item = self._get(deadline)
+            if item is not None:
+                queued_at, sample = item
+                sample_size = len(jsonutils.dump_as_bytes(sample))
+                if (batch and self.max_bytes and
+                        size + sample_size > self.max_bytes):
+                    self._flush(batch)
+                    batch = []
+                if not batch:
+                    size = 0
+                    deadline = queued_at + self.max_delay
+                batch.append(sample)
+                size += sample_size
+            if batch and (item is None or
+                          len(batch) == self.batch_size or
+                          deadline <= time.monotonic()):
+                self._flush(batch)
+                batch = []
+                deadline = None
+            if item is None and self._stopped:
+                return
+
+    def _flush(self, batch):
+        try:
+            self.send(batch)
+        except Exception:
+            LOG.exception("Failed to send %d samples.", len(batch))
+        else:
+            self.batches += 1
+
+    def stop(self):
+        """Send the queued samples and stop the sender."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
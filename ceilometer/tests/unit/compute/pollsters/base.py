@@ -29,6 +29,7 @@ class TestPollsterBase(base.BaseTestCase):
         self.CONF = service.prepare_service([], [])
 
         self.inspector = mock.Mock()
+        self.inspector.get_polled_time.return_value = None
         self.instance = mock.MagicMock()
         self.instance.name = 'instance-00000001'
         setattr(self.instance, 'OS-EXT-SRV-ATTR:instance_name',
@@ -14,7 +14,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
 import time
+from unittest import mock
 
 from ceilometer.compute.pollsters import instance_stats
 from ceilometer.compute.virt import inspector as virt_inspector
@@ -49,6 +51,21 @@ class TestCPUPollster(base.TestPollsterBase):
         _verify_cpu_metering(3 * (10 ** 6))
         _verify_cpu_metering(2 * (10 ** 6))
 
+    def test_get_samples_polled_time(self):
+        self._mock_inspect_instance(
+            virt_inspector.InstanceStats(cpu_time=1 * (10 ** 6), cpu_number=2))
+        self.inspector.get_polled_time.return_value = 42
+        mgr = manager.AgentManager(0, self.CONF)
+        pollster = instance_stats.CPUPollster(self.CONF)
+        cache = {}
+        samples = list(pollster.get_samples(mgr, cache, [self.instance]))
+        self.assertEqual(42, samples[0].monotonic_time)
+        self.inspector.prepare_cycle.assert_called_once_with(cache)
+        self.inspector.inspect_instance.assert_called_once_with(
+            self.instance, None)
+        self.inspector.get_polled_time.assert_called_once_with(
+            self.instance, cache)
+
     # the following apply to all instance resource pollsters but are tested
     # here alone.
 
@@ -172,3 +189,66 @@ class TestCPUPollsterShutoff(base.TestPollsterBase):
         cache = {}
         samples = list(pollster.get_samples(mgr, cache, [self.instance]))
         self.assertEqual(0, len(samples))
+
+
+class TestInspectCache(base.TestPollsterBase):
+
+    POLLSTERS = (instance_stats.CPUPollster, instance_stats.VCPUsPollster,
+                 instance_stats.MemoryUsagePollster,
+                 instance_stats.PowerStatePollster)
+
+    def _poll_concurrently(self, cache):
+        mgr = manager.AgentManager(0, self.CONF)
+        results = {}
+
+        def poll(pollster):
+            try:
+                results[pollster.__class__] = list(pollster.get_samples(
+                    mgr, cache, [self.instance]))
+            except Exception as e:
+                results[pollster.__class__] = e
+
+        threads = [threading.Thread(target=poll, args=(cls(self.CONF),))
+                   for cls in self.POLLSTERS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_inspect_once(self):
+        def inspect(instance, duration):
+            time.sleep(0.1)
+            return virt_inspector.InstanceStats(
+                power_state=1, cpu_number=2, cpu_time=10 ** 6,
+                memory_usage=128.0)
+
+        self.inspector.inspect_instance = mock.Mock(side_effect=inspect)
+        results = self._poll_concurrently({})
+        self.assertEqual(1, self.inspector.inspect_instance.call_count)
+        self.assertEqual({'cpu': 10 ** 6, 'vcpus': 2, 'memory.usage': 128.0,
+                          'power.state': 1},
+                         {samples[0].name: samples[0].volume
+                          for samples in results.values()})
+
+    def test_inspect_error_not_cached(self):
+        self._mock_inspect_instance(
+            virt_inspector.InstanceNotFoundException(),
+            virt_inspector.InstanceStats(cpu_number=2))
+        cache = {}
+        mgr = manager.AgentManager(0, self.CONF)
+        cpu = instance_stats.CPUPollster(self.CONF)
+        vcpus = instance_stats.VCPUsPollster(self.CONF)
+        self.assertEqual([], list(cpu.get_samples(mgr, cache,
+                                                  [self.instance])))
+        samples = list(vcpus.get_samples(mgr, cache, [self.instance]))
+        self.assertEqual(2, samples[0].volume)
+        self.assertEqual(2, self.inspector.inspect_instance.call_count)
+
+    def test_pollster_group(self):
+        cpu = mock.Mock(obj=instance_stats.CPUPollster(self.CONF))
+        cpu.name = 'cpu'
+        other = mock.Mock(obj=object())
+        other.name = 'other'
+        self.assertEqual('inspect_instance', manager.pollster_group(cpu))
+        self.assertEqual('other', manager.pollster_group(other))
@@ -16,9 +16,14 @@
 """Tests for the compute pollsters.
 """
 
+from unittest import mock
+
+import msgpack
+from oslo_utils import netutils
 
 from ceilometer.compute.pollsters import util
 from ceilometer.polling import manager
+from ceilometer.publisher import udp
 from ceilometer import service
 from ceilometer.tests import base
 
@@ -158,3 +163,53 @@ class TestLocationMetadata(base.BaseTestCase):
         self.instance = FauxInstance(**self.INSTANCE_PROPERTIES)
         md = util._get_metadata_from_object(self.CONF, self.instance)
         self.assertNotIn('image_meta', md)
+
+    def test_metadata_cached(self):
+        self.instance.user_id = 'user'
+        self.instance.tenant_id = 'project'
+        cache = {}
+        s1 = util.make_sample_from_instance(
+            self.CONF, self.instance, 'cpu', 'cumulative', 'ns', 1,
+            cache=cache)
+        s2 = util.make_sample_from_instance(
+            self.CONF, self.instance, 'disk.device.read.bytes', 'cumulative',
+            'B', 1, additional_metadata={'disk_name': 'vda'}, cache=cache)
+        self.assertEqual(cache['resource_metadata'][self.instance.id],
+                         s1.resource_metadata)
+        self.assertIsNot(cache['resource_metadata'][self.instance.id],
+                         s1.resource_metadata)
+        self.assertEqual('vda', s2.resource_metadata['disk_name'])
+        self.assertNotIn('disk_name', s1.resource_metadata)
+        self.assertNotIn('disk_name',
+                         cache['resource_metadata'][self.instance.id])
+        self.assertEqual(dict(s1.resource_metadata, disk_name='vda'),
+                         s2.resource_metadata)
+
+        with mock.patch.object(util, '_get_metadata_from_object') as get:
+            util.make_sample_from_instance(
+                self.CONF, self.instance, 'cpu', 'cumulative', 'ns', 1,
+                cache=cache)
+        get.assert_not_called()
+
+        s3 = util.make_sample_from_instance(
+            self.CONF, self.instance, 'cpu', 'cumulative', 'ns', 1)
+        self.assertEqual(s1.resource_metadata, s3.resource_metadata)
+
+    def test_metadata_cached_published(self):
+        self.instance.user_id = 'user'
+        self.instance.tenant_id = 'project'
+        cache = {}
+        samples = [util.make_sample_from_instance(
+            self.CONF, self.instance, 'disk.device.read.bytes', 'cumulative',
+            'B', 1, additional_metadata={'disk_name': disk}, cache=cache)
+            for disk in ('vda', 'vdb')]
+        with mock.patch('socket.socket') as socket:
+            publisher = udp.UDPPublisher(self.CONF,
+                                         netutils.urlsplit('udp://somehost'))
+            publisher.publish_samples(samples)
+        sent = [msgpack.loads(call[0][0], raw=False)
+                for call in socket.return_value.sendto.call_args_list]
+        self.assertEqual(['vda', 'vdb'],
+                         [s['resource_metadata']['disk_name'] for s in sent])
+        self.assertEqual('display name',
+                         sent[0]['resource_metadata']['display_name'])
@@ -25,6 +25,7 @@ from ceilometer.tests import base
 
 
 # Mock libvirt constants and exceptions to avoid libvirt dependency
+VIR_ERR_NO_DOMAIN = 42
 VIR_ERR_NO_DOMAIN_METADATA = 80
 
 
@@ -385,6 +386,7 @@ class TestDiscovery(base.BaseTestCase):
         # being installed only for testing
         self.libvirt = mock.MagicMock()
         self.libvirt.libvirtError = FakeLibvirtError
+        self.libvirt.VIR_ERR_NO_DOMAIN = VIR_ERR_NO_DOMAIN
         patch_libvirt = fixtures.MockPatch(
             'ceilometer.compute.virt.libvirt.utils.libvirt', self.libvirt)
         self.useFixture(patch_libvirt)
@@ -990,6 +992,111 @@ class TestDiscovery(base.BaseTestCase):
         resources = dsc.discover(mock.MagicMock())
         self.assertEqual(0, len(resources))
 
+    @mock.patch("ceilometer.compute.virt.libvirt.utils.start_event_loop")
+    @mock.patch("ceilometer.compute.virt.libvirt.utils."
+                "new_libvirt_connection")
+    @mock.patch("ceilometer.compute.virt.libvirt.utils."
+                "refresh_libvirt_connection")
+    def test_discovery_with_libvirt_events(self, mock_libvirt_conn,
+                                           mock_events_conn,
+                                           mock_start_event_loop):
+        self.CONF.set_override("instance_discovery_method",
+                               "libvirt_metadata",
+                               group="compute")
+        self.CONF.set_override("libvirt_events", True, group="compute")
+        domain = FakeDomain()
+        conn = mock.Mock(wraps=FakeConn([domain]))
+        mock_libvirt_conn.return_value = conn
+        dsc = discovery.InstanceDiscovery(self.CONF)
+
+        resources = dsc.discover(mock.MagicMock())
+        self.assertEqual([domain.UUIDString()], [r.id for r in resources])
+        mock_start_event_loop.assert_called_once_with()
+        events_conn = mock_events_conn.return_value
+        events_conn.domainEventRegisterAny.assert_called_once_with(
+            None, 0, dsc._lifecycle_event, None)
+        conn.listAllDomains.assert_called_once_with()
+
+        # No event, the instances are not looked up again
+        resources = dsc.discover(mock.MagicMock())
+        self.assertEqual([domain.UUIDString()], [r.id for r in resources])
+        conn.listAllDomains.assert_called_once_with()
+
+        # The domain is undefined
+        dsc._lifecycle_event(events_conn, domain, 1, 0, None)
+        conn.lookupByUUIDString = mock.Mock(
+            side_effect=FakeLibvirtError("no domain", VIR_ERR_NO_DOMAIN))
+        self.assertEqual([], dsc.discover(mock.MagicMock()))
+        conn.lookupByUUIDString.assert_called_once_with(
+            domain.UUIDString())
+
+        # The domain is defined again
+        dsc._lifecycle_event(events_conn, domain, 0, 0, None)
+        conn.lookupByUUIDString = mock.Mock(return_value=domain)
+        resources = dsc.discover(mock.MagicMock())
+        self.assertEqual([domain.UUIDString()], [r.id for r in resources])
+        conn.listAllDomains.assert_called_once_with()
+
+        # The domain is looked up again after a failure
+        dsc._lifecycle_event(events_conn, domain, 2, 0, None)
+        conn.lookupByUUIDString = mock.Mock(
+            side_effect=FakeLibvirtError("error", 1))
+        resources = dsc.discover(mock.MagicMock())
+        self.assertEqual([domain.UUIDString()], [r.id for r in resources])
+        conn.lookupByUUIDString = mock.Mock(return_value=domain)
+        dsc.discover(mock.MagicMock())
+        conn.lookupByUUIDString.assert_called_once_with(
+            domain.UUIDString())
+
+        # The domain is undefined while being looked up
+        dsc._lifecycle_event(events_conn, domain, 1, 0, None)
+        undefined = mock.Mock(wraps=domain)
+        undefined.XMLDesc.side_effect = FakeLibvirtError(
+            "no domain", VIR_ERR_NO_DOMAIN)
+        conn.lookupByUUIDString = mock.Mock(return_value=undefined)
+        self.assertEqual([], dsc.discover(mock.MagicMock()))
+        conn.listAllDomains.assert_called_once_with()
+
+        # Everything is got again once the connection to events is lost
+        events_conn.isAlive.return_value = False
+        dsc.discover(mock.MagicMock())
+        self.assertEqual(2, conn.listAllDomains.call_count)
+        self.assertEqual(2, mock_events_conn.call_count)
+
+        # or once the main connection is
+        conn = mock.Mock(wraps=FakeConn([domain]))
+        mock_libvirt_conn.return_value = conn
+        resources = dsc.discover(mock.MagicMock())
+        self.assertEqual([domain.UUIDString()], [r.id for r in resources])
+        conn.listAllDomains.assert_called_once_with()
+
+    @mock.patch("ceilometer.compute.virt.libvirt.utils.start_event_loop")
+    @mock.patch("ceilometer.compute.virt.libvirt.utils."
+                "new_libvirt_connection")
+    @mock.patch("ceilometer.compute.virt.libvirt.utils."
+                "refresh_libvirt_connection")
+    def test_discovery_with_libvirt_events_resync(self, mock_libvirt_conn,
+                                                  mock_events_conn,
+                                                  mock_start_event_loop):
+        self.CONF.set_override("instance_discovery_method",
+                               "libvirt_metadata",
+                               group="compute")
+        self.CONF.set_override("libvirt_events", True, group="compute")
+        self.CONF.set_override("libvirt_events_resync_interval", 60,
+                               group="compute")
+        conn = mock.Mock(wraps=FakeConn())
+        mock_libvirt_conn.return_value = conn
+        dsc = discovery.InstanceDiscovery(self.CONF)
+
+        with mock.patch('time.monotonic', return_value=100):
+            dsc.discover(mock.MagicMock())
+        with mock.patch('time.monotonic', return_value=159):
+            dsc.discover(mock.MagicMock())
+        conn.listAllDomains.assert_called_once_with()
+        with mock.patch('time.monotonic', return_value=160):
+            self.assertEqual(1, len(dsc.discover(mock.MagicMock())))
+        self.assertEqual(2, conn.listAllDomains.call_count)
+
     def test_get_flavor_id(self):
         self.CONF.set_override("instance_discovery_method",
                                "libvirt_metadata",
@@ -12,6 +12,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """Tests for libvirt inspector."""
+import os
 from unittest import mock
 
 import fixtures
@@ -276,6 +277,64 @@ class TestLibvirtInspection(base.BaseTestCase):
             self.assertEqual(31, vnic2.tx_errors)
             self.assertEqual(32, vnic2.tx_drop)
 
+    def test_inspect_vnics_delta_and_rates(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <interface type='bridge'>
+                       <mac address='fa:16:3e:71:ec:6d'/>
+                       <source bridge='br100'/>
+                       <target dev='vnet0'/>
+                     </interface>
+                 </devices>
+             </domain>
+        """
+        domain = mock.Mock()
+        domain.XMLDesc.return_value = dom_xml
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        domain.interfaceStats.return_value = (100, 2, 0, 0, 200, 4, 0, 0)
+        conn = mock.Mock()
+        conn.lookupByUUIDString.return_value = domain
+
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.'
+                        'refresh_libvirt_connection', return_value=conn):
+            with mock.patch('time.time', return_value=1000):
+                vnics = list(self.inspector.inspect_vnics(
+                    self.instance, None))
+                self.assertEqual(0, vnics[0].rx_bytes_delta)
+                self.assertEqual([], list(self.inspector.inspect_vnic_rates(
+                    self.instance, None)))
+
+            domain.interfaceStats.return_value = (400, 2, 0, 0, 1200, 4, 0,
+                                                  0)
+            with mock.patch('time.time', return_value=1010):
+                vnics = list(self.inspector.inspect_vnics(
+                    self.instance, None))
+                self.assertEqual(300, vnics[0].rx_bytes_delta)
+                self.assertEqual(1000, vnics[0].tx_bytes_delta)
+                rates = list(self.inspector.inspect_vnic_rates(
+                    self.instance, None))
+                self.assertEqual('vnet0', rates[0].name)
+                self.assertEqual(30, rates[0].rx_bytes_rate)
+                self.assertEqual(100, rates[0].tx_bytes_rate)
+
+            # The counters were reset
+            domain.interfaceStats.return_value = (50, 2, 0, 0, 60, 4, 0, 0)
+            with mock.patch('time.time', return_value=1020):
+                vnics = list(self.inspector.inspect_vnics(
+                    self.instance, None))
+                self.assertEqual(50, vnics[0].rx_bytes_delta)
+                self.assertEqual(60, vnics[0].tx_bytes_delta)
+                self.assertEqual([], list(self.inspector.inspect_vnic_rates(
+                    self.instance, None)))
+
+            # Another instance with a device of the same name
+            other = VMInstance()
+            other.id = 'a75c2fa5-6c03-45a8-bbf7-b993cfcdec27'
+            with mock.patch('time.time', return_value=1030):
+                vnics = list(self.inspector.inspect_vnics(other, None))
+                self.assertEqual(0, vnics[0].rx_bytes_delta)
+
     def test_inspect_vnics_with_domain_shutoff(self):
         domain = mock.Mock()
         domain.info.return_value = (5, 0, 0, 2, 999999)
@@ -585,6 +644,187 @@ class TestLibvirtInspection(base.BaseTestCase):
             self.assertIsNone(stats.cache_misses)
 
 
+class TestLibvirtBulkInspection(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conf = service.prepare_service([], [])
+        self.conf.set_override('libvirt_stats_mode', 'bulk')
+
+        self.instance = VMInstance()
+        libvirt_inspector.libvirt = mock.Mock()
+        libvirt_inspector.libvirt.VIR_DOMAIN_SHUTOFF = 5
+        libvirt_inspector.libvirt.libvirtError = FakeLibvirtError
+        utils.libvirt = libvirt_inspector.libvirt
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.'
+                        'refresh_libvirt_connection', return_value=None):
+            self.inspector = libvirt_inspector.LibvirtInspector(self.conf)
+
+        self.domain = mock.Mock()
+        self.domain.UUIDString.return_value = self.instance.id
+        self.domain.XMLDesc.return_value = """
+             <domain type='kvm'>
+                 <devices>
+                     <interface type='bridge'>
+                       <mac address='fa:16:3e:71:ec:6d'/>
+                       <source bridge='br100'/>
+                       <target dev='vnet0'/>
+                     </interface>
+                 </devices>
+             </domain>
+        """
+        self.stats = {
+            'state.state': 1,
+            'cpu.time': 999999,
+            'balloon.current': 54400,
+            'balloon.maximum': 65536,
+            'balloon.available': 51200,
+            'balloon.unused': 25600,
+            'balloon.rss': 30000,
+            'vcpu.current': 2,
+            'vcpu.maximum': 2,
+            'vcpu.0.time': 10000,
+            'vcpu.0.wait': 10000,
+            'vcpu.1.time': 10000,
+            'vcpu.1.wait': 10000,
+            'perf.cpu_cycles': 7259361,
+            'net.count': 1,
+            'net.0.name': 'vnet0',
+            'net.0.rx.bytes': 1,
+            'net.0.rx.pkts': 2,
+            'net.0.rx.errs': 21,
+            'net.0.rx.drop': 22,
+            'net.0.tx.bytes': 3,
+            'net.0.tx.pkts': 4,
+            'net.0.tx.errs': 23,
+            'net.0.tx.drop': 24,
+            'block.count': 2,
+            'block.0.name': 'vda',
+            'block.0.path': '/path/instance-00000001/disk',
+            'block.0.rd.reqs': 1,
+            'block.0.rd.bytes': 2,
+            'block.0.rd.times': 200,
+            'block.0.wr.reqs': 3,
+            'block.0.wr.bytes': 4,
+            'block.0.wr.times': 300,
+            'block.0.capacity': 10,
+            'block.0.allocation': 20,
+            'block.0.physical': 30,
+            'block.1.name': 'hdc',
+        }
+        self.conn = mock.Mock()
+        self.conn.getAllDomainStats.return_value = [(self.domain, self.stats)]
+        self.useFixture(fixtures.MockPatch(
+            'ceilometer.compute.virt.libvirt.utils.refresh_libvirt_connection',
+            return_value=self.conn))
+
+    def test_inspect_instance(self):
+        stats = self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(1, stats.power_state)
+        self.assertEqual(2, stats.cpu_number)
+        self.assertEqual(40000, stats.cpu_time)
+        self.assertEqual(54400 / units.Ki, stats.memory_actual)
+        self.assertEqual(51200 / units.Ki, stats.memory_available)
+        self.assertEqual(25600 / units.Ki, stats.memory_usage)
+        self.assertEqual(30000 / units.Ki, stats.memory_resident)
+        self.assertIsNone(stats.memory_swap_in)
+        self.assertEqual(7259361, stats.cpu_cycles)
+
+    def test_inspect_instance_shutoff(self):
+        self.stats['state.state'] = 5
+        self.assertRaises(virt_inspector.InstanceShutOffException,
+                          self.inspector.inspect_instance,
+                          self.instance, None)
+        self.conf.set_override('report_stopped_instance_metrics', True,
+                               group='compute')
+        stats = self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(5, stats.power_state)
+        self.assertEqual(2, stats.cpu_number)
+        self.assertEqual(64, stats.memory_actual)
+        self.assertIsNone(stats.cpu_time)
+
+    def test_inspect_vnics(self):
+        vnics = list(self.inspector.inspect_vnics(self.instance, None))
+        self.assertEqual(1, len(vnics))
+        self.assertEqual('vnet0', vnics[0].name)
+        self.assertEqual('fa:16:3e:71:ec:6d', vnics[0].mac)
+        self.assertEqual((1, 2, 21, 22, 3, 4, 23, 24),
+                         (vnics[0].rx_bytes, vnics[0].rx_packets,
+                          vnics[0].rx_errors, vnics[0].rx_drop,
+                          vnics[0].tx_bytes, vnics[0].tx_packets,
+                          vnics[0].tx_errors, vnics[0].tx_drop))
+        self.domain.interfaceStats.assert_not_called()
+
+    def test_inspect_disks(self):
+        disks = list(self.inspector.inspect_disks(self.instance, None))
+        self.assertEqual([virt_inspector.DiskStats(
+            device='vda', read_requests=1, read_bytes=2, write_requests=3,
+            write_bytes=4, errors=-1, wr_total_times=300,
+            rd_total_times=200)], disks)
+        self.domain.blockStats.assert_not_called()
+
+    def test_inspect_disks_errors(self):
+        self.stats['block.0.errors'] = 7
+        disks = list(self.inspector.inspect_disks(self.instance, None))
+        self.assertEqual(7, disks[0].errors)
+
+    def test_inspect_disk_info(self):
+        disks = list(self.inspector.inspect_disk_info(self.instance, None))
+        self.assertEqual([virt_inspector.DiskInfo(
+            device='vda', capacity=30, allocation=20, physical=30)], disks)
+        self.domain.blockInfo.assert_not_called()
+
+    def test_stats_requested_once(self):
+        cache = {}
+        self.inspector.prepare_cycle(cache)
+        with mock.patch('ceilometer.compute.virt.libvirt.inspector.time') \
+                as time:
+            time.monotonic.return_value = 42
+            self.inspector.inspect_instance(self.instance, None)
+        list(self.inspector.inspect_vnics(self.instance, None))
+        list(self.inspector.inspect_disks(self.instance, None))
+        self.conn.getAllDomainStats.assert_called_once_with(
+            libvirt_inspector.BULK_STATS, 0)
+        self.conn.lookupByUUIDString.assert_not_called()
+        self.assertEqual(42, self.inspector.get_polled_time(self.instance,
+                                                            cache))
+        other = VMInstance()
+        other.id = 'other'
+        self.assertIsNone(self.inspector.get_polled_time(other, cache))
+
+        # the next polling cycle requests them again
+        self.inspector.prepare_cycle({})
+        self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(2, self.conn.getAllDomainStats.call_count)
+
+    def test_fallback_unknown_domain(self):
+        self.domain.UUIDString.return_value = 'other'
+        domain = mock.Mock()
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        domain.memoryStats.return_value = {}
+        self.conn.lookupByUUIDString.return_value = domain
+        self.conn.domainListGetStats.return_value = [({}, {
+            'vcpu.current': 2, 'cpu.time': 999999})]
+        stats = self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(999999, stats.cpu_time)
+        self.conn.lookupByUUIDString.assert_called_once_with(
+            self.instance.id)
+
+    def test_fallback_unsupported(self):
+        error = FakeLibvirtError()
+        error.get_error_code = mock.Mock(return_value=84)
+        error.get_error_domain = mock.Mock(return_value=10)
+        self.conn.getAllDomainStats.side_effect = error
+        domain = mock.Mock()
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        domain.memoryStats.return_value = {}
+        self.conn.lookupByUUIDString.return_value = domain
+        self.conn.domainListGetStats.return_value = [({}, {
+            'vcpu.current': 2, 'cpu.time': 999999})]
+        stats = self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(999999, stats.cpu_time)
+
+
 class TestLibvirtInspectionWithError(base.BaseTestCase):
 
     def setUp(self):
@@ -602,3 +842,137 @@ class TestLibvirtInspectionWithError(base.BaseTestCase):
     def test_inspect_unknown_error(self):
         self.assertRaises(virt_inspector.InspectorException,
                           self.inspector.inspect_instance, 'foo', None)
+
+
+class TestParsedXMLCache(base.BaseTestCase):
+
+    DOM_XML = """
+        <domain type='kvm'>
+            <os><type arch='x86_64'>hvm</type></os>
+            <devices>
+                <disk type='file' device='disk'>
+                    <source file='/path/instance/disk'/>
+                    <target dev='vda' bus='virtio'/>
+                </disk>
+                <disk type='file' device='cdrom'>
+                    <target dev='hdc' bus='ide'/>
+                </disk>
+                <interface type='bridge'>
+                    <mac address='fa:16:3e:71:ec:6d'/>
+                    <source bridge='br100'/>
+                    <target dev='vnet0'/>
+                </interface>
+            </devices>
+        </domain>
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.cache = utils.ParsedXMLCache()
+
+    def test_parsed_once(self):
+        parse = mock.Mock(side_effect=utils.DomainDescription)
+        first = self.cache.get('uuid', 'domain', self.DOM_XML, parse)
+        second = self.cache.get('uuid', 'domain', self.DOM_XML, parse)
+        self.assertIs(first, second)
+        parse.assert_called_once_with(self.DOM_XML)
+
+        self.assertEqual('hvm', first.os_type)
+        self.assertEqual('x86_64', first.arch)
+        self.assertEqual(['vda'], first.disks)
+        self.assertEqual([('vnet0', 'fa:16:3e:71:ec:6d', None,
+                           {'interfaceid': None, 'bridge': 'br100'})],
+                         first.interfaces)
+
+    def test_parsed_again_when_changed(self):
+        parse = mock.Mock(side_effect=utils.DomainDescription)
+        self.cache.get('uuid', 'domain', self.DOM_XML, parse)
+        changed = self.DOM_XML.replace('vnet0', 'vnet1')
+        description = self.cache.get('uuid', 'domain', changed, parse)
+        self.assertEqual(2, parse.call_count)
+        self.assertEqual('vnet1', description.interfaces[0][0])
+
+        self.cache.get('other', 'domain', changed, parse)
+        self.cache.get('uuid', 'metadata', changed, parse)
+        self.assertEqual(4, parse.call_count)
+
+
+class TestCounterStore(base.BaseTestCase):
+
+    def test_swap(self):
+        store = utils.CounterStore(2, 60)
+        key = ('delta', 'uuid', 'vnet0')
+        with mock.patch('time.time', return_value=100):
+            self.assertIsNone(store.swap(key, 'mac', (1, 2)))
+        with mock.patch('time.time', return_value=110):
+            self.assertEqual(((1, 2), 10), store.swap(key, 'mac', (3, 4)))
+        with mock.patch('time.time', return_value=120):
+            # Another device with the same name
+            self.assertIsNone(store.swap(key, 'other', (5, 6)))
+        with mock.patch('time.time', return_value=200):
+            # Too old
+            self.assertIsNone(store.swap(key, 'other', (7, 8)))
+
+    def test_no_max_age(self):
+        store = utils.CounterStore(2, 0)
+        key = ('rate', 'uuid', 'vnet0')
+        # the cycles of a one hour polling interval
+        with mock.patch('time.time', return_value=100):
+            store.swap(key, 'mac', (1, 2))
+        with mock.patch('time.time', return_value=3700.5):
+            self.assertEqual(((1, 2), 3600.5),
+                             store.swap(key, 'mac', (3, 4)))
+
+    def test_pruned(self):
+        store = utils.CounterStore(16, 60)
+        with mock.patch('time.time', return_value=100):
+            store.swap(('delta', 'gone', 'vnet0'), 'mac', (1,))
+        with mock.patch('time.time', return_value=150):
+            store.swap(('delta', 'uuid', 'vnet0'), 'mac', (1,))
+        with mock.patch('time.time', return_value=170):
+            store.save()
+        self.assertEqual([('delta', 'uuid', 'vnet0')],
+                         list(store._values))
+
+    def test_evicted(self):
+        store = utils.CounterStore(2, 60)
+        store.swap(('delta', 'uuid1', 'vnet0'), 'mac', (1,))
+        store.swap(('delta', 'uuid2', 'vnet0'), 'mac', (1,))
+        store.swap(('delta', 'uuid3', 'vnet0'), 'mac', (1,))
+        self.assertIsNone(store.swap(('delta', 'uuid1', 'vnet0'), 'mac',
+                                     (2,)))
+        self.assertIsNotNone(store.swap(('delta', 'uuid3', 'vnet0'), 'mac',
+                                        (2,)))
+
+    def test_persisted(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'counters.json')
+        key = ('rate', 'uuid', 'vnet0')
+        with mock.patch('time.time', return_value=100):
+            store = utils.CounterStore(16, 60, path)
+            store.swap(key, 'mac', (1, 2))
+            store.swap(('rate', 'uuid', 'vnet1'), 'mac', (1, 2))
+        with mock.patch('time.time', return_value=110):
+            store.swap(key, 'mac', (3, 4))
+            self.assertFalse(os.path.exists(path))
+            store.save()
+        self.assertTrue(os.path.exists(path))
+        # not saved again until the values change
+        os.rename(path, path + '.saved')
+        store.save()
+        self.assertFalse(os.path.exists(path))
+        os.rename(path + '.saved', path)
+
+        with mock.patch('time.time', return_value=120):
+            store = utils.CounterStore(16, 60, path)
+            self.assertEqual(((3, 4), 10), store.swap(key, 'mac', (5, 6)))
+            self.assertEqual(((1, 2), 20), store.swap(
+                ('rate', 'uuid', 'vnet1'), 'mac', (5, 6)))
+
+    def test_load_invalid_file(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'counters.json')
+        with open(path, 'w') as f:
+            f.write('not json')
+        store = utils.CounterStore(16, 60, path)
+        self.assertIsNone(store.swap(('rate', 'uuid', 'vnet0'), 'mac', (1,)))
@@ -122,6 +122,45 @@ class TestTraitDefinition(ConverterBase):
 
         self.fake_plugin_mgr = dict(test=self.ext1, nothing=self.ext2)
 
+    def test_extraction_plan(self):
+        cfgs = {
+            'instance': dict(fields=['payload.instance_uuid2',
+                                     'payload.instance_uuid',
+                                     'payload.instance_id']),
+            'none': dict(fields=['payload.instance_uuid2',
+                                 'payload.instance_id2']),
+            'missing': dict(fields='payload.missing.key'),
+            'host': dict(fields='publisher_id.`split(., 1, 1)`'),
+            'service': dict(fields='publisher_id.`split(., 0, -1)`'),
+            'disk': dict(type='int', fields='payload.image_meta.disk_gb'),
+            'foobar': dict(type='float', fields='$.payload.foobar'),
+            'date': dict(type='datetime', fields='payload.bogus_date'),
+            'empty': dict(type='int', fields='payload.bogus_date'),
+            'complex': dict(fields='payload.image_meta.*'),
+            'plugin': dict(fields='payload.instance_id',
+                           plugin=dict(name='test')),
+        }
+        tdefs = [converter.TraitDefinition(name, cfg, self.fake_plugin_mgr)
+                 for name, cfg in cfgs.items()]
+        plan = converter.TraitExtractionPlan(tdefs)
+        expected = [t.to_trait(self.n1) for t in tdefs]
+        expected = [t for t in expected if t is not None]
+        self.test_plugin.trait_values.reset_mock()
+        traits = plan.extract(self.n1)
+        self.assertEqual(expected, traits)
+        self.assertEqual(['instance', 'host', 'service', 'disk', 'foobar',
+                          'complex', 'plugin'],
+                         [t.name for t in traits])
+        self.test_plugin.trait_values.assert_called_once_with(
+            [('payload.instance_id', 'id-for-instance-0001')])
+
+    def test_extraction_plan_conversion_error(self):
+        tdef = converter.TraitDefinition(
+            'thing', dict(type='int', fields='payload.image_meta.thing'),
+            self.fake_plugin_mgr)
+        plan = converter.TraitExtractionPlan([tdef])
+        self.assertRaises(ValueError, plan.extract, self.n1)
+
     def test_to_trait_with_plugin(self):
         cfg = dict(type='text',
                    fields=['payload.instance_id', 'payload.instance_uuid'],
@@ -685,6 +724,53 @@ class TestNotificationConverter(ConverterBase):
         e = c.to_event('INFO', self.test_notification2)
         self.assertIsNotValidEvent(e, self.test_notification2)
 
+    def test_converter_last_definition_wins(self):
+        event_defs = [
+            {'event_type': 'compute.instance.*',
+             'traits': {'first': {'fields': 'payload.host'}}},
+            {'event_type': ['compute.instance.create.*', '!*.end'],
+             'traits': {'second': {'fields': 'payload.host'}}},
+        ]
+        c = converter.NotificationEventsConverter(
+            self.CONF, event_defs, self.fake_plugin_mgr)
+        e = c.to_event('INFO', self.test_notification1)
+        self.assertHasTrait(e, 'second')
+        self.assertDoesNotHaveTrait(e, 'first')
+        notification = self._create_test_notification(
+            "compute.instance.create.end", "uuid-for-notif-0003",
+            host='host-1-2-3')
+        e = c.to_event('INFO', notification)
+        self.assertHasTrait(e, 'first')
+        self.assertDoesNotHaveTrait(e, 'second')
+
+    def test_converter_definition_cache(self):
+        self.CONF.set_override('drop_unmatched_notifications', True,
+                               group='event')
+        c = converter.NotificationEventsConverter(
+            self.CONF, self.valid_event_def1, self.fake_plugin_mgr)
+        with mock.patch.object(c.definitions[0], 'match_type',
+                               wraps=c.definitions[0].match_type) as match:
+            for _ in range(3):
+                self.assertIsValidEvent(
+                    c.to_event('INFO', self.test_notification1),
+                    self.test_notification1)
+                self.assertIsNotValidEvent(
+                    c.to_event('INFO', self.test_notification2),
+                    self.test_notification2)
+        self.assertEqual(2, match.call_count)
+        self.assertEqual(
+            {'compute.instance.create.start': c.definitions[0],
+             'bogus.notification.from.mars': None},
+            c._get_definition.results)
+
+    def test_converter_definition_cache_bounded(self):
+        c = converter.NotificationEventsConverter(
+            self.CONF, self.valid_event_def1, self.fake_plugin_mgr)
+        c._get_definition.size = 1
+        c.to_event('INFO', self.test_notification1)
+        c.to_event('INFO', self.test_notification2)
+        self.assertEqual(1, len(c._get_definition.results))
+
     @staticmethod
     def _convert_message(convert, level):
         message = {'priority': level, 'event_type': "foo", 'publisher_id': "1",
@@ -152,6 +152,21 @@ class TestEventEndpoint(tests_base.BaseTestCase):
 
         self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
 
+    def test_bad_event_non_ack_and_requeue_publisher_queue(self):
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        self.CONF.set_override("publisher_queue_size", 10,
+                               group="notification")
+        self._setup_endpoint(['test://'])
+        self.fake_publisher.publish_events.side_effect = Exception
+        ret = self.endpoint.info([{'ctxt': TEST_NOTICE_CTXT,
+                                   'publisher_id': 'compute.vagrant-precise',
+                                   'event_type': 'compute.instance.create.end',
+                                   'payload': TEST_NOTICE_PAYLOAD,
+                                   'metadata': TEST_NOTICE_METADATA}])
+
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
+
     def test_message_to_event_bad_event(self):
         self._setup_endpoint(['test://'])
         self.fake_publisher.publish_events.side_effect = Exception
@@ -191,3 +206,75 @@ class TestEventEndpoint(tests_base.BaseTestCase):
             self.assertIn('Continue after error from publisher',
                           exception_mock.call_args_list[0][0][0] %
                           exception_mock.call_args_list[0][0][1])
+
+    def _batch(self, count):
+        return [{'ctxt': TEST_NOTICE_CTXT,
+                 'publisher_id': 'compute.vagrant-precise',
+                 'event_type': 'compute.instance.create.end',
+                 'payload': TEST_NOTICE_PAYLOAD,
+                 'metadata': dict(TEST_NOTICE_METADATA,
+                                  message_id='message-%d' % i)}
+                for i in range(count)]
+
+    def test_batch_publishing(self):
+        self.CONF.set_override("batch_publishing", True,
+                               group="notification")
+        self._setup_endpoint(['test://'])
+        ret = self.endpoint.info(self._batch(3))
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.assertEqual(1, self.fake_publisher.publish_events.call_count)
+        events = self.fake_publisher.publish_events.call_args[0][0]
+        self.assertEqual(3, len(events))
+
+    def test_batch_publishing_bad_message_ack(self):
+        self.CONF.set_override("batch_publishing", True,
+                               group="notification")
+        self._setup_endpoint(['test://'])
+        good = mock.MagicMock(event_type='test.test')
+        self.endpoint.event_converter.to_event.side_effect = [
+            good, Exception, good]
+        with mock.patch("ceilometer.pipeline.event.LOG") as mock_logger:
+            ret = self.endpoint.info(self._batch(3))
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.assertEqual(1, mock_logger.exception.call_count)
+        self.fake_publisher.publish_events.assert_called_once_with(
+            [good, good])
+
+    def test_batch_publishing_bad_message_requeue(self):
+        self.CONF.set_override("batch_publishing", True,
+                               group="notification")
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        self._setup_endpoint(['test://'])
+        good = mock.MagicMock(event_type='test.test')
+        self.endpoint.event_converter.to_event.side_effect = [
+            good, Exception, good]
+        batch = self._batch(3)
+        ret = self.endpoint.info(batch)
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
+        self.fake_publisher.publish_events.assert_called_once_with(
+            [good, good])
+
+        # Only the failed message is converted when the batch comes back
+        self.fake_publisher.publish_events.reset_mock()
+        self.endpoint.event_converter.to_event.side_effect = [Exception]
+        ret = self.endpoint.info(batch)
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
+        self.fake_publisher.publish_events.assert_not_called()
+
+        self.endpoint.event_converter.to_event.side_effect = [good]
+        ret = self.endpoint.info(batch)
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.fake_publisher.publish_events.assert_called_once_with([good])
+        self.endpoint.event_converter.to_event.assert_called_with(
+            'info', batch[1])
+
+    def test_batch_publishing_bad_publisher_requeue(self):
+        self.CONF.set_override("batch_publishing", True,
+                               group="notification")
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        self._setup_endpoint(['test://'])
+        self.fake_publisher.publish_events.side_effect = Exception
+        ret = self.endpoint.info(self._batch(2))
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
@@ -12,6 +12,7 @@
 # under the License.
 """Tests for ceilometer.meter.notifications"""
 import copy
+import itertools
 from unittest import mock
 
 import fixtures
@@ -22,6 +23,7 @@ import yaml
 
 from ceilometer import declarative
 from ceilometer.meter import notifications
+from ceilometer import sample as sample_util
 from ceilometer import service as ceilometer_service
 from ceilometer.tests import base as test
 
@@ -366,6 +368,49 @@ class TestMeterProcessing(test.BaseTestCase):
         self.assertEqual('bea70e51c7340cb9d555b15cbfcaec23', s1['resource_id'])
         self.assertEqual('30be1fc9a03c4e94ab05c403a8a377f2', s1['project_id'])
 
+    def test_process_notifications_batch(self):
+        self.CONF.set_override('batch_publishing', True,
+                               group='notification')
+        cfg = yaml.dump(
+            {'metric': [dict(name="test1",
+                             event_type="test.create",
+                             type="delta",
+                             unit="B",
+                             volume="$.payload.volume",
+                             resource_id="$.payload.resource_id",
+                             project_id="$.payload.project_id")]})
+        self._load_meter_def_file(cfg)
+        self.handler.publisher = mock.MagicMock()
+        self.handler.process_notifications(
+            'info', [NOTIFICATION, NOTIFICATION, NOTIFICATION])
+        publish = self.handler.publisher.__enter__.return_value
+        publish.assert_called_once()
+        samples = publish.call_args[0][0]
+        self.assertEqual(3, len(samples))
+        self.assertEqual(['test1'] * 3, [s.name for s in samples])
+
+    @mock.patch('ceilometer.pipeline.sample.LOG')
+    def test_process_notifications_batch_drop_failed(self, LOG):
+        self.CONF.set_override('batch_publishing', True,
+                               group='notification')
+        self._load_meter_def_file()
+        self.handler.publisher = mock.MagicMock()
+        good, bad = mock.Mock(), mock.Mock()
+
+        def build_sample(message):
+            if message is USER_META:
+                yield bad
+                raise Exception('boom')
+            yield good
+
+        with mock.patch.object(self.handler, 'build_sample',
+                               side_effect=build_sample):
+            self.handler.process_notifications(
+                'info', [NOTIFICATION, USER_META, NOTIFICATION])
+        publish = self.handler.publisher.__enter__.return_value
+        publish.assert_called_once_with([good, good])
+        self.assertEqual(1, LOG.exception.call_count)
+
     def test_multiple_meter(self):
         cfg = yaml.dump(
             {'metric': [dict(name="test1",
@@ -917,3 +962,255 @@ class TestMeterProcessing(test.BaseTestCase):
         self.assertEqual("Error loading meter definition: %s", args[0])
         self.assertTrue(
             str(args[1]).endswith("Invalid type bad_type specified"))
+
+
+class TestMeterDefinitionIndex(test.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conf = ceilometer_service.prepare_service([], [])
+
+    def _definition(self, name, event_type):
+        cfg = dict(name=name,
+                   event_type=event_type,
+                   type="delta",
+                   unit="B",
+                   volume="$.payload.volume",
+                   resource_id="$.payload.resource_id")
+        return notifications.MeterDefinition(cfg, self.conf, mock.Mock())
+
+    def test_lookup_literal_and_wildcard(self):
+        defs = [self._definition("literal", "test.create"),
+                self._definition("wildcard", "test.*"),
+                self._definition("other", ["foo.bar", "bar.*"])]
+        index = notifications.MeterDefinitionIndex(defs)
+        self.assertEqual(3, len(index))
+        self.assertEqual(defs, list(index))
+        self.assertEqual((defs[0], defs[1]), index.lookup("test.create"))
+        self.assertEqual((defs[1],), index.lookup("test.delete"))
+        self.assertEqual((defs[2],), index.lookup("foo.bar"))
+        self.assertEqual((defs[2],), index.lookup("bar.baz"))
+        self.assertEqual((), index.lookup("baz.bar"))
+
+    def test_lookup_keeps_regex_semantics_of_literals(self):
+        defs = [self._definition("prefix", "test.create"),
+                self._definition("exact", "test.create.end")]
+        index = notifications.MeterDefinitionIndex(defs)
+        self.assertEqual((defs[0], defs[1]),
+                         index.lookup("test.create.end"))
+        self.assertEqual((defs[0],), index.lookup("testXcreate"))
+        for event_type in ("test.create.end", "testXcreate", "test"):
+            self.assertEqual(
+                tuple(d for d in defs if d.match_type(event_type)),
+                index.lookup(event_type))
+
+    def test_lookup_memoized(self):
+        defs = [self._definition("wildcard", "test.*")]
+        index = notifications.MeterDefinitionIndex(defs)
+        with mock.patch.object(index, '_matcher') as matcher:
+            matcher.match.return_value = True
+            index.lookup("test.create")
+            index.lookup("test.create")
+        self.assertEqual(1, matcher.match.call_count)
+
+    def test_lookup_cache_bounded(self):
+        defs = [self._definition("wildcard", "test.*")]
+        index = notifications.MeterDefinitionIndex(defs)
+        index.lookup.size = 2
+        for event_type in ("test.a", "test.b", "test.c"):
+            self.assertEqual((defs[0],), index.lookup(event_type))
+        self.assertLessEqual(len(index.lookup.results), 2)
+
+    def test_lookup_uncombinable_patterns(self):
+        defs = [self._definition("backref", r"(test)\.\1"),
+                self._definition("literal", "test.create")]
+        index = notifications.MeterDefinitionIndex(defs)
+        self.assertIsNone(index._matcher)
+        self.assertEqual((defs[0],), index.lookup("test.test"))
+        self.assertEqual((defs[1],), index.lookup("test.create"))
+
+
+def legacy_to_samples(definition, message):
+    """Reference conversion of a message, one attribute at a time."""
+    sample = {
+        'name': definition.cfg["name"], 'type': definition.cfg["type"],
+        'unit': definition.cfg["unit"], 'volume': None, 'timestamp': None,
+        'user_id': definition._fallback_user_id.parse(message),
+        'project_id': definition._fallback_project_id.parse(message),
+        'resource_id': None, 'message': message, 'metadata': {},
+    }
+    for name, parser in definition._metadata_attributes.items():
+        value = parser.parse(message)
+        if value:
+            sample['metadata'][name] = value
+    if definition._user_meta:
+        meta = definition._user_meta.parse(message)
+        if meta:
+            sample_util.add_reserved_user_metadata(
+                definition.conf, meta, sample['metadata'])
+
+    lookup = definition.lookup
+    if lookup:
+        for name in sample:
+            sample[name] = [sample[name]]
+    for name in definition.SAMPLE_ATTRIBUTES:
+        parser = definition._attributes.get(name)
+        if parser is not None:
+            value = parser.parse(message, bool(lookup))
+            if ((not lookup and value is not None) or
+                    (lookup and ((name in lookup + ["name"]) or value))):
+                sample[name] = value
+
+    if not lookup:
+        yield sample
+        return
+    nb_samples = len(sample['name'])
+    if nb_samples <= 0:
+        return
+    attributes = definition.SAMPLE_ATTRIBUTES + ["message", "metadata"]
+    samples_values = []
+    for name in attributes:
+        values = sample.get(name)
+        if len(values) == nb_samples:
+            samples_values.append(values)
+        elif len(values) == 1 and name not in lookup:
+            samples_values.append(itertools.cycle(values))
+        else:
+            return
+    for values in zip(*samples_values):
+        yield dict(zip(attributes, values))
+
+
+class TestMeterDefinitionExtraction(test.BaseTestCase):
+
+    CORPUS = [NOTIFICATION, USER_META, MIDDLEWARE_EVENT, FULL_MULTI_MSG,
+              METRICS_UPDATE, {
+                  'event_type': 'compute.instance.create.end',
+                  'publisher_id': 'compute.host1',
+                  'metadata': {'message_id': 'abc',
+                               'timestamp': '2015-06-19T09:19:35.786893'},
+                  'ctxt': {'user_id': 'user1', 'project_id': 'proj1'},
+                  'payload': {'instance_id': 'inst1', 'memory_mb': 512,
+                              'vcpus': 2, 'disk_gb': 1, 'root_gb': 1,
+                              'ephemeral_gb': 0, 'user_id': 'user2',
+                              'tenant_id': 'proj2', 'host': 'host1',
+                              'state': 'active',
+                              'instance_type': 'm1.tiny',
+                              'instance_flavor_id': '1',
+                              'image_meta': {'base_image_ref': 'img1'},
+                              'metadata': {'metering.stack': 'stack1'}},
+              }, {
+                  'event_type': 'volume.exists',
+                  'publisher_id': 'volume.host1',
+                  'metadata': {'message_id': 'def',
+                               'timestamp': '2015-06-19T09:19:35.786893'},
+                  'ctxt': {'user': 'user1', 'tenant': 'proj1'},
+                  'payload': {'volume_id': 'vol1', 'size': 10,
+                              'status': 'available',
+                              'display_name': 'vol',
+                              'created_at': '2015-06-19T09:19:35'},
+              }, {
+                  'event_type': 'image.upload',
+                  'publisher_id': 'image.host1',
+                  'metadata': {'message_id': 'ghi',
+                               'timestamp': '2015-06-19T09:19:35.786893'},
+                  'ctxt': {},
+                  'payload': {'id': 'img1', 'size': 1024,
+                              'owner': 'proj1', 'name': 'cirros',
+                              'status': 'active'},
+              }, {
+                  'event_type': 'magnum.bay.metrics.update',
+                  'publisher_id': 'magnum.host1',
+                  'metadata': {'message_id': 'jkl',
+                               'timestamp': '2015-06-19T09:19:35.786893'},
+                  'ctxt': {'user_id': 'user1', 'project_id': 'proj1'},
+                  'payload': {'metrics': [
+                      {'name': 'memory', 'value': 1, 'unit': 'B'},
+                      {'name': 'cpu', 'value': 2, 'unit': 'ns'}],
+                      'resource_id': 'bay1', 'project_id': 'proj1',
+                      'user_id': 'user1'},
+              }]
+
+    LOOKUP_CFGS = [
+        dict(name="$.payload.metrics[*].name",
+             event_type="magnum.bay.metrics.update",
+             type="gauge",
+             unit="$.payload.metrics[*].unit",
+             volume="$.payload.metrics[*].value",
+             user_id="$.payload.user_id",
+             project_id="$.payload.project_id",
+             resource_id="$.payload.resource_id",
+             lookup=["name", "unit", "volume"]),
+        # NOTE: no timestamp attribute, the expansion must give up
+        dict(name="$.payload.metrics[*].name",
+             event_type="magnum.bay.metrics.update",
+             type="gauge",
+             unit="ns",
+             volume="$.payload.metrics[*].value",
+             resource_id="$.payload.resource_id",
+             lookup=["name", "volume", "timestamp"]),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.conf = ceilometer_service.prepare_service([], [])
+        handler = notifications.ProcessMeterNotifications(self.conf,
+                                                          mock.Mock())
+        self.definitions = list(handler.definitions)
+        self.definitions.extend(
+            notifications.MeterDefinition(cfg, self.conf, mock.Mock())
+            for cfg in self.LOOKUP_CFGS)
+
+    def test_same_samples_as_legacy(self):
+        for message in self.CORPUS:
+            cache = {}
+            for d in self.definitions:
+                expected = list(legacy_to_samples(d, message))
+                self.assertEqual(expected, list(d.to_samples(message)),
+                                 d.cfg['name'])
+                self.assertEqual(expected,
+                                 list(d.to_samples(message, cache=cache)),
+                                 d.cfg['name'])
+
+    def test_corpus_matches_definitions(self):
+        for message in self.CORPUS[5:]:
+            self.assertTrue(any(d.match_type(message['event_type'])
+                                for d in self.definitions),
+                            message['event_type'])
+
+    def test_fallbacks_parsed_lazily(self):
+        d = notifications.MeterDefinition(
+            dict(name="test", event_type="test.create", type="delta",
+                 unit="B", volume="$.payload.volume",
+                 user_id="$.payload.user_id",
+                 project_id="$.payload.project_id",
+                 resource_id="$.payload.resource_id"),
+            self.conf, mock.Mock())
+        with mock.patch.object(d._fallback_user_id, 'parse') as user, \
+                mock.patch.object(d._fallback_project_id, 'parse') as proj:
+            samples = list(d.to_samples(NOTIFICATION))
+        self.assertEqual(1, len(samples))
+        self.assertEqual(NOTIFICATION['payload']['user_id'],
+                         samples[0]['user_id'])
+        user.assert_not_called()
+        proj.assert_not_called()
+
+    def test_fields_parsed_once_per_message(self):
+        cache = {}
+        matching = [d for d in self.definitions
+                    if d.match_type('compute.instance.create.end')]
+        self.assertGreater(len(matching), 1)
+        parse = declarative.Definition.parse
+        calls = []
+
+        def tracked_parse(definition, obj, return_all_values=False):
+            if definition.plugin is None:
+                calls.append((definition.getter, return_all_values))
+            return parse(definition, obj, return_all_values)
+
+        with mock.patch.object(declarative.Definition, 'parse',
+                               tracked_parse):
+            for d in matching:
+                list(d.to_samples(self.CORPUS[5], cache=cache))
+        self.assertEqual(len(set(calls)), len(calls))
+        self.assertEqual(set(cache), set(calls))
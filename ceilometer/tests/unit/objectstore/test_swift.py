@@ -14,6 +14,7 @@
 
 import collections
 import itertools
+import threading
 from unittest import mock
 
 import fixtures
@@ -114,17 +115,17 @@ class TestSwiftPollster(testscenarios.testcase.WithScenarios,
     def fake_ks_service_catalog_url_for(*args, **kwargs):
         raise exceptions.EndpointNotFound("Fake keystone exception")
 
-    def fake_iter_accounts(self, ksclient, cache, tenants):
+    async def fake_get_accounts(self, manager, cache, tenants):
         tenant_ids = [t.id for t in tenants]
-        for i in self.ACCOUNTS:
-            if i[0] in tenant_ids:
-                yield i
+        return [i for i in self.ACCOUNTS if i[0] in tenant_ids]
 
     def setUp(self):
         super().setUp()
         self.CONF = service.prepare_service([], [])
         self.pollster = self.factory(self.CONF)
         self.manager = TestManager(0, self.CONF)
+        self.engine = self.manager.async_engine
+        self.addCleanup(self.engine.stop)
 
         if self.pollster.CACHE_KEY_METHOD == 'swift.head_account':
             self.ACCOUNTS = HEAD_ACCOUNTS
@@ -135,33 +136,63 @@ class TestSwiftPollster(testscenarios.testcase.WithScenarios,
         super().tearDown()
         swift._Base._ENDPOINT = None
 
-    def test_iter_accounts_no_cache(self):
+    def _get_samples(self, cache=None):
+        return self.engine.get_samples(self.pollster, self.manager,
+                                       {} if cache is None else cache,
+                                       ASSIGNED_TENANTS)
+
+    def test_get_accounts_no_cache(self):
         cache = {}
         with fixtures.MockPatchObject(self.factory, '_get_account_info',
                                       return_value=[]):
-            data = list(self.pollster._iter_accounts(mock.Mock(), cache,
-                                                     ASSIGNED_TENANTS))
+            data = self.engine.run(self.pollster._get_accounts(
+                self.manager, cache, ASSIGNED_TENANTS))
 
         self.assertIn(self.pollster.CACHE_KEY_METHOD, cache)
         self.assertEqual([], data)
 
-    def test_iter_accounts_cached(self):
-        # Verify that if a method has already been called, _iter_accounts
+    def test_get_accounts_cached(self):
+        # Verify that if a method has already been called, _get_accounts
         # uses the cached version and doesn't call swiftclient.
-        mock_method = mock.Mock()
-        mock_method.side_effect = AssertionError(
-            'should not be called',
-        )
+        cache = {}
+        with fixtures.MockPatchObject(
+                self.factory, '_get_account_info',
+                return_value=[self.ACCOUNTS[0]]) as get_account_info:
+            for i in range(2):
+                data = self.engine.run(self.pollster._get_accounts(
+                    self.manager, cache, ASSIGNED_TENANTS))
+                self.assertEqual([self.ACCOUNTS[0]], data)
+        get_account_info.mock.assert_called_once_with(self.manager,
+                                                      ASSIGNED_TENANTS)
+
+    def test_get_accounts_error_not_cached(self):
+        cache = {}
+        with fixtures.MockPatchObject(
+                self.factory, '_get_account_info',
+                side_effect=[ValueError, [self.ACCOUNTS[0]]]):
+            self.assertRaises(ValueError, self.engine.run,
+                              self.pollster._get_accounts(
+                                  self.manager, cache, ASSIGNED_TENANTS))
+            self.assertNotIn(self.pollster.CACHE_KEY_METHOD, cache)
+            data = self.engine.run(self.pollster._get_accounts(
+                self.manager, cache, ASSIGNED_TENANTS))
+        self.assertEqual([self.ACCOUNTS[0]], data)
 
+    def test_accounts_requested_concurrently(self):
+        # The request of each tenant waits for the other one
+        barrier = threading.Barrier(len(ASSIGNED_TENANTS), timeout=10)
         api_method = '%s_account' % self.pollster.METHOD
-        with fixtures.MockPatchObject(swift_client,
-                                      api_method,
-                                      new=mock_method):
-            with fixtures.MockPatchObject(self.factory, '_neaten_url'):
-                cache = {self.pollster.CACHE_KEY_METHOD: [self.ACCOUNTS[0]]}
-                data = list(self.pollster._iter_accounts(mock.Mock(), cache,
-                                                         ASSIGNED_TENANTS))
-        self.assertEqual([self.ACCOUNTS[0]], data)
+        with fixtures.MockPatchObject(
+                swift_client, api_method,
+                side_effect=lambda *args, **kwargs: barrier.wait()):
+            with fixtures.MockPatchObject(swift_client, 'http_connection'):
+                with fixtures.MockPatchObject(
+                        self.manager._service_catalog, 'url_for',
+                        return_value='end://point/'):
+                    data = self.engine.run(self.pollster._get_accounts(
+                        self.manager, {}, ASSIGNED_TENANTS))
+        self.assertEqual([t.id for t in ASSIGNED_TENANTS],
+                         [tenant for tenant, account in data])
 
     def test_neaten_url(self):
         reseller_prefix = self.CONF.reseller_prefix
@@ -186,10 +217,9 @@ class TestSwiftPollster(testscenarios.testcase.WithScenarios,
             self.assertEqual(standard_url, url)
 
     def test_metering(self):
-        with fixtures.MockPatchObject(self.factory, '_iter_accounts',
-                                      side_effect=self.fake_iter_accounts):
-            samples = list(self.pollster.get_samples(self.manager, {},
-                                                     ASSIGNED_TENANTS))
+        with fixtures.MockPatchObject(self.factory, '_get_accounts',
+                                      side_effect=self.fake_get_accounts):
+            samples = self._get_samples()
 
         self.assertEqual(2, len(samples), self.pollster.__class__)
         for resource_id, resource in self.resources.items():
@@ -204,10 +234,9 @@ class TestSwiftPollster(testscenarios.testcase.WithScenarios,
                         self.assertIsNone(sample.resource_metadata[field])
 
     def test_get_meter_names(self):
-        with fixtures.MockPatchObject(self.factory, '_iter_accounts',
-                                      side_effect=self.fake_iter_accounts):
-            samples = list(self.pollster.get_samples(self.manager, {},
-                                                     ASSIGNED_TENANTS))
+        with fixtures.MockPatchObject(self.factory, '_get_accounts',
+                                      side_effect=self.fake_get_accounts):
+            samples = self._get_samples()
 
         self.assertEqual({samples[0].name},
                          {s.name for s in samples})
@@ -226,8 +255,7 @@ class TestSwiftPollster(testscenarios.testcase.WithScenarios,
                 with fixtures.MockPatchObject(
                         self.manager._service_catalog, 'url_for',
                         return_value=endpoint):
-                    list(self.pollster.get_samples(self.manager, {},
-                                                   ASSIGNED_TENANTS))
+                    self._get_samples()
         expected = [mock.call(self.pollster._neaten_url(
                               endpoint, t.id, self.CONF.reseller_prefix),
                               cacert=None)
@@ -251,17 +279,14 @@ class TestSwiftPollster(testscenarios.testcase.WithScenarios,
                 with fixtures.MockPatchObject(
                         self.manager._service_catalog, 'url_for',
                         new=mock_url_for):
-                    list(self.pollster.get_samples(self.manager, {},
-                                                   ASSIGNED_TENANTS))
-                    list(self.pollster.get_samples(self.manager, {},
-                                                   ASSIGNED_TENANTS))
+                    self._get_samples()
+                    self._get_samples()
         self.assertEqual(1, mock_url_for.call_count)
 
     def test_endpoint_notfound(self):
         with fixtures.MockPatchObject(
                 self.manager._service_catalog, 'url_for',
                 side_effect=self.fake_ks_service_catalog_url_for):
-            samples = list(self.pollster.get_samples(self.manager, {},
-                                                     ASSIGNED_TENANTS))
+            samples = self._get_samples()
 
         self.assertEqual(0, len(samples))
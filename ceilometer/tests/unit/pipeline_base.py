@@ -14,6 +14,8 @@
 # under the License.
 
 import abc
+import copy
+import threading
 import traceback
 from unittest import mock
 
@@ -440,6 +442,205 @@ class BasePipelineTestCase(base.BaseTestCase, metaclass=abc.ABCMeta):
         self.assertEqual('a', getattr(publisher.samples[0], 'name'))
         self.assertEqual('b', getattr(publisher.samples[1], 'name'))
 
+    def test_routing_table(self):
+        self._augment_pipeline_cfg()
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        first, second = pipeline_manager.pipelines
+        with mock.patch.object(first.source, 'support_meter',
+                               wraps=first.source.support_meter) as support:
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+        support.assert_called_once_with('a')
+        self.assertEqual((first,), pipeline_manager.router.route(
+            self.test_counter))
+        self.assertEqual(2, len(first.publishers[0].samples))
+        self.assertEqual(0, len(second.publishers[0].samples))
+
+    def test_routing_table_bounded(self):
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        router = pipeline_manager.router
+        router._routes.size = 1
+        router.route(self.test_counter)
+        other = copy.copy(self.test_counter)
+        other.name = 'b'
+        router.route(other)
+        self.assertEqual(1, len(router._routes.results))
+
+    @mock.patch('ceilometer.pipeline.sample.LOG')
+    def test_volume_validated_once(self, LOG):
+        self._augment_pipeline_cfg()
+        self._set_pipeline_cfg('meters', ['*'])
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        test_s = copy.copy(self.test_counter)
+        test_s.name = 'b'
+        test_s.volume = None
+        with pipeline_manager.publisher() as p:
+            p([test_s, self.test_counter])
+        self.assertEqual(1, LOG.warning.call_count)
+        first, second = pipeline_manager.pipelines
+        self.assertEqual(['a'], [s.name for s in
+                                 first.publishers[0].samples])
+        self.assertEqual([], second.publishers[0].samples)
+
+    def test_publisher_queue(self):
+        self.CONF.set_override('publisher_queue_size', 10,
+                               group='notification')
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        sink = pipeline_manager.pipelines[0].sink
+        self.assertIsInstance(sink.publisher_queues[0],
+                              pipe_base.PublisherQueue)
+        threads = []
+        publisher = sink.publishers[0]
+        publish_samples = publisher.publish_samples
+
+        def record_thread(samples):
+            threads.append(threading.current_thread())
+            publish_samples(samples)
+
+        with mock.patch.object(publisher, 'publish_samples',
+                               side_effect=record_thread):
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+            # NOTE: stopping publishes the queued data
+            pipeline_manager.stop()
+            self.assertEqual(1, len(publisher.samples))
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertFalse(any(w.is_alive()
+                             for w in sink.publisher_queues[0]._workers))
+
+    def test_publisher_queue_multiple_publishers(self):
+        self.CONF.set_override('publisher_queue_size', 10,
+                               group='notification')
+        self._reraise_exception = False
+        self._set_pipeline_cfg('publishers', ['except://', 'new://'])
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        with pipeline_manager.publisher() as p:
+            p([self.test_counter])
+        pipeline_manager.stop()
+        publisher = pipeline_manager.pipelines[0].publishers[1]
+        self.assertEqual(1, len(publisher.samples))
+
+    def test_publisher_fanout(self):
+        self.CONF.set_override('publisher_fanout_workers', 2,
+                               group='notification')
+        self._set_pipeline_cfg('publishers', ['test://', 'new://'])
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        publishers = pipeline_manager.pipelines[0].publishers
+        # NOTE: the barrier is only crossed if both publishers are called
+        # at the same time.
+        barrier = threading.Barrier(2, timeout=10)
+        with mock.patch.object(publishers[0], 'publish_samples',
+                               side_effect=lambda s: barrier.wait()), \
+                mock.patch.object(publishers[1], 'publish_samples',
+                                  side_effect=lambda s: barrier.wait()):
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+            publishers[0].publish_samples.assert_called_once_with(
+                [self.test_counter])
+            publishers[1].publish_samples.assert_called_once_with(
+                [self.test_counter])
+        self.assertFalse(barrier.broken)
+
+    @mock.patch('ceilometer.pipeline.base.LOG')
+    def test_publisher_fanout_timeout(self, LOG):
+        self.CONF.set_override('publisher_fanout_workers', 2,
+                               group='notification')
+        self.CONF.set_override('publisher_fanout_timeout', 1,
+                               group='notification')
+        self._set_pipeline_cfg('publishers', ['test://', 'new://'])
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        publishers = pipeline_manager.pipelines[0].publishers
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch.object(publishers[0], 'publish_samples',
+                               side_effect=lambda s: release.wait(10)):
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+            self.assertEqual(1, LOG.error.call_count)
+            self.assertEqual(1, len(publishers[1].samples))
+            # the hung publisher is skipped until it returns
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+            self.assertEqual(2, LOG.error.call_count)
+            self.assertEqual(1, publishers[0].publish_samples.call_count)
+            self.assertEqual(2, len(publishers[1].samples))
+        release.set()
+        pipeline_manager.stop()
+        self.assertRaises(RuntimeError, pipeline_manager.executor.submit,
+                          len, [])
+
+    def _blocked_queue(self, policy):
+        queue = pipe_base.PublisherQueue(mock.sentinel.publisher, 1,
+                                         policy=policy)
+        release = threading.Event()
+        started = threading.Event()
+        published = []
+
+        def publish(data):
+            started.set()
+            release.wait(10)
+            published.append(data)
+
+        queue.submit(publish, 'first')
+        self.assertTrue(started.wait(10))
+        return queue, release, publish, published
+
+    @mock.patch('ceilometer.pipeline.base.LOG')
+    def test_publisher_queue_drop_oldest(self, LOG):
+        queue, release, publish, published = self._blocked_queue(
+            'drop_oldest')
+        queue.submit(publish, 'second')
+        queue.submit(publish, 'third')
+        self.assertEqual(1, queue.dropped)
+        self.assertEqual(1, LOG.error.call_count)
+        release.set()
+        queue.stop()
+        self.assertEqual(['first', 'third'], published)
+
+    def test_publisher_queue_block(self):
+        queue, release, publish, published = self._blocked_queue('block')
+        queue.submit(publish, 'second')
+        submitter = threading.Thread(
+            target=lambda: queue.submit(publish, 'third'))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+        release.set()
+        submitter.join(10)
+        self.assertFalse(submitter.is_alive())
+        queue.stop()
+        self.assertEqual(['first', 'second', 'third'], published)
+        self.assertEqual(0, queue.dropped)
+
+    def test_publisher_queue_acknowledged_once_queued(self):
+        queue, release, publish, published = self._blocked_queue('block')
+        # NOTE: the caller does not wait for the publisher
+        queue.submit(publish, 'second')
+        self.assertEqual([], published)
+        release.set()
+        queue.stop()
+        self.assertEqual(['first', 'second'], published)
+
+    @mock.patch('ceilometer.pipeline.base.LOG')
+    def test_publisher_queue_stop_timeout(self, LOG):
+        queue, release, publish, published = self._blocked_queue('block')
+        self.addCleanup(release.set)
+        queue.submit(publish, 'second')
+        queue.stop(timeout=0.1)
+        self.assertEqual(1, LOG.warning.call_count)
+        self.assertEqual(['publisher-queue-0'],
+                         [w.name for w in queue._workers if w.is_alive()])
+        self.assertEqual([], published)
+
     def test_unique_pipeline_names(self):
         self._dup_pipeline_name_cfg()
         self._exception_create_pipelinemanager()
@@ -0,0 +1,144 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer.polling.async_engine"""
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from ceilometer.polling import async_engine
+from ceilometer.polling import manager
+from ceilometer import sample
+from ceilometer import service
+from ceilometer.tests import base
+
+
+class TestAsyncEngine(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.engine = async_engine.AsyncEngine(endpoint_concurrency=2,
+                                               threads=8)
+        self.addCleanup(self.engine.stop)
+
+    def test_is_async(self):
+        async def coroutine():
+            pass
+
+        async def generator():
+            yield
+
+        def blocking():
+            pass
+
+        self.assertTrue(async_engine.is_async(coroutine))
+        self.assertTrue(async_engine.is_async(generator))
+        self.assertFalse(async_engine.is_async(blocking))
+
+    def test_map_endpoint_concurrency(self):
+        lock = threading.Lock()
+        running = []
+        peaks = []
+
+        def fetch(item):
+            with lock:
+                running.append(item)
+                peaks.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(item)
+            return item * 2
+
+        async def poll():
+            return await asyncio.gather(
+                self.engine.map('a', fetch, range(6)),
+                self.engine.map('b', fetch, range(6)))
+
+        results = self.engine.run(poll())
+        self.assertEqual([[0, 2, 4, 6, 8, 10]] * 2, results)
+        # NOTE: 2 requests per endpoint, on 2 endpoints
+        self.assertLessEqual(max(peaks), 4)
+        self.assertGreater(max(peaks), 1)
+
+    def test_map_exceptions(self):
+        def fetch(item):
+            if item == 1:
+                raise ValueError()
+            return item
+
+        results = self.engine.run(
+            self.engine.map('a', fetch, range(3), return_exceptions=True))
+        self.assertEqual(0, results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(2, results[2])
+        self.assertRaises(ValueError, self.engine.run,
+                          self.engine.map('a', fetch, range(3)))
+
+    def test_call_coroutine(self):
+        async def fetch(item):
+            await asyncio.sleep(0)
+            return item + 1
+
+        self.assertEqual(2, self.engine.run(self.engine.call('a', fetch, 1)))
+
+    def test_get_samples(self):
+        class Pollster:
+            async def get_samples(self, manager, cache, resources):
+                for r in resources:
+                    yield r
+
+        class CoroutinePollster:
+            async def get_samples(self, manager, cache, resources):
+                return iter(resources)
+
+        for pollster in (Pollster(), CoroutinePollster()):
+            self.assertEqual(['a', 'b'], self.engine.get_samples(
+                pollster, manager=None, cache={}, resources=['a', 'b']))
+
+
+class TestAsyncPollster(base.BaseTestCase):
+
+    class Pollster:
+        default_discovery = None
+
+        async def get_samples(self, manager, cache, resources):
+            volumes = await manager.async_engine.map(
+                'endpoint', len, resources)
+            for resource, volume in zip(resources, volumes):
+                yield sample.Sample(
+                    name='test', type=sample.TYPE_GAUGE, unit='B',
+                    volume=volume, user_id='test', project_id='test',
+                    resource_id=resource, resource_metadata={})
+
+    def setUp(self):
+        super().setUp()
+        self.CONF = service.prepare_service([], [])
+        self.CONF.set_override('enable_notifications', False,
+                               group='polling')
+        self.mgr = manager.AgentManager(0, self.CONF)
+        self.addCleanup(self.mgr.terminate)
+
+    def test_polling_task(self):
+        source = mock.Mock(resources=['a', 'bb'], discovery=[],
+                           group_for_coordination=None)
+        source.name = 'test_source'
+        pollster = mock.Mock(obj=self.Pollster())
+        pollster.name = 'test'
+        task = manager.PollingTask(self.mgr)
+        task.add(pollster, source)
+        with mock.patch.object(task, '_send_notification') as send:
+            task.poll_and_notify()
+        samples = [s for call in send.call_args_list for s in call[0][0]]
+        self.assertEqual({'a': 1, 'bb': 2},
+                         {s['resource_id']: s['counter_volume']
+                          for s in samples})
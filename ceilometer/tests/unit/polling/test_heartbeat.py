@@ -15,6 +15,7 @@
 
 """Tests for ceilometer polling heartbeat process"""
 
+import json
 import multiprocessing
 import shutil
 import tempfile
@@ -105,3 +106,86 @@ class TestHeartBeatManagert(base.BaseTestCase):
                      mock.call("Reported heartbeat status:\n%s",
                                f"test1 {timestamp}\ntest2 {timestamp}")]
             LOG.debug.assert_has_calls(calls)
+
+    @mock.patch('ceilometer.polling.manager.LOG')
+    def test_hb_send_cycles(self, LOG):
+        with mock.patch('socket.socket') as FakeSocket:
+            sub_skt = mock.Mock()
+            skt = FakeSocket.return_value
+            skt.accept.return_value = (sub_skt, "")
+
+            self.conf.set_override('heartbeat_socket_dir', self.tmpdir,
+                                   group='polling')
+            hb = manager.AgentHeartBeatManager(0, self.conf,
+                                               namespaces='central',
+                                               queue=self.queue)
+            timestamp = timeutils.utcnow().isoformat()
+            self.queue.put_nowait({'timestamp': timestamp,
+                                   'pollster': 'test1'})
+            hb._update_status()
+            self.queue.put_nowait({'task': 'polling-task-60',
+                                   'stats': {'duration': 1.5, 'cycles': 3,
+                                             'overruns': 1, 'skipped': 1}})
+            hb._update_status()
+
+            # the text format is left as is
+            hb._send_heartbeat()
+            sub_skt.sendall.assert_called_once_with(
+                f"test1 {timestamp}".encode())
+
+            self.conf.set_override('heartbeat_report_format', 'json',
+                                   group='polling')
+            sub_skt.reset_mock()
+            hb._send_heartbeat()
+            report = json.loads(sub_skt.sendall.call_args[0][0])
+            self.assertEqual({'polling-task-60': {
+                'duration': 1.5, 'cycles': 3, 'overruns': 1, 'skipped': 1}},
+                report['tasks'])
+
+    def test_hb_send_json(self):
+        with mock.patch('socket.socket') as FakeSocket:
+            sub_skt = mock.Mock()
+            skt = FakeSocket.return_value
+            skt.accept.return_value = (sub_skt, "")
+
+            self.conf.set_override('heartbeat_socket_dir', self.tmpdir,
+                                   group='polling')
+            self.conf.set_override('heartbeat_report_format', 'json',
+                                   group='polling')
+            self.conf.set_override('heartbeat_stats_window', 2,
+                                   group='polling')
+            hb = manager.AgentHeartBeatManager(0, self.conf,
+                                               namespaces='central',
+                                               queue=self.queue)
+            timestamp = timeutils.utcnow().isoformat()
+            self.queue.put_nowait({'timestamp': timestamp,
+                                   'pollster': 'test1'})
+            hb._update_status()
+            for i in range(3):
+                self.queue.put_nowait({
+                    'execution': 'test1',
+                    'stats': {'discovery_time': i, 'inspection_time': i * 2,
+                              'send_time': 0, 'resources': 1, 'samples': i,
+                              'batches': 1, 'errors': i % 2}})
+                hb._update_status()
+
+            hb._send_heartbeat()
+            report = json.loads(sub_skt.sendall.call_args[0][0])
+            self.assertEqual({'tasks': {}, 'pollsters': {'test1': {
+                'timestamp': timestamp,
+                'runs': 2,
+                'errors': 1,
+                'discovery_time': {'p50': 1, 'p90': 2, 'p99': 2, 'max': 2},
+                'inspection_time': {'p50': 2, 'p90': 4, 'p99': 4, 'max': 4},
+                'send_time': {'p50': 0, 'p90': 0, 'p99': 0, 'max': 0},
+                'resources': {'p50': 1, 'p90': 1, 'p99': 1, 'max': 1},
+                'samples': {'p50': 1, 'p90': 2, 'p99': 2, 'max': 2},
+                'batches': {'p50': 1, 'p90': 1, 'p99': 1, 'max': 1},
+            }}}, report)
+
+    def test_percentiles(self):
+        self.assertEqual({'p50': 50, 'p90': 90, 'p99': 99, 'max': 100},
+                         manager.percentiles(range(100, 0, -1)))
+        self.assertEqual({'p50': None, 'p90': None, 'p99': None,
+                          'max': None},
+                         manager.percentiles([]))
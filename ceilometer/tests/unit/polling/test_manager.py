@@ -16,11 +16,14 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """Tests for ceilometer agent manager"""
+from concurrent import futures
 import copy
 import datetime
 import multiprocessing
 import shutil
 import tempfile
+import threading
+import time
 from unittest import mock
 
 import fixtures
@@ -396,6 +399,233 @@ class TestPollingAgent(BaseAgent):
         self.assertIn(60, polling_tasks.keys())
         self.assertIn(10, polling_tasks.keys())
 
+    def test_setup_polling_tasks_workers(self):
+        self.CONF.set_override('workers', 2, group='polling')
+        self.polling_cfg['sources'][0]['meters'] = ['*']
+        self.polling_cfg['sources'].append({
+            'name': 'test_polling_1',
+            'interval': 10,
+            'meters': ['test', 'testanother'],
+            'resources': ['test://'],
+        })
+        self.setup_polling()
+        matches = []
+        for worker_id in range(2):
+            mgr = manager.AgentManager(worker_id, self.CONF)
+            mgr.extensions = self.create_extension_list()
+            mgr.polling_manager = self.mgr.polling_manager
+            shard = set()
+            for task in mgr.setup_polling_tasks().values():
+                for source, pollsters in task.pollster_matches.items():
+                    shard.update((source, p.name) for p in pollsters)
+            matches.append(shard)
+            self.assertEqual(f'central-compute-worker{worker_id}',
+                             mgr.group_prefix)
+        self.assertEqual(set(), matches[0] & matches[1])
+        self.assertEqual(7, len(matches[0] | matches[1]))
+        # a pollster of several sources is polled by a single worker
+        names = [{name for source, name in shard} for shard in matches]
+        self.assertEqual(set(), names[0] & names[1])
+        self.assertLessEqual(abs(len(names[0]) - len(names[1])), 1)
+        for name in ('test', 'testanother'):
+            shard = matches[0] if name in names[0] else matches[1]
+            self.assertIn(('test_polling', name), shard)
+            self.assertIn(('test_polling_1', name), shard)
+
+    def test_shared_discovery_cache(self):
+        self.CONF.set_override('workers', 2, group='polling')
+        self.polling_cfg['sources'][0]['discovery'] = ['testdiscovery']
+        self.Discovery.resources = ['discovered_1', 'discovered_2']
+        shared = {}
+        mgrs = []
+        for worker_id in range(2):
+            mgr = manager.AgentManager(worker_id, self.CONF,
+                                       shared_discovery_cache=shared)
+            mgr.discoveries = self.create_discoveries()
+            mgr._shared_discovery_ttl = 60
+            mgrs.append(mgr)
+        with mock.patch('ceilometer.polling.manager.time') as time:
+            time.monotonic.return_value = 0
+            for mgr in mgrs:
+                self.assertEqual(['discovered_1', 'discovered_2'],
+                                 mgr.discover(['testdiscovery']))
+            self.assertEqual([None], self.Discovery.params)
+            time.monotonic.return_value = 60
+            mgrs[1].discover(['testdiscovery'])
+        self.assertEqual([None, None], self.Discovery.params)
+
+    def test_stagger_offset(self):
+        offsets = [manager.stagger_offset('host', 'meter%d' % i, 300, 0.8)
+                   for i in range(100)]
+        self.assertEqual(offsets, [
+            manager.stagger_offset('host', 'meter%d' % i, 300, 0.8)
+            for i in range(100)])
+        self.assertTrue(all(0 <= o < 240 for o in offsets))
+        self.assertGreater(max(offsets) - min(offsets), 120)
+        self.assertNotEqual(manager.stagger_offset('host', 'meter', 300, 1),
+                            manager.stagger_offset('other', 'meter', 300, 1))
+
+    def test_staggered_polling(self):
+        self.CONF.set_override('scheduling_mode', 'staggered',
+                               group='polling')
+        self.polling_cfg['sources'][0]['meters'] = ['test', 'testanother']
+        self.setup_polling()
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        offsets = sorted(
+            manager.stagger_offset(self.CONF.host, name, 60, 0.8)
+            for name in ('test', 'testanother'))
+        with mock.patch.object(self.mgr, 'wait_stopping',
+                               return_value=False) as wait:
+            self.mgr.interval_task(polling_task)
+        timeouts = [call[0][0] for call in wait.call_args_list]
+        self.assertEqual(2, len(timeouts))
+        for offset, timeout in zip(offsets, timeouts):
+            self.assertAlmostEqual(offset, timeout, delta=5)
+        self.assertEqual(1, len(self.Pollster.samples))
+        self.assertEqual(1, len(self.PollsterAnother.samples))
+        self.assertIsNotNone(polling_task.spread)
+
+    def test_staggered_polling_spread(self):
+        self.CONF.set_override('scheduling_mode', 'staggered',
+                               group='polling')
+        self.CONF.set_override('threads_to_process_pollsters', 1,
+                               group='polling')
+        self.polling_cfg['sources'][0]['meters'] = ['test', 'testanother']
+        self.setup_polling()
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        # the second pollster waits for the thread of the first one
+        with mock.patch.object(self.mgr, 'wait_stopping',
+                               return_value=False), \
+                mock.patch.object(TestPollster, 'get_samples',
+                                  side_effect=lambda **kw: time.sleep(0.2)):
+            self.mgr.interval_task(polling_task)
+        self.assertGreaterEqual(polling_task.spread, 0.2)
+
+    def test_staggered_polling_stopping(self):
+        self.CONF.set_override('scheduling_mode', 'staggered',
+                               group='polling')
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        self.mgr.stop_pollsters_tasks()
+        self.mgr.interval_task(polling_task)
+        self.assertEqual(0, len(self.Pollster.samples))
+        self.assertIsNone(polling_task.spread)
+
+    def _overrun(self, policy):
+        self.CONF.set_override('overrun_policy', policy, group='polling')
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        started = threading.Semaphore(0)
+        release = threading.Event()
+
+        def run_cycle(task):
+            started.release()
+            release.wait()
+
+        with mock.patch.object(self.mgr, 'report_cycle') as report_cycle:
+            polling_task.trigger(run_cycle)
+            started.acquire()
+            polling_task.trigger(run_cycle)
+            polling_task.trigger(run_cycle)
+            release.set()
+            polling_task.join()
+        self.assertEqual(polling_task.cycles, report_cycle.call_count)
+        self.assertIsNotNone(polling_task.duration)
+        self.assertEqual(2, polling_task.overruns)
+        return polling_task
+
+    def test_overrun_policy_coalesce(self):
+        polling_task = self._overrun('coalesce')
+        self.assertEqual(2, polling_task.cycles)
+        self.assertEqual(1, polling_task.skipped)
+
+    def test_overrun_policy_skip(self):
+        polling_task = self._overrun('skip')
+        self.assertEqual(1, polling_task.cycles)
+        self.assertEqual(2, polling_task.skipped)
+
+    def test_overrun_policy_run(self):
+        polling_task = self._overrun('run')
+        self.assertEqual(3, polling_task.cycles)
+        self.assertEqual(0, polling_task.skipped)
+
+    def test_report_cycle(self):
+        self.mgr._queue = mock.Mock()
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        polling_task.trigger(self.mgr.interval_task)
+        polling_task.join()
+        self.assertEqual(1, len(self.Pollster.samples))
+        self.mgr._queue.put_nowait.assert_called_with(
+            {'task': 'polling-task-60',
+             'stats': {'duration': polling_task.duration, 'cycles': 1,
+                       'overruns': 0, 'skipped': 0,
+                       'discovery_hits': self.mgr.discovery_cache.hits,
+                       'discovery_misses': self.mgr.discovery_cache.misses,
+                       'sender_batches': 0, 'sender_dropped': 0}})
+
+    def test_flush(self):
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        with mock.patch.object(TestPollster, 'flush') as flush:
+            polling_task.trigger(self.mgr.interval_task)
+            polling_task.join()
+            self.assertEqual(1, len(self.Pollster.samples))
+            self.assertEqual(1, flush.call_count)
+            self.mgr.terminate()
+            self.assertEqual(1 + len(self.mgr.extensions), flush.call_count)
+
+    def test_discovery_ttl(self):
+        self.polling_cfg['discovery_ttl'] = {'testdiscovery': 60}
+        self.polling_cfg['sources'][0]['discovery'] = ['testdiscovery']
+        self.setup_polling()
+        self.mgr.discoveries = self.create_discoveries()
+        self.Discovery.resources = ['discovered_1', 'discovered_2']
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        with mock.patch('ceilometer.polling.manager.time') as time:
+            time.monotonic.return_value = 0
+            self.mgr.interval_task(polling_task)
+            self.mgr.interval_task(polling_task)
+            self.assertEqual([None], self.Discovery.params)
+            time.monotonic.return_value = 60
+            self.mgr.interval_task(polling_task)
+        self.assertEqual([None, None], self.Discovery.params)
+        self.assertEqual(1, self.mgr.discovery_cache.hits)
+        self.assertEqual(2, self.mgr.discovery_cache.misses)
+
+        self.mgr._queue = mock.Mock()
+        self.mgr.report_cycle(polling_task)
+        stats = self.mgr._queue.put_nowait.call_args[0][0]['stats']
+        self.assertEqual(1, stats['discovery_hits'])
+        self.assertEqual(2, stats['discovery_misses'])
+
+    def test_shared_polling(self):
+        self.CONF.set_override('pollster_threads', 4, group='polling')
+        self.polling_cfg['sources'].append({
+            'name': 'test_polling_1',
+            'interval': 60,
+            'meters': ['testanother'],
+            'resources': ['testanother://']})
+        self.setup_polling()
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        barrier = threading.Barrier(2, timeout=10)
+        run = polling_task._internal_pollster_run
+
+        def internal_pollster_run(*args):
+            # both sources are polled at the same time
+            barrier.wait()
+            run(*args)
+
+        with mock.patch.object(polling_task, '_internal_pollster_run',
+                               side_effect=internal_pollster_run):
+            self.mgr.interval_task(polling_task)
+            executor = self.mgr.pollster_executor
+            barrier.reset()
+            self.mgr.interval_task(polling_task)
+        self.assertIs(executor, self.mgr.pollster_executor)
+        self.assertEqual(2, len(self.Pollster.samples))
+        self.assertEqual(2, len(self.PollsterAnother.samples))
+
+    def test_discovery_ttl_invalid(self):
+        self.polling_cfg['discovery_ttl'] = {'testdiscovery': -1}
+        self.assertRaises(manager.PollingException, self.setup_polling)
+
     def test_setup_polling_tasks_mismatch_counter(self):
         self.polling_cfg['sources'].append({
             'name': 'test_polling_1',
@@ -705,6 +935,36 @@ class TestPollingAgent(BaseAgent):
         # Therefore, there should be only one call here.
         self.assertEqual(1, polling_task.manager.notifier.sample.call_count)
 
+    def test_report_pollster(self):
+        self.setup_polling()
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        with mock.patch.object(self.mgr, 'report_pollster') as report:
+            polling_task.poll_and_notify()
+        report.assert_called_once_with('test', mock.ANY)
+        stats = report.call_args[0][1]
+        self.assertEqual(
+            {'resources': 1, 'samples': 1, 'batches': 1, 'errors': 0},
+            {k: stats[k] for k in ('resources', 'samples', 'batches',
+                                   'errors')})
+        for stat in ('discovery_time', 'inspection_time', 'send_time'):
+            self.assertGreaterEqual(stats[stat], 0)
+
+    def test_polling_and_notify_with_sender(self):
+        self.CONF.set_override('sender_queue_size', 100, group='polling')
+        self.mgr = self.create_manager()
+        self.addCleanup(self.mgr.sample_sender.stop)
+        self.mgr.extensions = self.create_extension_list()
+        self.setup_polling()
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        with mock.patch.object(self.mgr, 'report_pollster') as report:
+            polling_task.poll_and_notify()
+        self.mgr.sample_sender.stop()
+        self.assertEqual(1, self.notifier.sample.call_count)
+        # the messages are counted by the sender
+        self.assertEqual(0, report.call_args[0][1]['batches'])
+        self.assertEqual(1, self.mgr.sample_sender.batches)
+        self.assertEqual(1, len(self.notified_samples))
+
     @mock.patch('ceilometer.polling.manager.LOG')
     def test_skip_polling_and_notify_with_no_resources(self, LOG):
         self.polling_cfg['sources'][0]['resources'] = []
@@ -840,6 +1100,35 @@ class TestPollingAgent(BaseAgent):
                  res_list="[<NovaLikeServer: unknown-name>]",
                  source=source_name))
 
+    @mock.patch('ceilometer.polling.manager.LOG')
+    def test_polling_exception_blacklist_ttl(self, LOG):
+        self.CONF.set_override('blacklist_ttl', 60, group='polling')
+        source_name = 'test_pollingexception'
+        poll_cfg = {
+            'sources': [{
+                'name': source_name,
+                'interval': 10,
+                'meters': ['testpollingexception'],
+                'resources': ['test://'],
+                'sinks': ['test_sink']}],
+            'sinks': [{
+                'name': 'test_sink',
+                'publishers': ["test"]}]
+        }
+        self.setup_polling(poll_cfg)
+        polling_task = list(self.mgr.setup_polling_tasks().values())[0]
+        pollster = list(polling_task.pollster_matches[source_name])[0]
+        with mock.patch('ceilometer.polling.manager.time') as time:
+            time.monotonic.return_value = 0
+            for x in range(0, 4):
+                self.mgr.interval_task(polling_task)
+            self.assertEqual(1, LOG.error.call_count)
+            self.assertEqual(3, len(pollster.obj.resources))
+            time.monotonic.return_value = 61
+            self.mgr.interval_task(polling_task)
+        self.assertEqual(2, LOG.error.call_count)
+        self.assertEqual(4, len(pollster.obj.resources))
+
     def test_batching_polled_samples_disable_batch(self):
         self.CONF.set_override('batch_size', 0, group='polling')
         self._batching_samples(4, 4)
@@ -872,6 +1161,166 @@ class TestPollingAgent(BaseAgent):
         self.assertEqual(call_count, self.notifier.sample.call_count)
 
 
+class TestBoundedExecutor(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = futures.ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_limit(self):
+        lock = threading.Lock()
+        running = []
+        peaks = []
+
+        def work(i):
+            with lock:
+                running.append(i)
+                peaks.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(i)
+            return i
+
+        executor = manager.BoundedExecutor(self.pool, 2)
+        fs = [executor.submit(work, i) for i in range(6)]
+        self.assertEqual(list(range(6)), [f.result() for f in fs])
+        self.assertEqual(2, max(peaks))
+
+    def test_error(self):
+        executor = manager.BoundedExecutor(self.pool, 1)
+        failed = executor.submit(mock.Mock(side_effect=ValueError))
+        done = executor.submit(mock.Mock(return_value='done'))
+        self.assertRaises(ValueError, failed.result)
+        self.assertEqual('done', done.result())
+
+    def test_no_limit(self):
+        barrier = threading.Barrier(4, timeout=10)
+        executor = manager.BoundedExecutor(self.pool, 0)
+        fs = [executor.submit(barrier.wait) for i in range(4)]
+        self.assertEqual([0, 1, 2, 3], sorted(f.result() for f in fs))
+
+    def test_cancelled(self):
+        pool = futures.ThreadPoolExecutor(max_workers=1)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        executor = manager.BoundedExecutor(pool, 2)
+        running = executor.submit(release.wait, 10)
+        cancelled = executor.submit(len, [])
+        queued = executor.submit(len, [])
+        pool.shutdown(wait=False, cancel_futures=True)
+        release.set()
+        self.assertTrue(running.result())
+        self.assertTrue(cancelled.cancelled())
+        self.assertTrue(queued.cancelled())
+
+
+class TestResourceIndex(base.BaseTestCase):
+
+    def test_resource_key(self):
+        self.assertEqual('a', plugin_base.resource_key('a'))
+        self.assertEqual(plugin_base.resource_key({'a': [1, {'b': 2}]}),
+                         plugin_base.resource_key({'a': [1, {'b': 2}]}))
+        self.assertNotEqual(plugin_base.resource_key({'a': 1}),
+                            plugin_base.resource_key({'a': 2}))
+        self.assertNotEqual(plugin_base.resource_key([1]),
+                            plugin_base.resource_key((1,)))
+        self.assertEqual(
+            plugin_base.resource_key(nova_discover.NovaLikeServer(id=1)),
+            plugin_base.resource_key(nova_discover.NovaLikeServer(id=1,
+                                                                  name='a')))
+        self.assertRaises(TypeError, plugin_base.resource_key,
+                          [bytearray()])
+
+    def test_index(self):
+        index = manager.ResourceIndex()
+        index.extend(['a', {'id': 'b'}, nova_discover.NovaLikeServer(id=1)])
+        self.assertEqual(3, len(index))
+        self.assertIn('a', index)
+        self.assertIn({'id': 'b'}, index)
+        self.assertIn(nova_discover.NovaLikeServer(id=1), index)
+        self.assertNotIn({'id': 'a'}, index)
+        self.assertNotIn(nova_discover.NovaLikeServer(id=2), index)
+
+    def test_index_unkeyed(self):
+        index = manager.ResourceIndex()
+        index.add([bytearray(b'a')])
+        self.assertEqual(0, len(index._keys))
+        self.assertIn([bytearray(b'a')], index)
+        self.assertNotIn([bytearray(b'b')], index)
+
+    @mock.patch('ceilometer.polling.manager.time')
+    def test_index_ttl(self, time):
+        index = manager.ResourceIndex(ttl=10)
+        time.monotonic.return_value = 0
+        index.add('a')
+        index.add([bytearray(b'a')])
+        time.monotonic.return_value = 5
+        index.add('b')
+        self.assertIn('a', index)
+        self.assertIn([bytearray(b'a')], index)
+        time.monotonic.return_value = 10
+        self.assertNotIn('a', index)
+        self.assertNotIn([bytearray(b'a')], index)
+        self.assertIn('b', index)
+        self.assertEqual(1, len(index))
+
+
+class TestDiscoveryCache(base.BaseTestCase):
+
+    @mock.patch('ceilometer.polling.manager.time')
+    def test_ttl(self, time):
+        cache = manager.DiscoveryCache()
+        discover = mock.Mock(side_effect=[['a'], ['b'], ['c']])
+        time.monotonic.return_value = 0
+        self.assertEqual(['a'], cache.get('url', 0, discover))
+        self.assertEqual(['b'], cache.get('url', 10, discover))
+        time.monotonic.return_value = 9
+        self.assertEqual(['b'], cache.get('url', 10, discover))
+        time.monotonic.return_value = 10
+        self.assertEqual(['c'], cache.get('url', 10, discover))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(3, cache.misses)
+
+    def test_error(self):
+        cache = manager.DiscoveryCache()
+        discover = mock.Mock(side_effect=[ValueError, ['a']])
+        self.assertRaises(ValueError, cache.get, 'url', 10, discover)
+        self.assertEqual(['a'], cache.get('url', 10, discover))
+        self.assertEqual(['a'], cache.get('url', 10, discover))
+        self.assertEqual(2, discover.call_count)
+
+    def test_single_flight(self):
+        cache = manager.DiscoveryCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def discover():
+            started.set()
+            release.wait(10)
+            return ['a']
+
+        results = []
+        owner = threading.Thread(
+            target=lambda: results.append(cache.get('url', 0, discover)))
+        owner.start()
+        self.assertTrue(started.wait(10))
+        waiter = threading.Thread(
+            target=lambda: results.append(cache.get('url', 0, discover)))
+        waiter.start()
+        # NOTE: wait for the waiter to find the pending discovery
+        for __ in range(1000):
+            if cache.hits:
+                break
+            waiter.join(0.01)
+        release.set()
+        owner.join(10)
+        waiter.join(10)
+        self.assertEqual([['a'], ['a']], results)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.hits)
+
+
 class TestPollingAgentPartitioned(BaseAgent):
 
     def setUp(self):
@@ -0,0 +1,94 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer.polling.sender"""
+import threading
+from unittest import mock
+
+from oslo_serialization import jsonutils
+
+from ceilometer.polling import sender
+from ceilometer.tests import base
+
+
+class TestSampleSender(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+        self.sent = threading.Event()
+
+    def send(self, batch):
+        self.batches.append(batch)
+        self.sent.set()
+
+    def sender(self, queue_size=100, **kwargs):
+        s = sender.SampleSender(self.send, queue_size, **kwargs)
+        self.addCleanup(s.stop)
+        return s
+
+    def test_batch_size(self):
+        s = self.sender(batch_size=2, max_delay=60)
+        s.put([{'id': i} for i in range(5)])
+        s.stop()
+        self.assertEqual([[{'id': 0}, {'id': 1}], [{'id': 2}, {'id': 3}],
+                          [{'id': 4}]], self.batches)
+        self.assertEqual(3, s.batches)
+
+    def test_max_bytes(self):
+        samples = [{'id': i, 'metadata': 'x' * 100} for i in range(5)]
+        size = len(jsonutils.dump_as_bytes(samples[0]))
+        s = self.sender(max_bytes=size * 2 + 1, max_delay=60)
+        s.put(samples)
+        s.stop()
+        self.assertEqual([samples[:2], samples[2:4], samples[4:]],
+                         self.batches)
+
+    def test_large_sample(self):
+        samples = [{'id': 0}, {'id': 1, 'metadata': 'x' * 100}, {'id': 2}]
+        s = self.sender(max_bytes=50, max_delay=60)
+        s.put(samples)
+        s.stop()
+        self.assertEqual([[sample] for sample in samples], self.batches)
+
+    def test_max_delay(self):
+        s = self.sender(max_delay=0.01)
+        s.put([{'id': 0}, {'id': 1}])
+        self.assertTrue(self.sent.wait(10))
+        self.assertEqual([[{'id': 0}, {'id': 1}]], self.batches)
+
+    @mock.patch('ceilometer.polling.sender.LOG')
+    def test_queue_full(self, LOG):
+        release = threading.Event()
+        s = self.sender(queue_size=2, batch_size=1, max_delay=60)
+        s.send = mock.Mock(side_effect=lambda batch: release.wait())
+        s.put([{'id': 0}])
+        while s._queue:
+            release.wait(0.01)
+        s.put([{'id': i} for i in range(1, 5)])
+        s.send = self.send
+        release.set()
+        s.stop()
+        self.assertEqual(2, s.dropped)
+        self.assertEqual([[{'id': 3}], [{'id': 4}]], self.batches)
+        LOG.warning.assert_called_once_with(
+            "Sample sender queue full, dropped %d samples.", 2)
+
+    @mock.patch('ceilometer.polling.sender.LOG')
+    def test_send_error(self, LOG):
+        s = self.sender(batch_size=1, max_delay=60)
+        s.send = mock.Mock(side_effect=[ValueError, None])
+        s.put([{'id': 0}, {'id': 1}])
+        s.stop()
+        s.send.assert_has_calls([mock.call([{'id': 0}]),
+                                 mock.call([{'id': 1}])])
+        LOG.exception.assert_called_once_with("Failed to send %d samples.", 1)
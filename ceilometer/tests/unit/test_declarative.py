@@ -46,3 +46,65 @@ class TestDefinition(base.BaseTestCase):
             mock.call("field4.`split(., 1, 1)`"),
             mock.call("(field5.arg)|(field6)"),
         ])
+
+
+class TestValuesGetter(base.BaseTestCase):
+
+    OBJ = {
+        'payload': {
+            'id': 'abc',
+            'none': None,
+            'nested': {'key': 1, 'dotted.key': 2},
+            'list': [{'name': 'a'}, {'name': 'b'}],
+            'string': 'text',
+        },
+        'ctxt': {'user_id': 'u', 'user': None},
+    }
+
+    def _check(self, fields, simple=True):
+        definition = declarative.Definition("test", fields, mock.MagicMock())
+        if simple:
+            self.assertIsNotNone(definition.values_getter)
+        else:
+            self.assertIsNone(definition.values_getter)
+        expected = [match.value for match in definition.getter(self.OBJ)]
+        non_null = [v for v in expected if v is not None]
+        self.assertEqual(expected, definition.parse(self.OBJ, True))
+        self.assertEqual(non_null[0] if non_null else None,
+                         definition.parse(self.OBJ))
+
+    def test_simple_paths(self):
+        for fields in ['payload.id', '$.payload.id', 'payload.missing',
+                       'payload.none', 'payload.nested.key',
+                       "payload.nested.'dotted.key'",
+                       'payload.list[1].name', 'payload.list[5].name',
+                       'payload.string.key', 'payload.id.missing',
+                       'ctxt.user|ctxt.user_id',
+                       ['payload.none', 'payload.id', 'ctxt.user_id'],
+                       'payload.nested.key|ctxt.user_id|ctxt',
+                       '`this`.payload.id',
+                       'payload.id.`split(b, 0, 1)`',
+                       'payload.id.`split(b, 1, 1)`',
+                       'payload.id.`split(b, 5, 1)`',
+                       'payload.nested.`split(b, 0, 1)`']:
+            self._check(fields)
+
+    def test_complex_paths(self):
+        for fields in ['payload.list[*].name', 'payload.*',
+                       'payload.id,string',
+                       "payload.list[?(@.name='a')].name",
+                       'payload.id.`sub(/b/, c)`',
+                       'payload.list.$.ctxt']:
+            self._check(fields, simple=False)
+
+    def test_plugin_uses_jsonpath(self):
+        plugin = mock.MagicMock()
+        plugin.trait_values.return_value = ['value']
+        plugin_manager = {'test': mock.MagicMock(
+            plugin=mock.MagicMock(return_value=plugin))}
+        definition = declarative.Definition(
+            "test", {'fields': 'payload.nested.key', 'plugin': 'test'},
+            plugin_manager)
+        self.assertEqual('value', definition.parse(self.OBJ))
+        plugin.trait_values.assert_called_once_with(
+            [('payload.nested.key', 1)])
@@ -12,6 +12,7 @@
 # under the License.
 
 import traceback
+from unittest import mock
 import uuid
 
 import fixtures
@@ -209,6 +210,21 @@ class EventPipelineTestCase(base.BaseTestCase):
         self.assertEqual('a', getattr(publisher.events[0], 'event_type'))
         self.assertEqual('b', getattr(publisher.events[1], 'event_type'))
 
+    def test_routing_table(self):
+        self._set_pipeline_cfg('events', ['a'])
+        self._build_and_set_new_pipeline()
+        pipeline_manager = event.EventPipelineManager(self.CONF)
+        pipe = pipeline_manager.pipelines[0]
+        with mock.patch.object(pipe.source, 'support_event',
+                               wraps=pipe.source.support_event) as support:
+            with pipeline_manager.publisher() as p:
+                p([self.test_event, self.test_event2, self.test_event])
+        self.assertEqual([mock.call('a'), mock.call('b')],
+                         support.call_args_list)
+        publisher = pipe.publishers[0]
+        self.assertEqual(1, publisher.calls)
+        self.assertEqual(['a', 'a'], [e.event_type for e in publisher.events])
+
     def test_event_non_match(self):
         event_cfg = ['nomatch']
         self._set_pipeline_cfg('events', event_cfg)
@@ -351,6 +367,25 @@ class EventPipelineTestCase(base.BaseTestCase):
         self.assertEqual(1, len(publisher.events))
         self.assertEqual('a', getattr(publisher.events[0], 'event_type'))
 
+    def test_publisher_queue_error(self):
+        self.CONF.set_override('publisher_queue_size', 10,
+                               group='notification')
+        self._reraise_exception = False
+        self._build_and_set_new_pipeline()
+        pipeline_manager = event.EventPipelineManager(self.CONF)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+
+        # NOTE: the events are handed over once queued, the publisher
+        # error is only logged.
+        with mock.patch.object(publisher, 'publish_events',
+                               side_effect=ValueError) as publish_events, \
+                mock.patch('ceilometer.pipeline.base.LOG') as LOG:
+            with pipeline_manager.publisher() as p:
+                p([self.test_event])
+            pipeline_manager.stop()
+        publish_events.assert_called_once_with([self.test_event])
+        self.assertEqual(1, LOG.exception.call_count)
+
     def test_unique_pipeline_names(self):
         self._dup_pipeline_name_cfg()
         self._exception_create_pipelinemanager()
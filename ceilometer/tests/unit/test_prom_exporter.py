@@ -363,6 +363,27 @@ class TestPromExporter(base.BaseTestCase):
                              'ceilometer_disk_device_read_latency',
                              sample_dict_3))
 
+    def test_collect_cycle_metrics(self):
+        prom_exporter.collect_cycle_metrics(
+            'polling-task-60',
+            {'duration': 1.5, 'cycles': 3, 'overruns': 1, 'skipped': 1,
+             'discovery_hits': 0, 'discovery_misses': 1,
+             'sender_batches': 1, 'sender_dropped': 0})
+        prom_exporter.collect_cycle_metrics(
+            'polling-task-60',
+            {'duration': 0.5, 'cycles': 4, 'overruns': 1, 'skipped': 1,
+             'discovery_hits': 2, 'discovery_misses': 1,
+             'sender_batches': 3, 'sender_dropped': 0})
+        for stat, value in (('duration', 0.5), ('cycles', 4),
+                            ('overruns', 1), ('skipped', 1),
+                            ('discovery_hits', 2), ('discovery_misses', 1),
+                            ('sender_batches', 3), ('sender_dropped', 0)):
+            self.assertEqual(value,
+                             prom_exporter.CEILOMETER_REGISTRY.
+                             get_sample_value(
+                                 'ceilometer_polling_cycle_' + stat,
+                                 {'task': 'polling-task-60'}))
+
     def test_gen_labels(self):
         slabels1 = dict(keys=[], values=[])
         slabels1['keys'] = ['disk', 'publisher', 'type', 'counter',
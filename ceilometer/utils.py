@@ -42,6 +42,32 @@ def spawn_thread(target, *args, **kwargs):
     return t
 
 
+class BoundedMemo:
+    """Memoize the results of a function of one hashable argument.
+
+    The memo is emptied once it holds size results, it is meant for the
+    arguments taking a few distinct values, such as meter names or event
+    types, the bound only protecting the memory of the agent when that is
+    not the case.
+    """
+
+    def __init__(self, function, size=4096):
+        self.function = function
+        self.size = size
+        self.results = {}
+
+    def __call__(self, key):
+        try:
+            return self.results[key]
+        except KeyError:
+            pass
+        result = self.function(key)
+        if len(self.results) >= self.size:
+            self.results.clear()
+        self.results[key] = result
+        return result
+
+
 def isotime(at=None):
     """Current time as ISO string,
 
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark the asynchronous pollsters engine.
+
+Poll the accounts of many tenants from a local stub HTTP server answering
+with a fixed latency, like a central pollster polling swift accounts, with
+a pollster requesting the tenants one after the other and with the same
+pollster run by the asynchronous engine.
+
+Usage:
+
+./tools/benchmark_async_polling.py --tenants 10000 --latency 0.02
+"""
+import argparse
+from http import server
+import json
+import threading
+import time
+from urllib import request
+
+from ceilometer.polling import async_engine
+from ceilometer import sample
+
+
+class StubHandler(server.BaseHTTPRequestHandler):
+    latency = 0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({'tenant': self.path.strip('/'),
+                           'object_count': len(self.path)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class SyncPollster:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    def fetch(self, tenant):
+        with request.urlopen(f'{self.endpoint}/{tenant}') as response:
+            return json.load(response)
+
+    def make_sample(self, account):
+        return sample.Sample(
+            name='storage.objects', type=sample.TYPE_GAUGE,
+            volume=account['object_count'], unit='object', user_id=None,
+            project_id=account['tenant'], resource_id=account['tenant'],
+            resource_metadata=None)
+
+    def get_samples(self, manager, cache, resources):
+        for tenant in resources:
+            yield self.make_sample(self.fetch(tenant))
+
+
+class AsyncPollster(SyncPollster):
+    async def get_samples(self, manager, cache, resources):
+        accounts = await manager.async_engine.map(self.endpoint, self.fetch,
+                                                  resources)
+        for account in accounts:
+            yield self.make_sample(account)
+
+
+class Manager:
+    def __init__(self, engine):
+        self.async_engine = engine
+
+
+def run(name, func, tenants):
+    start = time.perf_counter()
+    samples = func(tenants)
+    elapsed = time.perf_counter() - start
+    assert len(samples) == len(tenants)
+    rate = len(tenants) / elapsed
+    print('%-8s %6d tenants %10.3f s %10.0f tenants/s' % (
+        name, len(tenants), elapsed, rate))
+    return rate
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tenants', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Latency of the stub server, in seconds.')
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='Concurrent requests per endpoint.')
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    StubHandler.latency = args.latency
+    httpd = StubServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    endpoint = 'http://127.0.0.1:%d' % httpd.server_address[1]
+
+    engine = async_engine.AsyncEngine(args.concurrency, args.concurrency)
+    manager = Manager(engine)
+    tenants = ['tenant-%d' % i for i in range(args.tenants)]
+    sync_pollster = SyncPollster(endpoint)
+    async_pollster = AsyncPollster(endpoint)
+
+    # NOTE: polling the tenants one after the other is slow enough, only
+    # time a fraction of them and report the rate.
+    sync_rate = run('sync', lambda t: list(sync_pollster.get_samples(
+        manager, {}, t)), tenants[:max(1, len(tenants) // 20)])
+    async_rate = run('async', lambda t: engine.get_samples(
+        async_pollster, manager, {}, t), tenants)
+    print('speedup  %10.2fx' % (async_rate / sync_rate))
+
+    engine.stop()
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark the conversion of compute.instance.* notifications to events.
+
+Compare the extraction plans of the event definitions with the historical
+conversion, where every trait is extracted on its own with jsonpath, using
+the shipped event_definitions.yaml.
+
+Usage:
+
+./tools/benchmark_event_conversion.py --messages 20000
+"""
+import argparse
+import time
+from unittest import mock
+import uuid
+
+from stevedore import extension
+
+from ceilometer.event import converter
+from ceilometer import service
+
+
+EVENT_TYPES = ['compute.instance.create.end',
+               'compute.instance.update',
+               'compute.instance.exists',
+               'compute.instance.delete.end']
+
+
+def make_notification(event_type):
+    return {
+        'event_type': event_type,
+        'publisher_id': 'compute.compute-host-name',
+        'metadata': {'message_id': str(uuid.uuid4()),
+                     'timestamp': '2012-05-08 20:23:48.028195'},
+        'ctxt': {'request_id': 'req-d68b36e0-9233-467f-9afb-d81435d64d66',
+                 'project_id': '7c150a59fe714e6f9263774af9688f0e',
+                 'user_id': '1e3ce043029547f1a61c1996d1a531a2'},
+        'payload': {
+            'tenant_id': '7c150a59fe714e6f9263774af9688f0e',
+            'user_id': '1e3ce043029547f1a61c1996d1a531a2',
+            'instance_id': '9f9d01b9-4a58-4271-9e27-398b21ab20d1',
+            'display_name': 'testme',
+            'cell_name': 'cell1',
+            'memory_mb': 512,
+            'disk_gb': 1,
+            'root_gb': 1,
+            'ephemeral_gb': 0,
+            'vcpus': 1,
+            'instance_type_id': 2,
+            'instance_flavor_id': '1',
+            'instance_type': 'm1.tiny',
+            'state': 'active',
+            'old_state': 'building',
+            'os_type': 'linux',
+            'architecture': 'x86_64',
+            'image_ref_url': 'http://10.0.2.15:9292/images/UUID',
+            'launched_at': '2012-05-08 20:23:47.985999',
+            'deleted_at': '',
+            'created_at': '2012-05-08 20:23:41',
+            'availability_zone': 'nova',
+            'audit_period_beginning': '2012-05-08 20:00:00',
+            'audit_period_ending': '2012-05-08 21:00:00',
+            'image_meta': {'base_image_ref': 'UUID'},
+        },
+    }
+
+
+class LegacyEventDefinition(converter.EventDefinition):
+    """Event definition extracting each trait with jsonpath."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for trait in self.traits.values():
+            trait.values_getter = None
+        self._plan = converter.TraitExtractionPlan(self.traits.values())
+
+
+def run(name, conv, notifications):
+    start = time.perf_counter()
+    for notification in notifications:
+        conv.to_event('info', notification)
+    elapsed = time.perf_counter() - start
+    rate = len(notifications) / elapsed
+    print('%-8s %10.3f s %12.0f events/s' % (name, elapsed, rate))
+    return rate
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    conf = service.prepare_service([], [])
+    plugin_manager = extension.ExtensionManager(
+        namespace='ceilometer.event.trait_plugin')
+    conv = converter.setup_events(conf, plugin_manager)
+    with mock.patch.object(converter, 'EventDefinition',
+                           LegacyEventDefinition):
+        legacy = converter.setup_events(conf, plugin_manager)
+
+    notifications = [make_notification(EVENT_TYPES[i % len(EVENT_TYPES)])
+                     for i in range(args.messages)]
+    for event_type in EVENT_TYPES:
+        notification = make_notification(event_type)
+        assert (legacy.to_event('info', notification) ==
+                conv.to_event('info', notification)), event_type
+
+    legacy_rate = run('legacy', legacy, notifications)
+    plan_rate = run('plan', conv, notifications)
+    print('speedup  %10.2fx' % (plan_rate / legacy_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark the meter definitions dispatch of the notification agent.
+
+Compare the linear scan of all meter definitions with the event type
+dispatch index, using the shipped meters.yaml extended with synthetic
+definitions.
+
+Usage:
+
+./tools/benchmark_meter_dispatch.py --synthetic 5000 --messages 100000
+"""
+import argparse
+import random
+import time
+from unittest import mock
+
+from ceilometer.meter import notifications
+from ceilometer import service
+
+
+def synthetic_definitions(conf, count):
+    definitions = []
+    for i in range(count):
+        if i % 4:
+            event_type = 'synthetic%d.resource.update' % i
+        else:
+            event_type = 'synthetic%d.resource.*' % i
+        cfg = dict(name='synthetic_%d' % i,
+                   event_type=event_type,
+                   type='gauge',
+                   unit='B',
+                   volume='$.payload.volume',
+                   resource_id='$.payload.resource_id')
+        definitions.append(notifications.MeterDefinition(cfg, conf,
+                                                         mock.Mock()))
+    return definitions
+
+
+def linear_scan(definitions, event_type):
+    return tuple(d for d in definitions if d.match_type(event_type))
+
+
+def run(name, func, event_types):
+    start = time.perf_counter()
+    for event_type in event_types:
+        func(event_type)
+    elapsed = time.perf_counter() - start
+    rate = len(event_types) / elapsed
+    print('%-8s %10.3f s %12.0f msg/s' % (name, elapsed, rate))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=100000)
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    conf = service.prepare_service([], [])
+    handler = notifications.ProcessMeterNotifications(conf, mock.Mock())
+    definitions = (list(handler.definitions) +
+                   synthetic_definitions(conf, args.synthetic))
+    index = notifications.MeterDefinitionIndex(definitions)
+
+    event_types = ['compute.instance.create.end',
+                   'compute.instance.delete.end',
+                   'volume.exists', 'image.upload', 'l3.meter',
+                   'capacity.pool.update', 'unmatched.event',
+                   'synthetic8.resource.delete',
+                   'synthetic9.resource.update']
+    messages = [random.choice(event_types) for _ in range(args.messages)]
+
+    for event_type in event_types:
+        assert (linear_scan(definitions, event_type) ==
+                index.lookup(event_type)), event_type
+
+    print('%d definitions, %d messages' % (len(definitions), len(messages)))
+    # NOTE: the linear scan is slow enough with thousands of definitions,
+    # only time a fraction of the messages and report the rate.
+    run('linear', lambda et: linear_scan(definitions, et),
+        messages[:max(1, len(messages) // 100)])
+    run('index', index.lookup, messages)
+
+
+if __name__ == '__main__':
+    main()